@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: legacy recursive template helpers vs. the single-pass
+extractor in copado_helper.
+
+    python benchmarks/bench_template_extract.py --fields 5000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from madd_xp import copado_helper as helper
+
+# --- Legacy helpers (as they were before the single-pass extractor) ---
+
+def legacy_get_parent_relationships(json_data):
+    parents = []
+
+    def recursive_search(data):
+        if isinstance(data, dict):
+            if data.get('fieldType') == 'reference' and data.get('deploymentTemplateNameMap'):
+                for t_id, t_name in data['deploymentTemplateNameMap'].items():
+                    parents.append({'templateId': t_id, 'templateName': t_name})
+            for value in data.values():
+                recursive_search(value)
+        elif isinstance(data, list):
+            for item in data:
+                recursive_search(item)
+
+    recursive_search(json_data)
+    return parents
+
+def legacy_extract(json_data):
+    return (helper.get_main_object(json_data),
+            helper.get_child_relationships(json_data),
+            legacy_get_parent_relationships(json_data))
+
+# --- Synthetic templates ---
+
+def build_template(fields, reference_every=10):
+    """Builds a template JSON shaped like a Copado export with `fields` fields."""
+    fields_map = {}
+    for i in range(fields):
+        field = {
+            "name": f"Field_{i}__c",
+            "label": f"Field {i}",
+            "fieldType": "string",
+            "isSelected": True,
+            "contentUpdate": "update",
+            "replaceValue": None,
+            "useAsExternalId": False,
+            "picklistValues": [f"Value {j}" for j in range(5)],
+        }
+        if i % reference_every == 0:
+            field["fieldType"] = "reference"
+            field["deploymentTemplateNameMap"] = {f"a0U{i:015d}": f"Parent {i}"}
+        fields_map[field["name"]] = field
+    return {
+        "dataTemplate": {"templateMainObject": "Account", "templateBatchSize": 200},
+        "childrenObjectsReferenceList": [{"templateId": f"a0V{i:015d}"} for i in range(20)],
+        "selectableFieldsMap": fields_map,
+    }
+
+def build_deep_template(depth):
+    node = {"fieldType": "reference", "deploymentTemplateNameMap": {"a0U000000000001AAA": "Deep"}}
+    for _ in range(depth):
+        node = {"next": [node]}
+    return {"dataTemplate": {"templateMainObject": "Account"}, "selectableFieldsMap": node}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template JSON extraction.")
+    parser.add_argument("--fields", type=int, default=5000, help="Fields per synthetic template")
+    parser.add_argument("--repeat", type=int, default=20, help="Extractions per measurement")
+    parser.add_argument("--depth", type=int, default=5000, help="Nesting depth for the deep template")
+    args = parser.parse_args()
+
+    template = build_template(args.fields)
+    if legacy_extract(template) != helper.extract_template_info(template):
+        sys.exit("Extractor results differ from the legacy helpers.")
+
+    legacy = min(timeit.repeat(lambda: legacy_extract(template), number=args.repeat, repeat=3))
+    single = min(timeit.repeat(lambda: helper.extract_template_info(template), number=args.repeat, repeat=3))
+
+    print(f"Template with {args.fields} fields, {args.repeat} extractions (best of 3):")
+    print(f"  legacy recursive : {legacy / args.repeat * 1000:8.2f} ms/template")
+    print(f"  single-pass      : {single / args.repeat * 1000:8.2f} ms/template")
+    print(f"  speedup          : {legacy / single:8.2f}x")
+
+    deep = build_deep_template(args.depth)
+    try:
+        legacy_extract(deep)
+        print(f"Depth {args.depth}: legacy OK")
+    except RecursionError:
+        print(f"Depth {args.depth}: legacy raised RecursionError")
+    print(f"Depth {args.depth}: single-pass found {len(helper.extract_template_info(deep)[2])} parent(s)")
+
+if __name__ == "__main__":
+    main()
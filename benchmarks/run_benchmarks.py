@@ -0,0 +1,145 @@
+"""
+Throughput benchmarks for 'get objects', 'find' and 'analytics files' against
+a local Salesforce stand-in (tests/sf_stub.py) serving a synthetic org
+(benchmarks/synthetic_org.py), at several scales.
+
+    python benchmarks/run_benchmarks.py                       # compare with baseline.json
+    python benchmarks/run_benchmarks.py --scales small medium
+    python benchmarks/run_benchmarks.py --update-baseline     # store this machine's numbers
+
+Exits with status 1 if a command got slower than the baseline by more than
+--tolerance, or makes more API calls than recorded in the baseline.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from madd_xp import analyze_files, copado_helper as helper, find_templates, get_objects_in_template
+from tests.sf_stub import SalesforceStub
+from synthetic_org import OBJECTS, SyntheticOrg
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ALIAS = "benchOrg"
+
+SCALES = {
+    "small": dict(roots=3, depth=3, fanout=3, shared=0.2, fields=50, datasets=200),
+    "medium": dict(roots=10, depth=4, fanout=4, shared=0.3, fields=200, datasets=2000),
+    "large": dict(roots=20, depth=5, fanout=4, shared=0.4, fields=500, datasets=10000),
+}
+
+def _parse(add_args, argv):
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    return parser.parse_args(argv)
+
+def _measure(command, args, items):
+    """Runs command(args) with its output silenced. Returns its throughput record."""
+    session = helper.get_http_session()
+    calls = session.api_calls
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        command(args)
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 3),
+        "items": items,
+        "per_second": round(items / seconds, 1) if seconds else None,
+        "api_calls": session.api_calls - calls
+    }
+
+def run_scale(name, params, work_dir):
+    org = SyntheticOrg(**params)
+    stub = SalesforceStub(org.resolver, bodies=org.bodies, sobjects=org.sobjects).start()
+    try:
+        helper.save_cached_session(ALIAS, "TOKEN", stub.url)
+        out = lambda file_name: os.path.join(work_dir, f"{name}_{file_name}")
+        results = {}
+
+        objects_args = _parse(get_objects_in_template.add_args,
+                              ["-u", ALIAS, "-t"] + org.root_names + ["-o", out("objects.csv"), "--no-cache", "--no-label-cache"])
+        results["get objects"] = _measure(get_objects_in_template.run, objects_args, len(org.templates))
+
+        find_args = _parse(find_templates.add_args, ["-u", ALIAS, "-obj"] + OBJECTS + ["-o", out("found.csv")])
+        results["find"] = _measure(find_templates.run, find_args, len(org.templates))
+
+        files_args = _parse(analyze_files.add_args, ["-u", ALIAS, "-o", out("files.csv")])
+        rows = len(org.commits) + len(org.links) + len(org.versions)
+        results["analytics files"] = _measure(analyze_files.run, files_args, rows)
+        return results
+    finally:
+        stub.stop()
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression messages."""
+    regressions = []
+    for scale, commands in results.items():
+        for command, result in commands.items():
+            base = baseline.get(scale, {}).get(command)
+            if not base:
+                continue
+            if base.get("per_second") and result["per_second"] < base["per_second"] * (1 - tolerance):
+                regressions.append(f"{scale} / {command}: {result['per_second']}/s vs. baseline {base['per_second']}/s")
+            if result["api_calls"] > base.get("api_calls", result["api_calls"]):
+                regressions.append(f"{scale} / {command}: {result['api_calls']} API calls vs. baseline {base['api_calls']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mxp commands against a synthetic local org.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"], help="Scales to run")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed throughput drop vs. the baseline (0.5 = 50%%)")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir, patch.dict(os.environ, {"MXP_HOME": work_dir}):
+        for scale in args.scales:
+            print(f"Running '{scale}' ({SCALES[scale]})...")
+            results[scale] = run_scale(scale, SCALES[scale], work_dir)
+
+    print(f"\n{'Scale':<8} {'Command':<16} {'Items':>8} {'Seconds':>9} {'Items/s':>10} {'API calls':>10}")
+    for scale, commands in results.items():
+        for command, r in commands.items():
+            print(f"{scale:<8} {command:<16} {r['items']:>8} {r['seconds']:>9.2f} {r['per_second']:>10.1f} {r['api_calls']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Synthetic Copado org for the benchmark suite: template hierarchies with a
+given number of roots, depth, fan-out, share of reused sub-hierarchies and
+Template Detail size, plus Data Set commits and files for 'analytics files'.
+SyntheticOrg.resolver answers the SOQL that mxp sends, and bodies/sobjects
+feed the rest of tests/sf_stub.SalesforceStub.
+"""
+import random
+import re
+
+OBJECTS = ["Account", "Contact", "Opportunity", "Case", "Lead", "Product2", "Pricebook2", "Order",
+           "copado__User_Story__c", "copado__Promotion__c", "copado__Data_Set__c", "Custom_Object__c"]
+STAMP = "2024-03-01T10:00:00.000+0000"
+_VALUES = re.compile(r"'((?:[^'\\]|\\.)*)'")
+
+def _template_id(n):
+    return f"a0U{n:012d}AAA"
+
+def _attachment_id(t_id):
+    return "00P" + t_id[3:]
+
+class SyntheticOrg:
+
+    def __init__(self, roots=5, depth=3, fanout=3, shared=0.2, fields=50, datasets=200,
+                 stories_per_dataset=2, files_per_dataset=3, seed=42):
+        rng = random.Random(seed)
+        self.templates = {}
+        self.details = {}
+        self.root_names = []
+
+        def new_template(level):
+            t_id = _template_id(len(self.templates) + 1)
+            name = f"Template {len(self.templates) + 1}"
+            main_object = OBJECTS[len(self.templates) % len(OBJECTS)]
+            self.templates[t_id] = {"Id": t_id, "Name": name, "copado__Main_Object__c": main_object,
+                                    "copado__Active__c": True, "SystemModstamp": STAMP}
+            self.details[t_id] = self._detail(main_object, [], fields, rng)
+            return t_id
+
+        # Level by level; a child slot reuses an existing template of the next
+        # level with probability `shared`, so hierarchies overlap.
+        by_level = {}
+        for _ in range(roots):
+            root_id = new_template(0)
+            self.root_names.append(self.templates[root_id]["Name"])
+            frontier = [root_id]
+            for level in range(1, depth):
+                next_frontier = []
+                for parent_id in frontier:
+                    for _ in range(fanout):
+                        pool = by_level.get(level, [])
+                        if pool and rng.random() < shared:
+                            child_id = rng.choice(pool)
+                        else:
+                            child_id = new_template(level)
+                            pool.append(child_id)
+                            by_level[level] = pool
+                            next_frontier.append(child_id)
+                        self.details[parent_id]["childrenObjectsReferenceList"].append({"templateId": child_id})
+                frontier = next_frontier
+
+        # Data Sets committed to User Stories, with .records.csv/.template files
+        self.commits = []
+        self.links = []
+        self.versions = {}
+        story = 0
+        for d in range(datasets):
+            d_id = f"a0D{d:012d}AAA"
+            for _ in range(stories_per_dataset):
+                story += 1
+                self.commits.append({"copado__User_Story__c": f"a0S{story:012d}AAA", "copado__Data_Set__c": d_id})
+            for f in range(files_per_dataset):
+                doc_id = f"069{d:08d}{f:04d}AAA"
+                self.links.append({"ContentDocumentId": doc_id, "LinkedEntityId": d_id})
+                is_template = f % 3 == 2
+                self.versions[doc_id] = {
+                    "Id": "068" + doc_id[3:], "ContentDocumentId": doc_id,
+                    "Title": f"file {f}" if is_template else f"file {f}.records",
+                    "FileExtension": "template" if is_template else "csv",
+                    "ContentSize": rng.randint(1024, 1024 * 1024),
+                    "PathOnClient": f"file{f}.template" if is_template else f"file{f}.records.csv",
+                    "CreatedDate": f"{2022 + d * 3 // datasets}-{d * 36 // datasets % 12 + 1:02d}-15T09:30:00.000+0000"
+                }
+        self.commits.sort(key=lambda c: (c["copado__Data_Set__c"], c["copado__User_Story__c"]))
+
+        self.bodies = {_attachment_id(t_id): detail for t_id, detail in self.details.items()}
+        self.sobjects = [{"name": o, "label": o.replace("__c", "").replace("_", " ")} for o in OBJECTS]
+
+    @staticmethod
+    def _detail(main_object, children, fields, rng):
+        fields_map = {}
+        for i in range(fields):
+            field = {"name": f"Field_{i}__c", "label": f"Field {i}", "fieldType": "string", "isSelected": True,
+                     "contentUpdate": "update", "replaceValue": None, "useAsExternalId": False}
+            if i % 10 == 0:
+                field["fieldType"] = "reference"
+                field["referenceTo"] = [rng.choice(OBJECTS)]
+            fields_map[field["name"]] = field
+        return {
+            "dataTemplate": {"templateMainObject": main_object, "templateBatchSize": 200},
+            "childrenObjectsReferenceList": list(children),
+            "selectableFieldsMap": fields_map
+        }
+
+    def attachment(self, t_id):
+        return {"Id": _attachment_id(t_id), "ParentId": t_id, "Name": "Template Detail",
+                "Body": f"/services/data/v59.0/sobjects/Attachment/{_attachment_id(t_id)}/Body",
+                "LastModifiedDate": STAMP, "BodyLength": 1000}
+
+    def resolver(self, q):
+        """Answers the SOQL queries sent by 'get objects', 'find' and 'analytics files'."""
+        values = _VALUES.findall(q)
+        if "FROM copado__Data_Template__c" in q:
+            if "Name IN" in q:
+                lowered = {v.lower() for v in values}
+                return [t for t in self.templates.values() if t["Name"].lower() in lowered]
+            if "Id IN" in q:
+                return [self.templates[v] for v in values if v in self.templates]
+            if "copado__Main_Object__c IN" in q:
+                return [t for t in self.templates.values() if t["copado__Main_Object__c"] in values]
+            return list(self.templates.values())
+        if "FROM Attachment" in q:
+            return [self.attachment(v) for v in values if v in self.details]
+        if "FROM EntityDefinition" in q:
+            labels = {s["name"]: s["label"] for s in self.sobjects}
+            return [{"QualifiedApiName": v, "Label": labels[v]} for v in values if v in labels]
+        if "FROM copado__User_Story_Data_Commit__c" in q:
+            if "COUNT_DISTINCT" in q and "GROUP BY" not in q:
+                return [{"stories": len({c["copado__User_Story__c"] for c in self.commits})}]
+            return self.commits
+        if "FROM ContentDocumentLink" in q:
+            wanted = set(values)
+            return [link for link in self.links if link["LinkedEntityId"] in wanted]
+        if "FROM ContentVersion" in q:
+            return [self.versions[v] for v in values if v in self.versions]
+        raise ValueError(f"Unsupported query: {q}")
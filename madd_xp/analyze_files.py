@@ -1,133 +1,270 @@
 import csv
+import json
 import argparse
 from collections import defaultdict
-from simple_salesforce import Salesforce
+from functools import partial
 try:
     from . import copado_helper as helper
+    from . import metrics
+    from . import multi_org
+    from .file_stats import DEFAULT_TOP, FileStats
 except ImportError:
     import copado_helper as helper
+    import metrics
+    import multi_org
+    from file_stats import DEFAULT_TOP, FileStats
+
+COMMITS_QUERY = "SELECT copado__User_Story__c, copado__Data_Set__c FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null"
+
+# Server-side equivalents of classify_file()
+RECORDS_FILTER = "(PathOnClient LIKE '%.records.csv' OR Title LIKE '%.records')"
+TEMPLATE_FILTER = f"(PathOnClient LIKE '%.template' OR FileExtension = 'template') AND (NOT {RECORDS_FILTER})"
+
+# Data Set IDs per aggregate query; keeps the GET query URL well below its length limit
+AGGREGATE_CHUNK_SIZE = 500
+
+# IDs per Bulk API query job; the query is POSTed, so only the 100,000 character SOQL limit applies
+BULK_CHUNK_SIZE = 2000
 
 def add_args(parser):
-    parser.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias")
+    parser.add_argument("-u", "--username", required=False, help="Salesforce CLI Org Alias. Several orgs: a comma-separated list or JSON\narray; their reports are merged into one file with an 'org' column.")
+    multi_org.add_args(parser)
+    parser.add_argument("--no-session-cache", action="store_true", help="Ignore the cached session and fetch fresh credentials from the SF CLI.")
+    parser.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N Salesforce API calls")
     parser.add_argument("-o", "--output", default="copado_file_storage_report.csv", help="Path to output CSV file")
+    parser.add_argument("--aggregate", action="store_true", help="Let Salesforce count and sum files with aggregate SOQL instead of downloading every row")
+    parser.add_argument("--bulk", action="store_true", help="Read Data Commits, ContentDocumentLinks and ContentVersions with Bulk API 2.0 query jobs")
+    parser.add_argument("--distributions", action="store_true", help="Add file size percentiles, the largest Data Sets and User Stories and monthly\ngrowth to the report. Keeps about 25 bytes per file plus every ContentDocument,\nData Set and User Story Id in memory until the end of the run (not with --aggregate).")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, metavar="N", help=f"Number of largest Data Sets and User Stories to list with --distributions (default: {DEFAULT_TOP})")
+    parser.add_argument("--stats-json", default=None, metavar="PATH", help="Also write the --distributions statistics to this JSON file")
 
-def chunk_list(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+def classify_file(file_info):
+    """Returns 'records', 'template' or None for a ContentVersion record."""
+    path = (file_info.get("PathOnClient") or "").lower()
+    title = (file_info.get("Title") or "").lower()
+    ext = (file_info.get("FileExtension") or "").lower()
 
-def run(args):
-    org_alias = args.username
-    output_path = args.output
-    
-    print(f"Analyzing Copado file storage in org: {org_alias}")
+    if path.endswith(".records.csv") or title.endswith(".records"):
+        return "records"
+    if path.endswith(".template") or ext == "template":
+        return "template"
+    return None
 
-    try:
-        access_token, instance_url = helper.get_sf_cli_credentials(org_alias)
-        sf = Salesforce(instance_url=instance_url, session_id=access_token)
-    except Exception as e:
-        print(f"Authentication failed: {e}")
-        return
+def new_totals():
+    """Returns an empty { file type: [count, size] } accumulator."""
+    return {"records": [0, 0], "template": [0, 0]}
 
-    # 1. Get Data Sets linked to User Stories via Data Commits
-    print("Querying User Story Data Commits...")
-    commits_query = "SELECT copado__User_Story__c, copado__Data_Set__c FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null"
-    
+def iter_dataset_story_counts(sf, query_iter=None, stats=None):
+    """
+    Streams Data Commit rows ordered by Data Set and User Story, page by page.
+    query_iter: optional callable(query) yielding rows, e.g. a Bulk API reader.
+    stats: optional FileStats that records every distinct Data Set/User Story pair.
+    Yields: (Data Set Id, number of distinct User Stories committing it)
+    Only the current Data Set is held in memory.
+    """
+    query_iter = query_iter or sf.query_all_iter
+    query = COMMITS_QUERY + " ORDER BY copado__Data_Set__c, copado__User_Story__c"
+    current_dataset = None
+    story_count = 0
+    last_story = None
+    for commit in query_iter(query):
+        dataset_id = commit["copado__Data_Set__c"]
+        story_id = commit["copado__User_Story__c"]
+        if dataset_id != current_dataset:
+            if current_dataset is not None:
+                yield current_dataset, story_count
+            current_dataset, story_count, last_story = dataset_id, 0, None
+        if story_count == 0 or story_id != last_story:
+            story_count += 1
+            last_story = story_id
+            if stats is not None:
+                stats.add_commit(dataset_id, story_id)
+    if current_dataset is not None:
+        yield current_dataset, story_count
+
+def count_stories(sf):
+    """Counts distinct User Stories with Data Set commits, server-side when possible."""
     try:
-        commits_res = sf.query_all(commits_query)
-        commits = commits_res['records']
+        result = sf.query(
+            "SELECT COUNT_DISTINCT(copado__User_Story__c) stories "
+            "FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null"
+        )
+        return result['records'][0]["stories"] or 0
     except Exception as e:
-        print(f"Error querying Data Commits: {e}")
-        return
+        print(f"COUNT_DISTINCT not possible ({e}). Counting User Stories from rows...")
+        return len({c["copado__User_Story__c"] for c in sf.query_all_iter(COMMITS_QUERY)})
 
-    if not commits:
-        print("No User Story Data Commits found.")
-        return
+def load_dataset_story_counts_aggregate(sf):
+    """
+    Computes { 'Data Set Id': number of User Stories committing it } and the
+    number of User Stories with GROUP BY / COUNT_DISTINCT.
+    """
+    print("Aggregating User Story Data Commits...")
+    grouped = sf.query_all(
+        "SELECT copado__Data_Set__c ds, COUNT_DISTINCT(copado__User_Story__c) stories "
+        "FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null GROUP BY copado__Data_Set__c"
+    )
+    dataset_stories = {rec["ds"]: rec["stories"] for rec in grouped['records']}
 
-    story_datasets = defaultdict(set)
-    dataset_ids = set()
+    story_count = sf.query(
+        "SELECT COUNT_DISTINCT(copado__User_Story__c) stories "
+        "FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null"
+    )
+    return dataset_stories, story_count['records'][0]["stories"] or 0
 
-    for commit in commits:
-        story_id = commit["copado__User_Story__c"]
-        dataset_id = commit["copado__Data_Set__c"]
-        story_datasets[story_id].add(dataset_id)
-        dataset_ids.add(dataset_id)
-
-    print(f"Found {len(dataset_ids)} unique Data Sets across {len(story_datasets)} User Stories.")
-
-    # 2. Get ContentDocumentLinks for these Data Sets
-    print("Querying ContentDocumentLinks...")
-    dataset_id_list = list(dataset_ids)
-    doc_links = []
-    
-    for chunk in chunk_list(dataset_id_list, 200):
-        ids_string = "'" + "','".join(chunk) + "'"
-        link_query = f"SELECT ContentDocumentId, LinkedEntityId FROM ContentDocumentLink WHERE LinkedEntityId IN ({ids_string})"
+def iter_dataset_files(sf, dataset_chunk, query_iter=None, doc_chunk_size=200):
+    """
+    Streams the latest ContentVersion of every file linked to a chunk of Data Sets.
+    dataset_chunk: { 'Data Set Id': number of User Stories committing it }
+    Yields: (ContentVersion record, weight, linked Data Set Ids) where weight is
+    how many times the file counts, i.e. once per User Story that commits one of
+    its Data Sets.
+    """
+    query_iter = query_iter or sf.query_all_iter
+    doc_weights = defaultdict(int)
+    doc_datasets = defaultdict(list)
+    link_query = f"SELECT ContentDocumentId, LinkedEntityId FROM ContentDocumentLink WHERE LinkedEntityId IN ({helper.format_in_clause(list(dataset_chunk))})"
+    try:
+        for link in query_iter(link_query):
+            doc_weights[link["ContentDocumentId"]] += dataset_chunk.get(link["LinkedEntityId"], 0)
+            doc_datasets[link["ContentDocumentId"]].append(link["LinkedEntityId"])
+    except helper.ApiBudgetExceeded:
+        raise
+    except Exception as e:
+        print(f"Error querying ContentDocumentLink chunk: {e}")
+
+    for doc_chunk in helper.chunk_list(list(doc_weights), doc_chunk_size):
+        file_query = f"SELECT Id, ContentDocumentId, Title, FileExtension, ContentSize, PathOnClient, CreatedDate FROM ContentVersion WHERE ContentDocumentId IN ({helper.format_in_clause(doc_chunk)}) AND IsLatest = true"
         try:
-            res = sf.query_all(link_query)
-            doc_links.extend(res['records'])
+            for file_info in query_iter(file_query):
+                yield file_info, doc_weights[file_info["ContentDocumentId"]], doc_datasets[file_info["ContentDocumentId"]]
+        except helper.ApiBudgetExceeded:
+            raise
         except Exception as e:
-            print(f"Error querying ContentDocumentLink chunk: {e}")
+            print(f"Error querying ContentVersion chunk: {e}")
+
+def stream_file_totals(sf, dataset_counts, summary, chunk_size=200, query_iter=None):
+    """
+    Consumes (Data Set Id, story count) pairs and updates summary in place as
+    each page of links and files arrives. Memory stays bounded by chunk_size
+    Data Sets and their files, however large the org is; the per-file
+    attributes kept in summary['stats'] take a few bytes per file.
+    """
+    totals = summary["totals"]
+    stats = summary.get("stats")
+    chunk = {}
+
+    def _flush():
+        for file_info, weight, dataset_ids in iter_dataset_files(sf, chunk, query_iter=query_iter, doc_chunk_size=chunk_size):
+            summary["files_seen"] += 1
+            kind = classify_file(file_info)
+            if kind:
+                # Bulk API rows carry numbers as strings
+                size = int(file_info.get("ContentSize") or 0)
+                totals[kind][0] += weight
+                totals[kind][1] += weight * size
+                if stats is not None:
+                    stats.add_file(file_info["ContentDocumentId"], kind, size, file_info.get("CreatedDate"), dataset_ids)
+        chunk.clear()
 
-    dataset_to_docs = defaultdict(list)
-    all_doc_ids = set()
-    for link in doc_links:
-        dataset_to_docs[link["LinkedEntityId"]].append(link["ContentDocumentId"])
-        all_doc_ids.add(link["ContentDocumentId"])
+    for dataset_id, story_count in dataset_counts:
+        summary["datasets"] += 1
+        summary["story_links"] += story_count
+        chunk[dataset_id] = story_count
+        if len(chunk) >= chunk_size:
+            _flush()
+    if chunk:
+        _flush()
 
-    print(f"Found {len(all_doc_ids)} ContentDocuments linked to Data Sets.")
+def _aggregate_files(sf, dataset_filter):
+    """Runs COUNT/SUM(ContentSize) per file type for the Data Sets matched by dataset_filter."""
+    result = {}
+    for kind, kind_filter in (("records", RECORDS_FILTER), ("template", TEMPLATE_FILTER)):
+        query = (
+            "SELECT COUNT(Id) files, SUM(ContentSize) bytes FROM ContentVersion "
+            f"WHERE IsLatest = true AND {kind_filter} AND ContentDocumentId IN "
+            f"(SELECT ContentDocumentId FROM ContentDocumentLink WHERE LinkedEntityId IN ({dataset_filter}))"
+        )
+        record = sf.query(query)['records'][0]
+        result[kind] = (record.get("files") or 0, record.get("bytes") or 0)
+    return result
 
-    # 3. Get ContentVersions (Files) details
-    print("Querying ContentVersions...")
-    doc_id_list = list(all_doc_ids)
-    files = []
+def sum_files_by_aggregate(sf, dataset_stories):
+    """
+    Same totals as stream_file_totals, computed by Salesforce with semi-joins and
+    COUNT/SUM aggregates. Data Sets are grouped by how many User Stories commit
+    them so every group's totals can be weighted with a single multiplier.
+    Assumes each file is linked to one Data Set, as Copado stores them.
+    Raises if SOQL restrictions reject the queries.
+    """
+    totals = new_totals()
+    by_story_count = defaultdict(list)
+    for d_id, story_count in dataset_stories.items():
+        by_story_count[story_count].append(d_id)
 
-    for chunk in chunk_list(doc_id_list, 200):
-        ids_string = "'" + "','".join(chunk) + "'"
-        file_query = f"SELECT Id, ContentDocumentId, Title, FileExtension, ContentSize, PathOnClient FROM ContentVersion WHERE ContentDocumentId IN ({ids_string}) AND IsLatest = true"
+    if set(by_story_count) == {1}:
+        # Every Data Set belongs to a single story: try one org-wide nested semi-join
         try:
-            res = sf.query_all(file_query)
-            files.extend(res['records'])
+            print("Aggregating ContentVersions with a nested semi-join...")
+            nested = _aggregate_files(sf, f"SELECT copado__Data_Set__c FROM copado__User_Story_Data_Commit__c WHERE copado__Data_Set__c != null")
+            for kind, (count, size) in nested.items():
+                totals[kind] = [count, size]
+            return totals
         except Exception as e:
-            print(f"Error querying ContentVersion chunk: {e}")
+            print(f"Nested semi-join not supported ({e}). Aggregating per Data Set chunk...")
+
+    print("Aggregating ContentVersions per Data Set chunk...")
+    for story_count, d_ids in by_story_count.items():
+        for chunk in helper.chunk_list(d_ids, AGGREGATE_CHUNK_SIZE):
+            for kind, (count, size) in _aggregate_files(sf, helper.format_in_clause(chunk)).items():
+                totals[kind][0] += story_count * count
+                totals[kind][1] += story_count * size
+    return totals
+
+def new_summary(distributions=False):
+    """
+    Returns the empty accumulator filled by the pipeline and read by write_report.
+    distributions: also collect per-file FileStats (memory grows with the org).
+    """
+    return {"datasets": 0, "story_links": 0, "stories": 0, "files_seen": 0, "totals": new_totals(),
+            "stats": FileStats() if distributions else None}
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.2f}"
+
+def write_distributions(writer, distributions):
+    """Appends the file size, top Data Set/User Story and monthly growth tables of FileStats.compute()."""
+    writer.writerow([])
+    writer.writerow(["File Type", "Files", "P50 Size (KB)", "P95 Size (KB)", "Max Size (KB)"])
+    for label, kind in ((".records.csv", "records"), (".template", "template"), ("Combined", "combined")):
+        row = distributions["sizes"][kind]
+        writer.writerow([label, row["files"], f"{row['p50'] / 1024:.2f}", f"{row['p95'] / 1024:.2f}", f"{row['max'] / 1024:.2f}"])
+
+    writer.writerow([])
+    writer.writerow(["Rank", "Data Set", "Files", "Size (MB)", "User Stories"])
+    for rank, row in enumerate(distributions["top_datasets"], 1):
+        writer.writerow([rank, row["id"], row["files"], _mb(row["bytes"]), row["stories"]])
+
+    writer.writerow([])
+    writer.writerow(["Rank", "User Story", "Data Sets", "Size (MB)"])
+    for rank, row in enumerate(distributions["top_stories"], 1):
+        writer.writerow([rank, row["id"], row["datasets"], _mb(row["bytes"])])
+
+    writer.writerow([])
+    writer.writerow(["Month", "Files Created", "Size (MB)", "Cumulative Size (MB)"])
+    for row in distributions["monthly"]:
+        writer.writerow([row["month"], row["files"], _mb(row["bytes"]), _mb(row["cumulative_bytes"])])
 
-    # 4. Process Files
-    doc_file_map = {f["ContentDocumentId"]: f for f in files}
-
-    total_files_records = 0
-    total_size_records = 0
-    total_files_template = 0
-    total_size_template = 0
-
-    for story_id, d_ids in story_datasets.items():
-        for d_id in d_ids:
-            doc_ids = dataset_to_docs.get(d_id, [])
-            for doc_id in doc_ids:
-                file_info = doc_file_map.get(doc_id)
-                if not file_info:
-                    continue
-                
-                path = (file_info.get("PathOnClient") or "").lower()
-                title = (file_info.get("Title") or "").lower()
-                ext = (file_info.get("FileExtension") or "").lower()
-                size = file_info.get("ContentSize", 0)
-                
-                is_records = path.endswith(".records.csv") or title.endswith(".records")
-                is_template = path.endswith(".template") or ext == "template"
-
-                if is_records:
-                    total_files_records += 1
-                    total_size_records += size
-                elif is_template:
-                    total_files_template += 1
-                    total_size_template += size
-
-    # 5. Calculate Averages
-    num_stories = len(story_datasets)
+def write_report(output_path, summary, distributions=None):
+    """Writes the storage report CSV, followed by the distribution tables if given."""
+    total_files_records, total_size_records = summary["totals"]["records"]
+    total_files_template, total_size_template = summary["totals"]["template"]
+    num_stories = summary["stories"]
+
+    # Calculate Averages
     if num_stories > 0:
-        total_datasets_linked = sum(len(s) for s in story_datasets.values())
-        avg_datasets = total_datasets_linked / num_stories
-        
+        avg_datasets = summary["story_links"] / num_stories
+
         avg_files_records = total_files_records / num_stories
         avg_files_template = total_files_template / num_stories
     else:
@@ -135,24 +272,123 @@ def run(args):
         avg_files_records = 0
         avg_files_template = 0
 
-    # 6. Generate Report
+    peak_rss = helper.get_peak_rss_mb()
+
     print(f"Generating report: {output_path}")
     try:
         with open(output_path, mode='w', newline='', encoding='utf-8') as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(["Metric", "Value", "Unit"])
-            writer.writerow(["Total Data Sets (Unique)", len(dataset_ids), "Count"])
+            writer.writerow(["Total Data Sets (Unique)", summary["datasets"], "Count"])
             writer.writerow(["Total User Stories with Data Sets", num_stories, "Count"])
             writer.writerow(["Average Data Sets per Story", f"{avg_datasets:.2f}", "Count"])
-            
+            writer.writerow(["Peak RSS", f"{peak_rss:.2f}" if peak_rss is not None else "n/a", "MB"])
+
             writer.writerow([])
             writer.writerow(["File Type", "Total Count", "Total Size (MB)", "Avg Count per Story"])
             writer.writerow([".records.csv", total_files_records, f"{total_size_records / (1024 * 1024):.2f}", f"{avg_files_records:.2f}"])
             writer.writerow([".template", total_files_template, f"{total_size_template / (1024 * 1024):.2f}", f"{avg_files_template:.2f}"])
             writer.writerow(["Combined", total_files_records + total_files_template, f"{(total_size_records + total_size_template) / (1024 * 1024):.2f}", f"{(avg_files_records + avg_files_template):.2f}"])
+            if distributions:
+                write_distributions(writer, distributions)
         print("Done.")
     except IOError as e:
         print(f"Error writing to file {output_path}: {e}")
 
+def run(args):
+    if multi_org.fan_out_if_needed(run, args, args.output, "csv"):
+        return
+    org_alias = args.username
+    output_path = args.output
+
+    print(f"Analyzing Copado file storage in org: {org_alias}")
+
+    metrics.start_phase("auth")
+    try:
+        sf, instance_url = helper.connect(org_alias, use_cache=not args.no_session_cache, max_api_calls=args.max_api_calls)
+    except Exception as e:
+        print(f"Authentication failed: {e}")
+        return
+
+    summary = new_summary(distributions=args.distributions)
+
+    # Bulk API 2.0 jobs take larger ID chunks and return CSV pages instead of REST pages
+    if args.bulk:
+        print("Using Bulk API 2.0 query jobs.")
+        query_iter = partial(helper.bulk_query_iter, sf)
+        chunk_size = BULK_CHUNK_SIZE
+    else:
+        query_iter = None
+        chunk_size = 200
+
+    # 1. Get Data Sets linked to User Stories via Data Commits
+    dataset_stories = None
+    if args.aggregate:
+        metrics.start_phase("data_commits")
+        try:
+            dataset_stories, summary["stories"] = load_dataset_story_counts_aggregate(sf)
+        except Exception as e:
+            # e.g. more than 2,000 groups: aggregate queries do not support queryMore
+            print(f"Aggregate query on Data Commits not possible ({e}). Falling back to row query...")
+            try:
+                dataset_stories = dict(iter_dataset_story_counts(sf, query_iter=query_iter))
+                summary["stories"] = count_stories(sf)
+            except Exception as e:
+                print(f"Error querying Data Commits: {e}")
+                return
+
+        if not dataset_stories:
+            print("No User Story Data Commits found.")
+            return
+        print(f"Found {len(dataset_stories)} unique Data Sets across {summary['stories']} User Stories.")
+
+        # 2. Sum file counts and sizes per file type on the server
+        metrics.start_phase("files")
+        try:
+            summary["totals"] = sum_files_by_aggregate(sf, dataset_stories)
+            summary["datasets"] = len(dataset_stories)
+            summary["story_links"] = sum(dataset_stories.values())
+        except Exception as e:
+            print(f"Aggregate file query not possible ({e}). Falling back to row queries...")
+            stream_file_totals(sf, dataset_stories.items(), summary, chunk_size=chunk_size, query_iter=query_iter)
+    else:
+        # Streamed pipeline: Data Commits -> ContentDocumentLinks -> ContentVersions,
+        # one page and one Data Set chunk at a time.
+        print("Streaming User Story Data Commits, ContentDocumentLinks and ContentVersions...")
+        metrics.start_phase("stream")
+        try:
+            summary["stories"] = count_stories(sf)
+            dataset_counts = iter_dataset_story_counts(sf, query_iter=query_iter, stats=summary["stats"])
+            stream_file_totals(sf, dataset_counts, summary, chunk_size=chunk_size, query_iter=query_iter)
+        except Exception as e:
+            print(f"Error querying Data Commits: {e}")
+            return
+
+        if not summary["datasets"]:
+            print("No User Story Data Commits found.")
+            return
+        print(f"Found {summary['datasets']} unique Data Sets across {summary['stories']} User Stories "
+              f"and {summary['files_seen']} linked files.")
+
+    # 3. Distributions over the files read row by row
+    distributions = None
+    if summary["stats"] is not None:
+        if summary["stats"].commit_story:
+            metrics.start_phase("stats")
+            distributions = summary["stats"].compute(top=args.top)
+        else:
+            print("Distribution statistics need the Data Commit rows; they are not collected with --aggregate.")
+
+    # 4. Generate Report
+    metrics.start_phase("write")
+    write_report(output_path, summary, distributions)
+    if distributions and args.stats_json:
+        try:
+            with open(args.stats_json, 'w', encoding='utf-8') as f:
+                json.dump(distributions, f, indent=4)
+            print(f"Distribution statistics saved to {args.stats_json}")
+        except IOError as e:
+            print(f"Error writing to file {args.stats_json}: {e}")
+
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
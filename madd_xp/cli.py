@@ -5,11 +5,21 @@ try:
     from . import update_template_status
     from . import analyze_files
     from . import find_templates
+    from . import index_templates
+    from . import get_template_dependents
+    from . import template_diff
+    from . import copado_helper as helper
+    from . import metrics
 except ImportError:
     import get_objects_in_template
     import update_template_status
     import analyze_files
     import find_templates
+    import index_templates
+    import get_template_dependents
+    import template_diff
+    import copado_helper as helper
+    import metrics
 
 def main():
     parser = argparse.ArgumentParser(prog="mxp", description="MADD XP CLI Tool")
@@ -22,12 +32,12 @@ def main():
     # Level 2: activate
     activate_parser = template_subparsers.add_parser("activate", help="Activate templates")
     update_template_status.add_args(activate_parser)
-    activate_parser.set_defaults(func=lambda args: update_template_status.run(args, active=True))
+    activate_parser.set_defaults(func=lambda args: update_template_status.run(args, True))
 
     # Level 2: deactivate
     deactivate_parser = template_subparsers.add_parser("deactivate", help="Deactivate templates")
     update_template_status.add_args(deactivate_parser)
-    deactivate_parser.set_defaults(func=lambda args: update_template_status.run(args, active=False))
+    deactivate_parser.set_defaults(func=lambda args: update_template_status.run(args, False))
 
     # Level 2: get
     get_parser = template_subparsers.add_parser("get", help="Get template information")
@@ -42,11 +52,21 @@ def main():
     get_objects_in_template.add_args(objects_parser)
     objects_parser.set_defaults(func=get_objects_in_template.run)
 
+    # Level 4: dependents
+    dependents_parser = get_template_subparsers.add_parser("dependents", help="List the template hierarchies that include a template")
+    get_template_dependents.add_args(dependents_parser)
+    dependents_parser.set_defaults(func=get_template_dependents.run)
+
     # Level 2: find
     find_parser = template_subparsers.add_parser("find", help="Find templates referencing specific objects")
     find_templates.add_args(find_parser)
     find_parser.set_defaults(func=find_templates.run)
 
+    # Level 2: diff
+    diff_parser = template_subparsers.add_parser("diff", help="Compare a template hierarchy between two orgs")
+    template_diff.add_args(diff_parser)
+    diff_parser.set_defaults(func=template_diff.run)
+
     # Level 1: analytics
     analytics_parser = subparsers.add_parser("analytics", help="Analytics operations")
     analytics_subparsers = analytics_parser.add_subparsers(dest="command_analytics", required=True)
@@ -56,9 +76,31 @@ def main():
     analyze_files.add_args(files_parser)
     files_parser.set_defaults(func=analyze_files.run)
 
+    # Level 1: index
+    index_parser = subparsers.add_parser("index", help="Local template index operations")
+    index_subparsers = index_parser.add_subparsers(dest="command_index", required=True)
+
+    # Level 2: build
+    build_parser = index_subparsers.add_parser("build", help="Snapshot all Data Templates into a local SQLite index")
+    index_templates.add_args(build_parser)
+    build_parser.set_defaults(func=index_templates.run)
+
+    # Level 2: refresh
+    refresh_parser = index_subparsers.add_parser("refresh", help="Update the local index with templates changed since the last build or refresh")
+    index_templates.add_args(refresh_parser)
+    refresh_parser.set_defaults(func=index_templates.run_refresh)
+
+    for command_parser in (activate_parser, deactivate_parser, objects_parser, dependents_parser, find_parser,
+                           diff_parser, files_parser, build_parser, refresh_parser):
+        metrics.add_args(command_parser)
+
     args = parser.parse_args()
     if hasattr(args, 'func'):
-        args.func(args)
+        try:
+            metrics.run_instrumented(args.func, args)
+        except helper.ApiBudgetExceeded as e:
+            print(f"\nError: {e}")
+            sys.exit(1)
     else:
         parser.print_help()
 
@@ -1,8 +1,200 @@
+import csv
 import json
+import random
+import re
 import subprocess
+import sys
+import threading
+import time
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from simple_salesforce import Salesforce
+try:
+    from . import metrics
+    from .template_cache import write_body, read_body
+except ImportError:
+    import metrics
+    from template_cache import write_body, read_body
+
+# Default number of attachment downloads kept in flight at once
+DEFAULT_CONCURRENCY = 8
+
+_http_session = None
+_http_pool_size = 0
+_http_session_lock = threading.Lock()
+_session_refresh_lock = threading.Lock()
+
+# A rejected session is refreshed through the SF CLI at most once in this window
+SESSION_REFRESH_INTERVAL = 60
+
+# Attachment bodies are streamed to disk in chunks of this many bytes
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Bulk API 2.0 query jobs: polling interval cap (seconds) and rows per result page
+BULK_POLL_INTERVAL = 5.0
+BULK_MAX_RECORDS = 50000
+
+# Transient failures (503, 429, concurrent REQUEST_LIMIT_EXCEEDED, dropped
+# connections) are retried this many times with jittered exponential backoff
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# Warn once the org has used this share of its daily API requests
+API_USAGE_WARNING = 0.9
+_LIMIT_INFO = re.compile(r"api-usage=(\d+)/(\d+)")
+
+def _api_call_kind(url):
+    """Classifies a REST URL for the run metrics."""
+    path = urlparse(url).path
+    if "/jobs/" in path:
+        return "bulk"
+    if "/query" in path:
+        return "query"
+    if path.endswith("/Body"):
+        return "attachment_body"
+    if "/composite/" in path:
+        return "composite"
+    if path.rstrip("/").endswith("/sobjects"):
+        return "describe"
+    if "/sobjects/" in path:
+        return "sobject"
+    return "other"
+
+def log_detail(message):
+    """Prints a per-template progress line unless --quiet is set."""
+    if not metrics.quiet:
+        print(message)
+
+class ApiBudgetExceeded(Exception):
+    """Raised instead of making a call past the run's --max-api-calls budget."""
+
+class ApiSession(requests.Session):
+    """
+    requests.Session shared by every Salesforce call (simple_salesforce, Bulk
+    API and attachment downloads) of a connection; see get_http_session and
+    new_http_session.
+    - Reads the org's daily API usage from the Sforce-Limit-Info header.
+    - Stops with ApiBudgetExceeded before exceeding max_api_calls for this run.
+    - Retries transient failures with jittered exponential backoff.
+    - Adapts the number of requests in flight: it grows by one per window of
+      successful calls up to max_in_flight and halves when Salesforce
+      throttles (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_CONCURRENCY, org_alias=None):
+        super().__init__()
+        self.org_alias = org_alias
+        self.max_in_flight = max_in_flight
+        self.in_flight_limit = float(max_in_flight)
+        self.api_calls = 0
+        self.retries = 0
+        self.max_api_calls = None
+        self.api_usage = None  # (used, daily limit) from the last Sforce-Limit-Info header
+        self._budget_start = 0
+        self._in_flight = 0
+        self._usage_warned = False
+        self._cond = threading.Condition()
+
+    def set_budget(self, max_api_calls):
+        """Allows max_api_calls more calls from now on (None: unlimited)."""
+        with self._cond:
+            self.max_api_calls = max_api_calls
+            self._budget_start = self.api_calls
+
+    def _acquire(self):
+        with self._cond:
+            if self.max_api_calls is not None and self.api_calls - self._budget_start >= self.max_api_calls:
+                raise ApiBudgetExceeded(f"Stopped after {self.max_api_calls} API calls (--max-api-calls).")
+            while self._in_flight >= max(1, int(self.in_flight_limit)):
+                self._cond.wait()
+            self._in_flight += 1
+            self.api_calls += 1
+
+    def _release(self, throttled=None):
+        """throttled: True halves the in-flight limit, False grows it, None keeps it."""
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.in_flight_limit = max(1.0, self.in_flight_limit / 2)
+            elif throttled is not None:
+                self.in_flight_limit = min(float(self.max_in_flight), self.in_flight_limit + 1 / self.in_flight_limit)
+            self._cond.notify_all()
+
+    def _track_usage(self, response):
+        match = _LIMIT_INFO.search(response.headers.get("Sforce-Limit-Info", ""))
+        if not match:
+            return
+        used, limit = int(match.group(1)), int(match.group(2))
+        self.api_usage = (used, limit)
+        if limit and used >= limit * API_USAGE_WARNING and not self._usage_warned:
+            self._usage_warned = True
+            org = f"Org '{self.org_alias}'" if self.org_alias else "The org"
+            print(f"Warning: {org} has used {used} of its {limit} daily API requests.")
+
+    @staticmethod
+    def _is_throttled(response):
+        if response.status_code in (429, 503):
+            return True
+        # Concurrent request limits are transient; the daily TotalRequests limit is not
+        return (response.status_code == 403 and "REQUEST_LIMIT_EXCEEDED" in response.text
+                and "TotalRequests" not in response.text)
+
+    def _backoff(self, attempt, reason, retry_after=None):
+        self.retries += 1
+        metrics.count_retry()
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        print(f"Salesforce call failed ({reason}). Retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+    def request(self, method, url, *args, **kwargs):
+        kind = _api_call_kind(url)
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire()
+            started = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.count_api_call(kind, time.perf_counter() - started, 0)
+                self._release()
+                # Only repeat reads; a write may have been applied before the connection dropped
+                if attempt == MAX_RETRIES or method.upper() not in ("GET", "HEAD"):
+                    raise
+                self._backoff(attempt, type(e).__name__)
+                continue
+            # Streamed bodies are read later by the caller; count their declared size
+            nbytes = int(response.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(response.content)
+            metrics.count_api_call(kind, time.perf_counter() - started, nbytes)
+            throttled = self._is_throttled(response)
+            self._release(throttled)
+            self._track_usage(response)
+            if not throttled or attempt == MAX_RETRIES:
+                return response
+            response.close()
+            self._backoff(attempt, f"HTTP {response.status_code}", response.headers.get("Retry-After"))
+
+def get_mxp_home():
+    """Returns the folder for mxp's per-user state (MXP_HOME, default ~/.mxp)."""
+    return os.environ.get("MXP_HOME") or os.path.join(os.path.expanduser("~"), ".mxp")
+
+def get_peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
 
 def parse_arg_list(arg_list):
     """Helper to parse JSON or list inputs."""
@@ -17,6 +209,24 @@ def parse_arg_list(arg_list):
             pass
     return arg_list
 
+def read_list_file(path):
+    """
+    Reads values separated by newlines or commas from a file ('-' for stdin).
+    Blank lines and lines starting with '#' are ignored.
+    """
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    values = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        values.extend([v.strip() for v in line.split(',') if v.strip()])
+    return values
+
 def get_sf_cli_credentials(org_alias):
     """Retrieves access token and instance URL from SF CLI."""
     try:
@@ -33,6 +243,107 @@ def get_sf_cli_credentials(org_alias):
         print(f"Error retrieving credentials: {str(e)}")
         raise
 
+def _session_cache_path(org_alias):
+    safe_alias = "".join([c for c in org_alias if c.isalnum() or c in ('-', '_', '.', '@')])
+    return os.path.join(get_mxp_home(), "sessions", f"{safe_alias}.json")
+
+def load_cached_session(org_alias):
+    """Returns the cached (access_token, instance_url) for an org alias, or None."""
+    path = _session_cache_path(org_alias)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data['access_token'], data['instance_url']
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+def save_cached_session(org_alias, access_token, instance_url):
+    """Stores the session for an org alias in a file only the current user can read."""
+    path = _session_cache_path(org_alias)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({
+            "alias": org_alias,
+            "access_token": access_token,
+            "instance_url": instance_url,
+            "fetched_at": time.time()
+        }, f)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+def connect(org_alias, use_cache=True, pool_size=DEFAULT_CONCURRENCY, max_api_calls=None, session=None):
+    """
+    Opens a Salesforce connection for a SF CLI org alias.
+    With use_cache, a previously stored session is reused instead of spawning
+    'sf org display'. If Salesforce rejects the session (401/INVALID_SESSION_ID),
+    credentials are refreshed through the CLI once and the call is retried.
+    max_api_calls: stop with ApiBudgetExceeded instead of making more calls.
+    session: ApiSession to use (see new_http_session); default: the shared one.
+    Returns: (Salesforce connection, instance URL)
+    """
+    cached = load_cached_session(org_alias) if use_cache else None
+    if cached:
+        access_token, instance_url = cached
+    else:
+        access_token, instance_url = get_sf_cli_credentials(org_alias)
+        if use_cache:
+            save_cached_session(org_alias, access_token, instance_url)
+
+    session = session or get_http_session(pool_size)
+    session.set_budget(max_api_calls)
+    sf = Salesforce(instance_url=instance_url, session_id=access_token, session=session)
+    last_refresh = [0.0]
+
+    def _refresh_from_cli():
+        if time.time() - last_refresh[0] < SESSION_REFRESH_INTERVAL:
+            raise Exception(f"Salesforce rejected the refreshed session for '{org_alias}'.")
+        last_refresh[0] = time.time()
+        print(f"Session for '{org_alias}' expired. Refreshing through the SF CLI...")
+        new_token, new_url = get_sf_cli_credentials(org_alias)
+        if use_cache:
+            save_cached_session(org_alias, new_token, new_url)
+        return new_token, urlparse(new_url).netloc
+
+    # simple_salesforce calls this on INVALID_SESSION_ID and retries the request
+    sf._salesforce_login_partial = _refresh_from_cli
+    return sf, instance_url
+
+def refresh_session(sf, rejected_token):
+    """
+    Refreshes the session of a connection from connect() after a raw HTTP call
+    was rejected with 401. Safe to call from several threads at once.
+    Returns: The access token to retry with.
+    """
+    with _session_refresh_lock:
+        if sf.session_id == rejected_token and getattr(sf, '_salesforce_login_partial', None):
+            sf._refresh_session()
+        return sf.session_id
+
+def chunk_list(lst, n):
+    """Yield successive n-sized chunks from lst."""
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
+
+def format_in_clause(values):
+    """Builds a quoted, escaped value list for a SOQL IN (...) clause."""
+    safe_values = [str(v).replace("\\", "\\\\").replace("'", "\\'") for v in values]
+    return "'" + "','".join(safe_values) + "'"
+
+def format_like_pattern(pattern):
+    """Builds a quoted SOQL LIKE literal from a pattern where '*' matches any text."""
+    escaped = pattern.replace("\\", "\\\\").replace("'", "\\'").replace("%", "\\%").replace("_", "\\_")
+    return "'" + escaped.replace("*", "%") + "'"
+
+def soql_datetime(value):
+    """
+    Converts an API timestamp ('2024-03-01T10:00:00.000+0000') to a SOQL
+    dateTime literal in UTC, truncated to whole seconds.
+    """
+    parsed = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
 def get_template_id_by_name(sf, template_name):
     """Queries for a Data Template ID given its name."""
     query = f"SELECT Id, Name FROM copado__Data_Template__c WHERE Name = '{template_name}' LIMIT 1"
@@ -41,27 +352,116 @@ def get_template_id_by_name(sf, template_name):
         return None
     return results['records'][0]['Id']
 
-def get_attachment_by_record_id(sf, instance_url, access_token, record_id, attachment_name, download_dir, file_alias=None):
+def get_template_names_by_ids(sf, template_ids, chunk_size=200):
+    """
+    Resolves Data Template Names for many IDs with chunked IN queries.
+    Returns: Dictionary { 'Requested Id': 'Name' }. Unknown IDs are omitted.
+    """
+    unique_ids = list(dict.fromkeys([t for t in template_ids if t]))
+    found = {}
+    for chunk in chunk_list(unique_ids, chunk_size):
+        query = f"SELECT Id, Name FROM copado__Data_Template__c WHERE Id IN ({format_in_clause(chunk)})"
+        try:
+            results = sf.query_all(query)
+            for record in results['records']:
+                found[record['Id']] = record['Name']
+        except ApiBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Warning: Could not resolve template names for chunk starting with {chunk[0]}. Error: {e}")
+
+    # Callers may pass 15-character IDs; the API always returns 18-character ones.
+    found_15 = {t_id[:15]: name for t_id, name in found.items()}
+    name_map = {}
+    for t_id in unique_ids:
+        name = found.get(t_id) or found_15.get(t_id[:15])
+        if name is not None:
+            name_map[t_id] = name
+    return name_map
+
+def get_template_ids_by_names(sf, template_names, chunk_size=200):
+    """
+    Resolves Data Template IDs for many Names with chunked IN queries.
+    Returns: Dictionary { 'Name': 'Id' }. When several templates share a name,
+    the first record returned wins, as with get_template_id_by_name.
+    """
+    unique_names = list(dict.fromkeys([n for n in template_names if n]))
+    found = {}
+    for chunk in chunk_list(unique_names, chunk_size):
+        query = f"SELECT Id, Name FROM copado__Data_Template__c WHERE Name IN ({format_in_clause(chunk)})"
+        try:
+            results = sf.query_all(query)
+            for record in results['records']:
+                # SOQL string comparison is case-insensitive
+                found.setdefault(record['Name'].lower(), record['Id'])
+        except ApiBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Warning: Could not resolve template IDs for chunk starting with {chunk[0]}. Error: {e}")
+    return {name: found[name.lower()] for name in unique_names if name.lower() in found}
+
+def get_http_session(pool_size=DEFAULT_CONCURRENCY):
+    """
+    Returns the shared ApiSession used for Salesforce and attachment calls.
+    Connections are kept alive and pooled so parallel downloads reuse TLS sessions.
+    """
+    global _http_session, _http_pool_size
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = new_http_session(pool_size)
+            _http_pool_size = pool_size
+        if pool_size > _http_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+            _http_session.max_in_flight = max(_http_session.max_in_flight, pool_size)
+            _http_pool_size = pool_size
+        return _http_session
+
+def new_http_session(pool_size=DEFAULT_CONCURRENCY, org_alias=None):
+    """
+    Returns a separate ApiSession with its own connection pool, in-flight limit,
+    API budget and usage tracking, for runs that talk to several orgs at once.
+    """
+    session = ApiSession(pool_size, org_alias=org_alias)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def api_session(sf):
+    """Returns the ApiSession of a connection made by connect()."""
+    session = getattr(sf, "session", None)
+    return session if isinstance(session, ApiSession) else get_http_session()
+
+def get_attachment_by_record_id(sf, instance_url, access_token, record_id, attachment_name, download_dir, file_alias=None, body_url=None,
+                                cache=None, attachment=None):
     """
     Downloads attachment by Record ID. 
+    The body is streamed to disk as downloaded and parsed once from the stored
+    file: into the TemplateCache if given (against the Attachment metadata
+    record), else to download_dir. With neither, it is parsed in memory.
+    body_url: the Attachment's Body path if already known (see get_attachment_metadata);
+    otherwise it is looked up with a query.
     Returns: Parsed JSON content (dict) or None if failed.
     """
-    file_query = f"""
-        SELECT Id, Body, Name 
-        FROM Attachment 
-        WHERE ParentId = '{record_id}' 
-        AND Name = '{attachment_name}' 
-        LIMIT 1
-    """
-    file_results = sf.query(file_query)
+    if body_url is None:
+        file_query = f"""
+            SELECT Id, Body, Name 
+            FROM Attachment 
+            WHERE ParentId = '{record_id}' 
+            AND Name = '{attachment_name}' 
+            LIMIT 1
+        """
+        file_results = sf.query(file_query)
 
-    if file_results['totalSize'] == 0:
-        print(f"Warning: No attachment named '{attachment_name}' found for ID {record_id} ({file_alias}).")
-        return None
+        if file_results['totalSize'] == 0:
+            warn_missing_attachment(record_id, attachment_name, file_alias)
+            return None
+        body_url = file_results['records'][0]['Body']
 
-    file_record = file_results['records'][0]
-    download_path = file_record['Body']
-    full_url = f"{instance_url}{download_path}"
+    full_url = f"{instance_url}{body_url}"
     headers = {"Authorization": "Bearer " + access_token}
     
     # Use alias if provided, otherwise use ID. Sanitize filename.
@@ -69,22 +469,168 @@ def get_attachment_by_record_id(sf, instance_url, access_token, record_id, attac
     safe_name = "".join([c for c in raw_name if c.isalpha() or c.isdigit() or c in (' ', '-', '_', '.')]).rstrip()
     filename = f"{safe_name}.json"
     
-    print(f"Downloading template: {safe_name}...")
-    response = requests.get(full_url, headers=headers)
+    log_detail(f"Downloading template: {safe_name}...")
+    stream = cache is not None or bool(download_dir)
+    response = api_session(sf).get(full_url, headers=headers, stream=stream)
+    if response.status_code == 401 and getattr(sf, '_salesforce_login_partial', None):
+        response.close()
+        access_token = refresh_session(sf, access_token)
+        headers = {"Authorization": "Bearer " + access_token}
+        response = api_session(sf).get(full_url, headers=headers, stream=stream)
     
-    if response.status_code == 200:
+    with response:
+        if response.status_code != 200:
+            print(f"Failed to download {safe_name}. Status: {response.status_code}")
+            return None
         try:
-            json_content = response.json()
-            output_path = os.path.join(download_dir, filename)
-            with open(output_path, 'w') as f:
-                json.dump(json_content, f, indent=4)
+            if cache is not None:
+                return cache.store(record_id, attachment or {}, response.iter_content(DOWNLOAD_CHUNK_SIZE), name=file_alias)
+            if download_dir:
+                output_path = os.path.join(download_dir, filename)
+                write_body(output_path, response.iter_content(DOWNLOAD_CHUNK_SIZE))
+                return read_body(output_path)
+            started = time.perf_counter()
+            json_content = json.loads(response.content)
+            metrics.add_time("json_parse", time.perf_counter() - started)
             return json_content
-        except json.JSONDecodeError:
+        except ValueError:
             print(f"Error: Invalid JSON in attachment for {safe_name}.")
             return None
-    else:
-        print(f"Failed to download {safe_name}. Status: {response.status_code}")
-        return None
+
+def warn_missing_attachment(record_id, attachment_name, file_alias=None):
+    print(f"Warning: No attachment named '{attachment_name}' found for ID {record_id} ({file_alias}).")
+
+def get_attachment_metadata(sf, record_ids, attachment_name, chunk_size=200):
+    """
+    Fetches Attachment metadata for many parent records with chunked IN queries.
+    Returns: Dictionary { 'ParentId': {'Id', 'Body', 'LastModifiedDate', 'BodyLength'} }
+    """
+    unique_ids = list(dict.fromkeys([r for r in record_ids if r]))
+    metadata = {}
+    for chunk in chunk_list(unique_ids, chunk_size):
+        query = (
+            "SELECT Id, ParentId, Body, LastModifiedDate, BodyLength FROM Attachment "
+            f"WHERE ParentId IN ({format_in_clause(chunk)}) AND Name = '{attachment_name}' "
+            "ORDER BY LastModifiedDate DESC"
+        )
+        try:
+            results = sf.query_all(query)
+            for record in results['records']:
+                # Newest first; keep one attachment per parent
+                metadata.setdefault(record['ParentId'], record)
+        except ApiBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Warning: Could not fetch attachment metadata for chunk starting with {chunk[0]}. Error: {e}")
+
+    # Callers may pass 15-character IDs; the API always returns 18-character ones.
+    metadata_15 = {p_id[:15]: rec for p_id, rec in metadata.items()}
+    return {
+        r_id: metadata.get(r_id) or metadata_15.get(r_id[:15])
+        for r_id in unique_ids
+        if metadata.get(r_id) or metadata_15.get(r_id[:15])
+    }
+
+def download_attachments(sf, instance_url, access_token, templates, attachment_name, download_dir, concurrency=DEFAULT_CONCURRENCY, cache=None, metadata=None):
+    """
+    Downloads the attachments of a batch of templates in parallel.
+    templates: list of (record_id, file_alias) tuples.
+    The Body URLs of the whole batch are looked up with one metadata query per
+    200 templates (pass metadata if the caller already has it), so each
+    download is a single request. When a TemplateCache is given, only new or
+    changed attachments are downloaded, and they are streamed into the cache.
+    Returns: Dictionary { 'record_id': Parsed JSON content or None }
+    """
+    unique_templates = {}
+    for t_id, alias in templates:
+        unique_templates.setdefault(t_id, alias)
+    if not unique_templates:
+        return {}
+
+    results = {}
+    if metadata is None:
+        metadata = get_attachment_metadata(sf, list(unique_templates), attachment_name)
+    for t_id in list(unique_templates):
+        if t_id not in metadata:
+            warn_missing_attachment(t_id, attachment_name, unique_templates.pop(t_id))
+            results[t_id] = None
+
+    if cache is not None:
+        hits = 0
+        for t_id in list(unique_templates):
+            cached = cache.get(t_id, metadata.get(t_id))
+            if cached is not None:
+                results[t_id] = cached
+                del unique_templates[t_id]
+                hits += 1
+        metrics.count_cache("templates", hits=hits, misses=len(unique_templates))
+        # The cache owns on-disk storage of the bodies
+        download_dir = None
+    if not unique_templates:
+        return results
+
+    if api_session(sf) is get_http_session():
+        get_http_session(concurrency)
+
+    def _download(record_id, file_alias):
+        try:
+            return get_attachment_by_record_id(
+                sf, instance_url, access_token, record_id, attachment_name, download_dir,
+                file_alias=file_alias, body_url=metadata[record_id]['Body'],
+                cache=cache, attachment=metadata[record_id]
+            )
+        except ApiBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Error downloading attachment for {record_id} ({file_alias}): {e}")
+            return None
+
+    workers = max(1, min(concurrency, len(unique_templates)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {t_id: pool.submit(_download, t_id, alias) for t_id, alias in unique_templates.items()}
+
+    for t_id, future in futures.items():
+        results[t_id] = future.result()
+    return results
+
+def bulk_query_iter(sf, query, poll_interval=BULK_POLL_INTERVAL, max_records=BULK_MAX_RECORDS):
+    """
+    Runs a SOQL query as a Bulk API 2.0 query job, polls until it completes and
+    streams the CSV result pages.
+    Yields: One dict per row. Empty CSV values (nulls) are returned as None and
+    all other values as strings.
+    """
+    jobs_url = f"{sf.bulk2_url}query"
+    job = sf._call_salesforce(
+        'POST', jobs_url, name='bulk2', data=json.dumps({"operation": "query", "query": query})
+    ).json()
+    job_url = f"{jobs_url}/{job['id']}"
+
+    delay = min(0.5, poll_interval)
+    while True:
+        status = sf._call_salesforce('GET', job_url, name='bulk2').json()
+        state = status.get('state')
+        if state == 'JobComplete':
+            break
+        if state in ('Failed', 'Aborted'):
+            raise Exception(f"Bulk query job {job['id']} {state}: {status.get('errorMessage')}")
+        time.sleep(delay)
+        delay = min(delay * 2, poll_interval)
+
+    locator = None
+    while True:
+        params = {"maxRecords": max_records}
+        if locator:
+            params["locator"] = locator
+        response = sf._call_salesforce(
+            'GET', f"{job_url}/results", name='bulk2', params=params, headers={"Accept": "text/csv"}, stream=True
+        )
+        response.encoding = 'utf-8'
+        for row in csv.DictReader(response.iter_lines(decode_unicode=True)):
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+        locator = response.headers.get("Sforce-Locator")
+        if not locator or locator == "null":
+            break
 
 def get_main_object(json_data):
     """Extracts the 'templateMainObject' from the 'dataTemplate' section."""
@@ -101,28 +647,82 @@ def get_child_relationships(json_data):
     return json_data.get("childrenObjectsReferenceList", [])
 
 def get_parent_relationships(json_data):
-    """Recursively finds parent template references."""
-    collected_list = []
-    def _recursive_search(data):
-        if isinstance(data, dict):
-            # Check for parent template reference pattern
-            if data.get('fieldType') == 'reference' and data.get('deploymentTemplateNameMap'):
-                name_map = data.get('deploymentTemplateNameMap')
-                for t_id, t_name in name_map.items():
-                    collected_list.append({
-                        'templateId': t_id,
-                        'templateName': t_name
-                    })
-            for key, value in data.items():
-                _recursive_search(value)
-        elif isinstance(data, list):
-            for item in data:
-                _recursive_search(item)
-    
-    if json_data:
-        _recursive_search(json_data)
-    return collected_list
-    
+    """Finds parent template references anywhere in the template JSON."""
+    return extract_template_info(json_data)[2]
+
+def extract_template_info(json_data):
+    """
+    Extracts main object, child references and parent references in one
+    iterative pass over the template JSON. The walk order matches a recursive
+    pre-order search, so results are the same as the separate helpers without
+    the per-value call overhead or the recursion limit.
+    Returns: (main_object, children, parents)
+    """
+    if not json_data:
+        return None, [], []
+
+    main_object = get_main_object(json_data)
+    children = json_data.get("childrenObjectsReferenceList", [])
+    parents = []
+
+    # Depth-first walk with a stack of iterators; scalars are skipped inline.
+    # Exact type checks are enough since json.load only builds dicts and lists.
+    stack = [iter((json_data,))]
+    while stack:
+        for value in stack[-1]:
+            if type(value) is dict:
+                # Check for parent template reference pattern
+                if value.get('fieldType') == 'reference' and value.get('deploymentTemplateNameMap'):
+                    for t_id, t_name in value['deploymentTemplateNameMap'].items():
+                        parents.append({
+                            'templateId': t_id,
+                            'templateName': t_name
+                        })
+                stack.append(iter(value.values()))
+                break
+            if type(value) is list:
+                stack.append(iter(value))
+                break
+        else:
+            stack.pop()
+
+    return main_object, children, parents
+
+def get_object_references(json_data):
+    """
+    Lists the objects a template touches through its fields, besides its main object.
+    Reference fields (fieldType 'reference') name their target objects in
+    'referenceTo' or as keys of 'parentObjectApiNameMap'; child relationships
+    name theirs in 'childSObject'.
+    Returns: list of (object API name, 'reference' or 'child') without duplicates
+    """
+    refs = {}
+    if not json_data:
+        return []
+
+    stack = [iter((json_data,))]
+    while stack:
+        for value in stack[-1]:
+            if type(value) is dict:
+                if value.get('fieldType') == 'reference':
+                    targets = value.get('referenceTo') or []
+                    if isinstance(targets, str):
+                        targets = [targets]
+                    targets = list(targets) + list(value.get('parentObjectApiNameMap') or {})
+                    for target in targets:
+                        refs.setdefault((target, 'reference'), None)
+                if isinstance(value.get('childSObject'), str):
+                    refs.setdefault((value['childSObject'], 'child'), None)
+                stack.append(iter(value.values()))
+                break
+            if type(value) is list:
+                stack.append(iter(value))
+                break
+        else:
+            stack.pop()
+
+    return [ref for ref in refs if ref[0]]
+
 def get_object_labels(sf, api_names_list):
     """
     Queries EntityDefinition to get the Label for a list of Object API Names.
@@ -147,6 +747,8 @@ def get_object_labels(sf, api_names_list):
             for record in results['records']:
                 # EntityDefinition returns QualifiedApiName
                 label_map[record['QualifiedApiName']] = record['Label']
+        except ApiBudgetExceeded:
+            raise
         except Exception as e:
             print(f"Warning: Could not fetch labels for chunk starting with {chunk[0]}. Error: {e}")
             
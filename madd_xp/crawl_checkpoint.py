@@ -0,0 +1,49 @@
+import json
+import os
+
+CHECKPOINT_VERSION = 1
+# Crawl state saved after every level; see get_objects_in_template.run
+STATE_KEYS = ("level", "root_contexts", "template_names", "template_objects", "adjacency", "discovery_order", "frontier")
+
+def default_checkpoint_path(output_path):
+    return f"{output_path}.checkpoint"
+
+def save_checkpoint(path, org_alias, inputs, state):
+    """
+    Writes the crawl state of a 'get objects' run. The file is replaced
+    atomically, so an interrupted write leaves the previous checkpoint intact.
+    inputs: the root template names and Ids the run was started with.
+    """
+    data = {"version": CHECKPOINT_VERSION, "org_alias": org_alias, "inputs": inputs}
+    data.update({key: state[key] for key in STATE_KEYS})
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path, org_alias):
+    """
+    Reads a checkpoint written by save_checkpoint for org_alias.
+    Returns: (inputs, state), or None after printing why it cannot be used.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (IOError, ValueError) as e:
+        print(f"Error: Could not read checkpoint {path}: {e}")
+        return None
+    if data.get("version") != CHECKPOINT_VERSION or any(key not in data for key in STATE_KEYS):
+        print(f"Error: {path} is not a checkpoint of this version of mxp.")
+        return None
+    if data.get("org_alias") != org_alias:
+        print(f"Error: Checkpoint {path} belongs to org '{data.get('org_alias')}', not '{org_alias}'.")
+        return None
+    state = {key: data[key] for key in STATE_KEYS}
+    state["frontier"] = [tuple(entry) for entry in state["frontier"]]
+    return data["inputs"], state
+
+def remove_checkpoint(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,204 @@
+"""
+Distribution statistics for 'analytics files': file size percentiles, the
+largest Data Sets and User Stories, and storage growth per month.
+Per-file attributes are collected into typed arrays (a few bytes per file)
+instead of dicts, and the statistics are computed in one pass over them,
+with NumPy when it is installed (pip install numpy) and plain Python otherwise.
+"""
+import heapq
+import math
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KINDS = ("records", "template")
+PERCENTILES = (50, 95)
+DEFAULT_TOP = 10
+
+def month_index(created_date):
+    """'2024-03-01T10:00:00.000+0000' -> 2024 * 12 + 2, or -1 if the date is missing."""
+    if not created_date or len(created_date) < 7:
+        return -1
+    try:
+        return int(created_date[:4]) * 12 + int(created_date[5:7]) - 1
+    except ValueError:
+        return -1
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def nearest_rank(sorted_values, percentile):
+    """Nearest-rank percentile of an ascending sequence; 0 if it is empty."""
+    if not len(sorted_values):
+        return 0
+    return int(sorted_values[max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)])
+
+class FileStats:
+    """
+    Columnar accumulator for the streamed pipeline. Ids are mapped to array
+    positions once; everything else is stored as machine integers:
+    per file its size, type and CreatedDate month, per file/Data Set link and
+    per Data Set/User Story commit the two positions. Files are keyed by
+    ContentDocumentId, so a file linked to Data Sets in several chunks counts once.
+    """
+
+    def __init__(self):
+        self.file_size = array('q')
+        self.file_kind = array('b')
+        self.file_month = array('l')
+        self.link_file = array('L')
+        self.link_dataset = array('L')
+        self.commit_dataset = array('L')
+        self.commit_story = array('L')
+        self.dataset_ids = {}
+        self.story_ids = {}
+        self.document_ids = {}
+
+    @staticmethod
+    def _index(ids, record_id):
+        index = ids.get(record_id)
+        if index is None:
+            index = ids[record_id] = len(ids)
+        return index
+
+    def add_commit(self, dataset_id, story_id):
+        """Records that a User Story commits a Data Set (once per pair)."""
+        self.commit_dataset.append(self._index(self.dataset_ids, dataset_id))
+        self.commit_story.append(self._index(self.story_ids, story_id))
+
+    def add_file(self, document_id, kind, size, created_date, dataset_ids):
+        """
+        Records a classified file and the Data Sets it is linked to. A file seen
+        again (from another chunk of Data Sets) only adds its new links.
+        """
+        file_index = self.document_ids.get(document_id)
+        if file_index is None:
+            file_index = self.document_ids[document_id] = len(self.file_size)
+            self.file_size.append(size)
+            self.file_kind.append(KINDS.index(kind))
+            self.file_month.append(month_index(created_date))
+        # Each Data Set is streamed in exactly one chunk, so these links are new
+        for dataset_id in dataset_ids:
+            self.link_file.append(file_index)
+            self.link_dataset.append(self._index(self.dataset_ids, dataset_id))
+
+    def __len__(self):
+        return len(self.file_size)
+
+    def compute(self, top=DEFAULT_TOP):
+        """
+        Returns {
+            'sizes': { 'records' | 'template' | 'combined': {'files', 'p50', 'p95', 'max'} },
+            'top_datasets': [ {'id', 'files', 'bytes', 'stories'} ],
+            'top_stories': [ {'id', 'datasets', 'bytes'} ],
+            'monthly': [ {'month', 'files', 'bytes', 'cumulative_bytes'} ]
+        }
+        Sizes are in bytes. Each file counts once, however many stories commit it.
+        """
+        compute = _compute_numpy if numpy is not None else _compute_python
+        return compute(self, top)
+
+def _size_row(sorted_sizes):
+    row = {"files": len(sorted_sizes)}
+    for p in PERCENTILES:
+        row[f"p{p}"] = nearest_rank(sorted_sizes, p)
+    row["max"] = int(sorted_sizes[-1]) if len(sorted_sizes) else 0
+    return row
+
+def _ranked(ids, values, top):
+    """Positions of the top largest non-zero values, largest first; ties in first-seen order."""
+    names = list(ids)
+    if numpy is not None:
+        ranked = numpy.argsort(-values, kind='stable')[:top].tolist()
+    else:
+        ranked = heapq.nlargest(top, range(len(values)), key=values.__getitem__)
+    return [i for i in ranked if values[i] > 0], names
+
+def _top_datasets(stats, dataset_files, dataset_bytes, dataset_stories, top):
+    ranked, names = _ranked(stats.dataset_ids, dataset_bytes, top)
+    return [{"id": names[i], "files": int(dataset_files[i]), "bytes": int(dataset_bytes[i]), "stories": int(dataset_stories[i])}
+            for i in ranked]
+
+def _top_stories(stats, story_datasets, story_bytes, top):
+    ranked, names = _ranked(stats.story_ids, story_bytes, top)
+    return [{"id": names[i], "datasets": int(story_datasets[i]), "bytes": int(story_bytes[i])} for i in ranked]
+
+def _monthly(months, files, sizes):
+    rows = []
+    cumulative = 0
+    for month, count, size in zip(months, files, sizes):
+        cumulative += int(size)
+        rows.append({"month": month_label(int(month)), "files": int(count), "bytes": int(size), "cumulative_bytes": cumulative})
+    return rows
+
+def _compute_numpy(stats, top):
+    # The arrays are handed over through the buffer protocol
+    sizes = numpy.asarray(stats.file_size, dtype=numpy.int64)
+    kinds = numpy.asarray(stats.file_kind, dtype=numpy.int8)
+    months = numpy.asarray(stats.file_month, dtype=numpy.int64)
+    link_file = numpy.asarray(stats.link_file, dtype=numpy.int64)
+    link_dataset = numpy.asarray(stats.link_dataset, dtype=numpy.int64)
+    commit_dataset = numpy.asarray(stats.commit_dataset, dtype=numpy.int64)
+    commit_story = numpy.asarray(stats.commit_story, dtype=numpy.int64)
+    n_datasets, n_stories = len(stats.dataset_ids), len(stats.story_ids)
+
+    result = {"sizes": {}}
+    for code, kind in enumerate(KINDS):
+        result["sizes"][kind] = _size_row(numpy.sort(sizes[kinds == code]))
+    result["sizes"]["combined"] = _size_row(numpy.sort(sizes))
+
+    dataset_files = numpy.bincount(link_dataset, minlength=n_datasets)
+    dataset_bytes = numpy.bincount(link_dataset, weights=sizes[link_file], minlength=n_datasets).astype(numpy.int64)
+    dataset_stories = numpy.bincount(commit_dataset, minlength=n_datasets)
+    story_datasets = numpy.bincount(commit_story, minlength=n_stories)
+    story_bytes = numpy.bincount(commit_story, weights=dataset_bytes[commit_dataset], minlength=n_stories).astype(numpy.int64)
+    result["top_datasets"] = _top_datasets(stats, dataset_files, dataset_bytes, dataset_stories, top)
+    result["top_stories"] = _top_stories(stats, story_datasets, story_bytes, top)
+
+    dated = months >= 0
+    if dated.any():
+        first = int(months[dated].min())
+        offsets = months[dated] - first
+        files = numpy.bincount(offsets)
+        month_bytes = numpy.bincount(offsets, weights=sizes[dated]).astype(numpy.int64)
+        present = numpy.nonzero(files)[0]
+        result["monthly"] = _monthly(present + first, files[present], month_bytes[present])
+    else:
+        result["monthly"] = []
+    return result
+
+def _compute_python(stats, top):
+    sizes, kinds = stats.file_size, stats.file_kind
+    n_datasets, n_stories = len(stats.dataset_ids), len(stats.story_ids)
+
+    result = {"sizes": {}}
+    for code, kind in enumerate(KINDS):
+        result["sizes"][kind] = _size_row(sorted(s for s, k in zip(sizes, kinds) if k == code))
+    result["sizes"]["combined"] = _size_row(sorted(sizes))
+
+    dataset_files = array('q', bytes(8 * n_datasets))
+    dataset_bytes = array('q', bytes(8 * n_datasets))
+    dataset_stories = array('q', bytes(8 * n_datasets))
+    for f, d in zip(stats.link_file, stats.link_dataset):
+        dataset_files[d] += 1
+        dataset_bytes[d] += sizes[f]
+    story_datasets = array('q', bytes(8 * n_stories))
+    story_bytes = array('q', bytes(8 * n_stories))
+    for d, s in zip(stats.commit_dataset, stats.commit_story):
+        dataset_stories[d] += 1
+        story_datasets[s] += 1
+        story_bytes[s] += dataset_bytes[d]
+    result["top_datasets"] = _top_datasets(stats, dataset_files, dataset_bytes, dataset_stories, top)
+    result["top_stories"] = _top_stories(stats, story_datasets, story_bytes, top)
+
+    by_month = {}
+    for month, size in zip(stats.file_month, sizes):
+        if month >= 0:
+            counts = by_month.setdefault(month, [0, 0])
+            counts[0] += 1
+            counts[1] += size
+    months = sorted(by_month)
+    result["monthly"] = _monthly(months, [by_month[m][0] for m in months], [by_month[m][1] for m in months])
+    return result
@@ -2,20 +2,114 @@ import csv
 import json
 import os
 import argparse
-from simple_salesforce import Salesforce
 try:
     from . import copado_helper as helper
+    from . import metrics
+    from . import multi_org
+    from . import template_index
 except ImportError:
     import copado_helper as helper
+    import metrics
+    import multi_org
+    import template_index
 
 def add_args(parser):
-    parser.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias")
-    parser.add_argument("-obj", "--objects", required=True, nargs='+', help="List of Object API Names (space-separated, comma-separated string, or JSON array)")
+    parser.add_argument("-u", "--username", required=False, help="Salesforce CLI Org Alias. Several orgs: a comma-separated list or JSON\narray; their results are merged into one output with an 'org' column.")
+    multi_org.add_args(parser)
+    parser.add_argument("--no-session-cache", action="store_true", help="Ignore the cached session and fetch fresh credentials from the SF CLI.")
+    parser.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N Salesforce API calls")
+    parser.add_argument("-obj", "--objects", required=True, nargs='+', help="List of Object API Names (space-separated, comma-separated string, or JSON array).\n'*' matches any text, e.g. 'copado__*' or '*__c'")
     parser.add_argument("--active", action="store_true", help="Only list active templates")
     parser.add_argument("-o", "--output", default="found_templates.csv", help="Path to output file")
     parser.add_argument("--json", action="store_true", help="Output in JSON format")
+    parser.add_argument("--bulk", action="store_true", help="Run the template query as a Bulk API 2.0 query job")
+    parser.add_argument("--offline", action="store_true", help="Answer from the local template index of the org (see 'mxp index build')")
+    parser.add_argument("--index", default=None, metavar="PATH", help="Path to the template index to answer from (implies --offline)")
+    parser.add_argument("--deep", action="store_true", help="Also match templates that touch the objects through lookup fields, child\nrelationships or parent/child templates (answers from the index)")
+
+OBJECTS_CHUNK_SIZE = 200
+OUTPUT_FIELDS = ["object_api_name", "template_name", "template_id", "url", "active"]
+
+def find_online(args, target_objects, active_only):
+    """Queries Salesforce. Returns: (template records or None, instance URL)"""
+    metrics.start_phase("auth")
+    try:
+        sf, instance_url = helper.connect(args.username, use_cache=not args.no_session_cache, max_api_calls=args.max_api_calls)
+    except Exception as e:
+        print(f"Authentication failed: {e}")
+        return None, None
+
+    # One query per chunk of names and per wildcard pattern keeps every IN clause bounded
+    base_query = "SELECT Id, Name, copado__Main_Object__c, copado__Active__c FROM copado__Data_Template__c WHERE "
+    names = [o for o in target_objects if "*" not in o]
+    patterns = [o for o in target_objects if "*" in o]
+    conditions = [f"copado__Main_Object__c IN ({helper.format_in_clause(chunk)})" for chunk in helper.chunk_list(names, OBJECTS_CHUNK_SIZE)]
+    conditions += [f"copado__Main_Object__c LIKE {helper.format_like_pattern(p)}" for p in patterns]
+    if active_only:
+        conditions = [f"{c} AND copado__Active__c = true" for c in conditions]
+
+    metrics.start_phase("query")
+    records = {}
+    try:
+        if args.bulk:
+            print("Using Bulk API 2.0 query jobs.")
+        for condition in conditions:
+            if args.bulk:
+                rows = helper.bulk_query_iter(sf, base_query + condition)
+            else:
+                rows = sf.query_all(base_query + condition)['records']
+            for rec in rows:
+                if args.bulk:
+                    # Bulk API returns CSV strings
+                    rec["copado__Active__c"] = rec.get("copado__Active__c") == "true"
+                records.setdefault(rec["Id"], rec)
+    except Exception as e:
+        print(f"Error querying templates: {e}")
+        return None, instance_url
+
+    records = list(records.values())
+    return records, instance_url
+
+def find_offline(args, target_objects, active_only):
+    """Answers from the local template index. Returns: (template records or None, instance URL)"""
+    index_path = os.path.expanduser(args.index or template_index.default_index_path(args.username))
+    index = template_index.open_index(index_path)
+    if index is None:
+        return None, None
+    try:
+        instance_url = index.get_meta("instance_url", "")
+        records = [
+            {"Id": t_id, "Name": name, "copado__Main_Object__c": main_object,
+             "copado__Active__c": None if active is None else bool(active)}
+            for t_id, name, main_object, active in index.find_by_main_objects(target_objects, active_only)
+        ]
+    finally:
+        index.close()
+    return records, instance_url
+
+def find_deep(args, target_objects, active_only):
+    """
+    Answers from the local template index, matching every relationship kind.
+    Returns: (template records with 'matched_object' and 'relationship' or None, instance URL)
+    """
+    index_path = os.path.expanduser(args.index or template_index.default_index_path(args.username))
+    index = template_index.open_index(index_path)
+    if index is None:
+        return None, None
+    try:
+        instance_url = index.get_meta("instance_url", "")
+        records = [
+            {"Id": t_id, "Name": name, "matched_object": api_name, "relationship": kind,
+             "copado__Active__c": None if active is None else bool(active)}
+            for api_name, t_id, name, active, kind in index.find_deep(target_objects, active_only)
+        ]
+    finally:
+        index.close()
+    return records, instance_url
 
 def run(args):
+    if multi_org.fan_out_if_needed(run, args, args.output, "json" if args.json else "csv"):
+        return
     org_alias = args.username
     raw_objects = helper.parse_arg_list(args.objects)
     
@@ -36,44 +130,38 @@ def run(args):
     if active_only:
         print("Filter: Active templates only")
 
-    try:
-        access_token, instance_url = helper.get_sf_cli_credentials(org_alias)
-        sf = Salesforce(instance_url=instance_url, session_id=access_token)
-    except Exception as e:
-        print(f"Authentication failed: {e}")
-        return
-
     if not target_objects:
         print("No target objects provided.")
         return
 
-    # Build Query
-    safe_objects = [x.replace("'", "\\'") for x in target_objects]
-    objects_in_clause = "'" + "','".join(safe_objects) + "'"
-    
-    query = f"SELECT Id, Name, copado__Main_Object__c, copado__Active__c FROM copado__Data_Template__c WHERE copado__Main_Object__c IN ({objects_in_clause})"
-    
-    if active_only:
-        query += " AND copado__Active__c = true"
-
-    try:
-        result = sf.query_all(query)
-        records = result['records']
-    except Exception as e:
-        print(f"Error querying templates: {e}")
+    if args.deep:
+        find = find_deep
+    elif args.offline or args.index:
+        find = find_offline
+    else:
+        find = find_online
+    records, instance_url = find(args, target_objects, active_only)
+    if records is None:
         return
 
-    print(f"Found {len(records)} templates.")
+    if args.deep:
+        print(f"Found {len(records)} matches in {len({rec['Id'] for rec in records})} templates.")
+    else:
+        print(f"Found {len(records)} templates.")
 
+    metrics.start_phase("write")
     output_rows = []
     for rec in records:
-        output_rows.append({
-            "object_api_name": rec.get("copado__Main_Object__c"),
+        row = {
+            "object_api_name": rec.get("matched_object", rec.get("copado__Main_Object__c")),
             "template_name": rec.get("Name"),
             "template_id": rec.get("Id"),
             "url": f"{instance_url}/{rec.get('Id')}",
             "active": rec.get("copado__Active__c")
-        })
+        }
+        if args.deep:
+            row["relationship"] = rec.get("relationship")
+        output_rows.append(row)
 
     try:
         output_dir = os.path.dirname(output_path)
@@ -85,7 +173,7 @@ def run(args):
                 json.dump(output_rows, f, indent=4)
         else:
             with open(output_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=["object_api_name", "template_name", "template_id", "url", "active"])
+                writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS + (["relationship"] if args.deep else []))
                 writer.writeheader()
                 writer.writerows(output_rows)
         print(f"Results saved to {output_path}")
@@ -2,12 +2,26 @@ import os
 import csv
 import argparse
 import json
-from collections import deque
-from simple_salesforce import Salesforce
 try:
     from . import copado_helper as helper
+    from . import template_graph
+    from . import template_index
+    from . import row_stream
+    from . import crawl_checkpoint
+    from . import metrics
+    from . import multi_org
+    from .template_cache import TemplateCache, DEFAULT_MAX_MB
+    from .label_cache import LabelCache, LabelResolver, label_cache_path, DEFAULT_TTL_HOURS
 except ImportError:
     import copado_helper as helper
+    import template_graph
+    import template_index
+    import row_stream
+    import crawl_checkpoint
+    import metrics
+    import multi_org
+    from template_cache import TemplateCache, DEFAULT_MAX_MB
+    from label_cache import LabelCache, LabelResolver, label_cache_path, DEFAULT_TTL_HOURS
 
 def add_args(parser):
     """Adds arguments to the provided parser."""
@@ -23,18 +37,72 @@ def add_args(parser):
 
   # Run with JSON input and custom output path
   mxp -u cpdXpress -t '["Template A", "Template B"]' -o ./export/results.csv
+
+  # Download up to 16 templates at a time
+  mxp -u cpdXpress -t "MADD Stress Main" --concurrency 16
+
+  # Keep the template cache in a shared folder, or bypass it entirely
+  mxp -u cpdXpress -t "MADD Stress Main" --cache-dir ~/.mxp/templates
+  mxp -u cpdXpress -t "MADD Stress Main" --no-cache
+
+  # Answer from the local template index built by 'mxp index build'
+  mxp -u cpdXpress -t "MADD Stress Main" --offline
+  mxp -u cpdXpress -t "MADD Stress Main" --index ./snapshots/cpdXpress.sqlite
+
+  # Refresh the cached object labels if they are older than one hour
+  mxp -u cpdXpress -t "MADD Stress Main" --label-ttl-hours 1
+
+  # Continue a run that was interrupted (e.g. by a dropped VPN connection)
+  mxp -u cpdXpress --resume objects_list.csv.checkpoint
+
+  # Run against several orgs at once and merge the results
+  mxp -u "dev1,dev2,prod" -t "MADD Stress Main"
+  mxp --alias-file orgs.txt -t "MADD Stress Main" --org-workers 4
+
+  # Write rows as templates are processed (NDJSON, or unsorted CSV)
+  mxp -u cpdXpress -t "MADD Stress Main" --ndjson
+  mxp -u cpdXpress -t "MADD Stress Main" --stream --sort --sort-buffer-rows 50000
 """
 
     auth_group = parser.add_argument_group('Authentication')
-    auth_group.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias (e.g., cpdXpress)")
+    auth_group.add_argument("-u", "--username", required=False, help="Salesforce CLI Org Alias (e.g., cpdXpress).\nSeveral orgs: a comma-separated list or JSON array; their\nresults are merged into one output with an 'org' column.")
+    auth_group.add_argument("--no-session-cache", action="store_true", help="Ignore the cached session and fetch fresh credentials from the SF CLI.")
+    multi_org.add_args(auth_group)
 
     input_group = parser.add_argument_group('Input (At least one required)')
     input_group.add_argument("-t", "--templates", required=False, nargs='+', metavar="NAME", help="List of Root Template Names.\nAccepts space-separated strings or a JSON array.")
     input_group.add_argument("-i", "--recordId", required=False, nargs='+', metavar="ID", help="List of Root Template Record IDs.\nAccepts space-separated IDs or a JSON array.")
 
     output_group = parser.add_argument_group('Output')
-    output_group.add_argument("-o", "--output", default=None, metavar="PATH", help="Path to output file.\nDefault: objects_list.csv (or .json)")
+    output_group.add_argument("-o", "--output", default=None, metavar="PATH", help="Path to output file.\nDefault: objects_list.csv (or .json / .ndjson)")
     output_group.add_argument("--json", action="store_true", help="Output results in JSON format instead of CSV.")
+    output_group.add_argument("--ndjson", action="store_true", help="Stream results as newline-delimited JSON, one row per line,\nwritten as soon as each template is processed.")
+    output_group.add_argument("--stream", action="store_true", help="Stream results as unsorted CSV, written as soon as each\ntemplate is processed.")
+    output_group.add_argument("--sort", action="store_true", help="With --ndjson or --stream, sort the streamed rows into the\nusual order at the end using an on-disk merge sort.")
+    output_group.add_argument("--sort-buffer-rows", type=int, default=row_stream.DEFAULT_SORT_BUFFER_ROWS, metavar="N", help=f"Rows held in memory by --sort before spilling a sorted run\nto disk. Default: {row_stream.DEFAULT_SORT_BUFFER_ROWS}")
+
+    resume_group = parser.add_argument_group('Checkpoint')
+    resume_group.add_argument("--checkpoint", default=None, metavar="PATH", help="File the crawl state is saved to after every level.\nDefault: <output>.checkpoint (removed once results are written)")
+    resume_group.add_argument("--resume", default=None, metavar="CHECKPOINT", help="Continue an interrupted run from its checkpoint file without\ndownloading already processed templates again.")
+
+    index_group = parser.add_argument_group('Offline Index')
+    index_group.add_argument("--offline", action="store_true", help="Answer from the local template index of the org instead of\nSalesforce (see 'mxp index build').")
+    index_group.add_argument("--index", default=None, metavar="PATH", help="Path to the template index to answer from (implies --offline).\nDefault: ~/.mxp/index/<alias>.sqlite")
+
+    perf_group = parser.add_argument_group('Performance')
+    perf_group.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N\nSalesforce API calls.")
+    perf_group.add_argument("--concurrency", type=int, default=helper.DEFAULT_CONCURRENCY, metavar="N", help=f"Number of template downloads run in parallel.\nDefault: {helper.DEFAULT_CONCURRENCY}")
+
+    cache_group = parser.add_argument_group('Template Cache')
+    cache_group.add_argument("--cache-dir", default=None, metavar="PATH", help="Folder for cached template files.\nDefault: ./Temp_Template_Files")
+    cache_group.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_MB, metavar="MB", help=f"Size cap of the template cache; least recently used\ntemplates are evicted beyond it. Default: {DEFAULT_MAX_MB}")
+    cache_group.add_argument("--cache-compress", action="store_true", help="Store cached template files gzip-compressed.")
+    cache_group.add_argument("--cache-pretty", action="store_true", help="Store cached template files indented, for reading by hand.\nCosts an extra parse and write per downloaded template.")
+    cache_group.add_argument("--no-cache", action="store_true", help="Download every template and do not read or write the cache.")
+
+    label_group = parser.add_argument_group('Label Cache')
+    label_group.add_argument("--label-ttl-hours", type=float, default=DEFAULT_TTL_HOURS, metavar="HOURS", help=f"Age after which the cached object labels of the org are\nreloaded from describeGlobal. Default: {DEFAULT_TTL_HOURS}")
+    label_group.add_argument("--no-label-cache", action="store_true", help="Do not read or write the on-disk object label cache.")
 
 def get_arg_parser():
     parser = argparse.ArgumentParser(
@@ -44,208 +112,475 @@ def get_arg_parser():
     add_args(parser)
     return parser
 
+def resolve_roots(root_template_names, root_template_ids, ids_by_names, names_by_ids):
+    """
+    Resolves the root templates given by name and by Id.
+    ids_by_names / names_by_ids: bulk lookups with the contract of
+    copado_helper.get_template_ids_by_names / get_template_names_by_ids.
+    Returns: list of (input root name, template Id) in input order.
+    """
+    roots = []
+
+    # 1. Process Names
+    if root_template_names:
+        print(f"Processing Names: {root_template_names}")
+        root_ids = ids_by_names(root_template_names)
+        for root_name in root_template_names:
+            root_id = root_ids.get(root_name)
+            if root_id:
+                roots.append((root_name, root_id))
+                print(f" -> Enqueued Root: {root_name}")
+            else:
+                print(f"Error: Root template '{root_name}' not found. Check spelling and quotes.")
+
+    # 2. Process IDs
+    if root_template_ids:
+        print(f"Processing IDs: {root_template_ids}")
+        root_names = names_by_ids(root_template_ids)
+        for root_id in root_template_ids:
+            root_name = root_names.get(root_id)
+            if root_name:
+                roots.append((root_name, root_id))
+                print(f" -> Enqueued Root ID: {root_id} ({root_name})")
+            else:
+                print(f"Error: Root template ID '{root_id}' not found.")
+
+    return roots
+
+def collect_rows(root_contexts, adjacency, template_names, template_objects, discovery_order):
+    """
+    Builds the output rows of every root: each template reachable from a root
+    belongs to that root's hierarchy. Templates without a parsed Template
+    Detail are skipped.
+    """
+    csv_rows = []
+    reachability = template_graph.ReachabilityIndex(adjacency)
+    for input_root_name, root_ids in root_contexts.items():
+        members = set()
+        for root_id in root_ids:
+            members |= reachability.reachable(root_id)
+        for t_id in sorted(members, key=lambda t: discovery_order.get(t, 0)):
+            if t_id not in template_objects:
+                continue
+            main_object = template_objects[t_id]
+            csv_rows.append({
+                "input_template": input_root_name,
+                "object_api": main_object if main_object else "",
+                "template_name": template_names.get(t_id, t_id),
+                "template_id": t_id,
+                "is_root": t_id in root_ids
+            })
+        print(f"Root '{input_root_name}': {len(members)} template(s) in hierarchy.")
+    return csv_rows
+
+def write_results(csv_rows, labels_map, csv_path, json_output, ndjson=False):
+    """Labels, sorts and writes the rows to CSV, JSON or NDJSON. Returns True once the file is written."""
+    try:
+        for row in csv_rows:
+            api_name = row['object_api']
+            row['object_label'] = labels_map.get(api_name, api_name) if api_name else ""
+
+        # CHANGED: Added 'Input Template Name' to headers
+        headers = ['Input Template Name', 'Object Label', 'Object API Name', 'Template Name', 'Template Id', 'Root Template']
+        
+        # Sort by Input Template, then Object Label
+        csv_rows.sort(key=lambda x: (x['input_template'], x['object_label'] is None, x['object_label']))
+
+        if ndjson:
+            writer = row_stream.RowWriter(csv_path, ndjson=True)
+            try:
+                for row in csv_rows:
+                    writer.write(row)
+            finally:
+                writer.close()
+            print(f"Successfully wrote {len(csv_rows)} rows to: {csv_path}")
+        elif json_output:
+            with open(csv_path, mode='w', encoding='utf-8') as f:
+                json.dump(csv_rows, f, indent=4)
+            print(f"Successfully wrote {len(csv_rows)} records to JSON: {csv_path}")
+        else:
+            with open(csv_path, mode='w', newline='', encoding='utf-8') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=headers)
+                writer.writeheader()
+                
+                for row in csv_rows:
+                    writer.writerow({
+                        'Input Template Name': row['input_template'], # New Column
+                        'Object Label': row['object_label'],
+                        'Object API Name': row['object_api'],
+                        'Template Name': row['template_name'],
+                        'Template Id': row['template_id'],
+                        'Root Template': row['is_root']
+                    })
+                    
+            print(f"Successfully wrote {len(csv_rows)} rows to: {csv_path}")
+        return True
+        
+    except IOError as e:
+        print(f"Error writing CSV file: {e}")
+        return False
+
 def run(args):
     # --- 1. Parameters ---
-    if not args.templates and not args.recordId:
+    if not args.templates and not args.recordId and not args.resume:
         print("Error: At least one of --templates or --recordId is required.")
         return
 
+    if args.output:
+        CSV_OUTPUT_FILE = args.output
+    elif args.ndjson:
+        CSV_OUTPUT_FILE = "objects_list.ndjson"
+    else:
+        CSV_OUTPUT_FILE = "objects_list.json" if args.json else "objects_list.csv"
+
+    aliases = multi_org.resolve_aliases(args)
+    if aliases is None:
+        return
+    if args.resume and len(aliases) > 1:
+        print("Error: --resume continues the run of a single org.")
+        return
+    output_format = "ndjson" if args.ndjson else ("json" if args.json else "csv")
+    if multi_org.fan_out_if_needed(run, args, CSV_OUTPUT_FILE, output_format, aliases=aliases):
+        return
     ORG_ALIAS = args.username
 
     ROOT_TEMPLATE_NAMES = helper.parse_arg_list(args.templates)
     ROOT_TEMPLATE_IDS = helper.parse_arg_list(args.recordId)
+
+    resumed = None
+    if args.resume:
+        if args.offline or args.index:
+            print("Error: --resume cannot be combined with --offline or --index.")
+            return
+        resumed = crawl_checkpoint.load_checkpoint(args.resume, ORG_ALIAS)
+        if resumed is None:
+            return
+        inputs = {"templates": ROOT_TEMPLATE_NAMES, "recordId": ROOT_TEMPLATE_IDS}
+        if (ROOT_TEMPLATE_NAMES or ROOT_TEMPLATE_IDS) and inputs != resumed[0]:
+            print(f"Error: Checkpoint {args.resume} was started for other templates: {resumed[0]}")
+            return
+        ROOT_TEMPLATE_NAMES, ROOT_TEMPLATE_IDS = resumed[0]["templates"], resumed[0]["recordId"]
     
+    CONCURRENCY = max(1, args.concurrency)
+
     ATTACHMENT_NAME = "Template Detail"
     TEMP_FOLDER_NAME = "Temp_Template_Files"
-    if args.output:
-        CSV_OUTPUT_FILE = args.output
-    else:
-        CSV_OUTPUT_FILE = "objects_list.json" if args.json else "objects_list.csv"
     
     # Define Paths
     # Use current working directory for output files
     base_dir = os.getcwd()
-    templates_dir = os.path.join(base_dir, TEMP_FOLDER_NAME)
+    templates_dir = os.path.join(base_dir, os.path.expanduser(args.cache_dir or TEMP_FOLDER_NAME))
     csv_path = os.path.join(base_dir, CSV_OUTPUT_FILE)
+    checkpoint_path = args.checkpoint or args.resume or crawl_checkpoint.default_checkpoint_path(csv_path)
 
     # Ensure output directory exists
     output_dir = os.path.dirname(csv_path)
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
-    os.makedirs(templates_dir, exist_ok=True)
-    print(f"File storage set to: {templates_dir}")
+    if args.offline or args.index:
+        run_offline(args, ROOT_TEMPLATE_NAMES, ROOT_TEMPLATE_IDS, csv_path)
+        return
+
+    if args.no_cache:
+        cache = None
+        print("Template cache disabled.")
+    else:
+        cache = TemplateCache(templates_dir, max_bytes=args.cache_max_mb * 1024 * 1024,
+                              compress=args.cache_compress, pretty=args.cache_pretty)
+        print(f"Template cache set to: {templates_dir}")
 
     # --- 2. Authentication ---
+    metrics.start_phase("auth")
     print(f"Logging into {ORG_ALIAS}...")
     try:
-        access_token, instance_url = helper.get_sf_cli_credentials(ORG_ALIAS)
-        sf = Salesforce(instance_url=instance_url, session_id=access_token)
+        sf, instance_url = helper.connect(ORG_ALIAS, use_cache=not args.no_session_cache, pool_size=CONCURRENCY,
+                                          max_api_calls=args.max_api_calls)
         print("Successfully connected to Salesforce.\n")
     except Exception as e:
         print("Authentication failed. Exiting.")
         return
 
+    # Object labels are resolved in the background while templates are crawled
+    label_path = None if args.no_label_cache else label_cache_path(instance_url)
+    label_cache = LabelCache(label_path, ttl=args.label_ttl_hours * 3600)
+    label_resolver = LabelResolver(sf, label_cache)
+
     # --- 3. Queue Initialization ---
-    # CHANGED: Visited set now tracks (template_id, input_root_name)
-    # This ensures a sub-template is processed for EACH root it belongs to, but avoids infinite loops within that root's tree.
-    visited_entries = set() 
-    csv_rows = []
+    # The hierarchy of all roots is crawled once as a single graph keyed by
+    # template Id, so templates shared between roots are fetched only once.
+    # Per-root rows are derived from graph reachability afterwards.
+    template_names = {}      # Id -> Name
+    template_objects = {}    # Id -> main object, for successfully parsed templates
+    adjacency = {}           # Id -> [referenced template Ids] (children, then parents)
+    discovery_order = {}     # Id -> position in crawl order
+
+    # Root contexts: input root name -> [root template Ids]
+    root_contexts = {}
     
-    # Queue stores tuples: (template_id, template_name, input_root_name)
-    processing_queue = deque()
-
-    print(f"Resolving Root Templates...")
-
-    # 1. Process Names
-    if ROOT_TEMPLATE_NAMES:
-        print(f"Processing Names: {ROOT_TEMPLATE_NAMES}")
-        for root_name in ROOT_TEMPLATE_NAMES:
-            root_id = helper.get_template_id_by_name(sf, root_name)
-            
-            if root_id:
-                # Enqueue with the root name as the context source
-                processing_queue.append((root_id, root_name, root_name))
-                print(f" -> Enqueued Root: {root_name}")
-            else:
-                print(f"Error: Root template '{root_name}' not found. Check spelling and quotes.")
-
-    # 2. Process IDs
-    if ROOT_TEMPLATE_IDS:
-        print(f"Processing IDs: {ROOT_TEMPLATE_IDS}")
-        for root_id in ROOT_TEMPLATE_IDS:
-            try:
-                # Query Name to ensure consistent data structure
-                rec = sf.query(f"SELECT Name FROM copado__Data_Template__c WHERE Id='{root_id}' LIMIT 1")
-                if rec['totalSize'] > 0:
-                    root_name = rec['records'][0]['Name']
-                    processing_queue.append((root_id, root_name, root_name))
-                    print(f" -> Enqueued Root ID: {root_id} ({root_name})")
-                else:
-                    print(f"Error: Root template ID '{root_id}' not found.")
-            except Exception as e:
-                print(f"Error resolving Root template ID '{root_id}': {e}")
+    # Frontier stores tuples: (template_id, template_name)
+    # The whole frontier is processed one level at a time so that template
+    # names can be resolved in bulk instead of one query per reference.
+    frontier = []
+
+    def enqueue(t_id, t_name):
+        if t_id not in discovery_order:
+            discovery_order[t_id] = len(discovery_order)
+            frontier.append((t_id, t_name))
+
+    level = 0
+    if resumed:
+        # Continue after the last completed level; its templates are not downloaded again
+        state = resumed[1]
+        level = state["level"]
+        root_contexts.update(state["root_contexts"])
+        template_names.update(state["template_names"])
+        template_objects.update(state["template_objects"])
+        adjacency.update(state["adjacency"])
+        discovery_order.update(state["discovery_order"])
+        frontier.extend(state["frontier"])
+        label_resolver.request(list(template_objects.values()))
+        print(f"Resumed from {args.resume}: {len(template_objects)} template(s) processed, "
+              f"{len(frontier)} queued at level {level + 1}.")
+    else:
+        metrics.start_phase("resolve_roots")
+        print(f"Resolving Root Templates...")
+
+        roots = resolve_roots(ROOT_TEMPLATE_NAMES, ROOT_TEMPLATE_IDS,
+                              lambda names: helper.get_template_ids_by_names(sf, names),
+                              lambda ids: helper.get_template_names_by_ids(sf, ids))
+        for root_name, root_id in roots:
+            # Enqueue with the root name as the context source
+            root_contexts.setdefault(root_name, []).append(root_id)
+            template_names.setdefault(root_id, root_name)
+            enqueue(root_id, root_name)
+
+    # Streaming: a row is written as soon as a template is both processed and
+    # known to be reachable from a root, instead of after the whole crawl.
+    stream = None
+    membership = template_graph.RootMembership(adjacency)
+    if args.ndjson or args.stream:
+        try:
+            stream = row_stream.RowWriter(csv_path, ndjson=args.ndjson)
+        except IOError as e:
+            print(f"Error writing output file: {e}")
+            return
+
+    def stream_rows(t_id, root_names):
+        if stream is None or t_id not in template_objects:
+            return
+        main_object = template_objects[t_id] or ""
+        for root_name in sorted(root_names):
+            # Provisional label; the final pass writes the resolved one
+            stream.write({
+                "input_template": root_name,
+                "object_label": label_cache.labels.get(main_object, main_object),
+                "object_api": main_object,
+                "template_name": template_names.get(t_id, t_id),
+                "template_id": t_id,
+                "is_root": t_id in root_contexts[root_name]
+            })
+
+    if stream is not None:
+        # After a resume, this also writes the rows of templates processed before
+        for root_name, root_ids in root_contexts.items():
+            for root_id in root_ids:
+                for t_id, added in membership.add_roots(root_id, [root_name]):
+                    stream_rows(t_id, added)
 
     # --- 4. Processing Loop ---
+    metrics.start_phase("crawl")
     print("\nStarting recursive template processing...")
-
-    while processing_queue:
-        # CHANGED: Unpack 3 values including the input root context
-        current_id, current_name, input_root_name = processing_queue.popleft()
-
-        # Check visitation context specific to this root
-        if (current_id, input_root_name) in visited_entries:
-            continue
-
-        visited_entries.add((current_id, input_root_name))
-
-        # Download (Helper function remains the same)
-        template_json = helper.get_attachment_by_record_id(
-            sf, 
-            instance_url, 
-            access_token, 
-            current_id, 
-            ATTACHMENT_NAME, 
-            templates_dir,
-            file_alias=current_name
+    print(f"Crawl state is saved after every level to {checkpoint_path}\n"
+          f"(continue an interrupted run with --resume {checkpoint_path})")
+
+    while frontier:
+        level += 1
+        level_entries = frontier
+        frontier = []
+        print(f"\n--- Level {level}: {len(level_entries)} template(s) ---")
+
+        # Download the whole level in parallel, then process it in queue order
+        downloads = helper.download_attachments(
+            sf,
+            instance_url,
+            sf.session_id,
+            level_entries,
+            ATTACHMENT_NAME,
+            None,
+            concurrency=CONCURRENCY,
+            cache=cache
         )
 
-        if not template_json:
-            print(f"   -> [WARNING] Could not download/parse JSON for: {current_name}")
-            continue
+        # References found on this level: Id -> [(ref_id, ref_name or None)]
+        # Children carry None until their name is resolved after the level.
+        level_refs = {}
+        for current_id, current_name in level_entries:
+            template_json = downloads.get(current_id)
+            adjacency[current_id] = []
+
+            if not template_json:
+                print(f"   -> [WARNING] Could not download/parse JSON for: {current_name}")
+                continue
+
+            # A. Extract Info (main object, children and parents in one pass)
+            main_object, children, parents = helper.extract_template_info(template_json)
+            template_objects[current_id] = main_object
+            stream_rows(current_id, membership.roots(current_id))
+
+            # Log output
+            obj_str = f"(Obj: {main_object})" if main_object else "(Obj: None)"
+            helper.log_detail(f"   -> Processed: {current_name} {obj_str}")
+
+            # B. Collect Children and Parents
+            refs = []
+            for child in children:
+                c_id = child.get('templateId')
+                if c_id:
+                    refs.append((c_id, None))
+            for parent in parents:
+                p_id = parent.get('templateId')
+                if p_id:
+                    refs.append((p_id, parent.get('templateName')))
+            level_refs[current_id] = refs
+
+        # Queue label lookups for this level's objects in the background
+        label_resolver.request([template_objects.get(t_id) for t_id, _ in level_entries])
+
+        # C. Resolve all unknown child names for the next level at once
+        unknown_ids = [r_id for refs in level_refs.values() for r_id, r_name in refs if r_name is None and r_id not in template_names]
+        if unknown_ids:
+            template_names.update(helper.get_template_names_by_ids(sf, unknown_ids))
+
+        # D. Record edges and enqueue templates not seen before
+        for current_id, refs in level_refs.items():
+            for r_id, r_name in refs:
+                if r_name is None:
+                    r_name = template_names.get(r_id)
+                    if r_name is None:
+                        print(f"      -> Error resolving child {r_id}: template not found")
+                        continue
+                else:
+                    template_names.setdefault(r_id, r_name)
+                adjacency[current_id].append(r_id)
+                if stream is not None:
+                    for t_id, added in membership.add_edge(current_id, r_id):
+                        stream_rows(t_id, added)
+                enqueue(r_id, template_names[r_id])
+
+        if stream is not None:
+            stream.flush()
+
+        try:
+            crawl_checkpoint.save_checkpoint(
+                checkpoint_path, ORG_ALIAS, {"templates": ROOT_TEMPLATE_NAMES, "recordId": ROOT_TEMPLATE_IDS},
+                {"level": level, "root_contexts": root_contexts, "template_names": template_names,
+                 "template_objects": template_objects, "adjacency": adjacency,
+                 "discovery_order": discovery_order, "frontier": frontier})
+        except IOError as e:
+            print(f"Warning: Could not save checkpoint: {e}")
+
+    # --- 4b. Per-root closures ---
+    if stream is not None:
+        stream.close()
+        csv_rows = None
+        for root_name in root_contexts:
+            members = sum(1 for roots_of in membership.roots_of.values() if root_name in roots_of)
+            print(f"Root '{root_name}': {members} template(s) in hierarchy.")
+    else:
+        csv_rows = collect_rows(root_contexts, adjacency, template_names, template_objects, discovery_order)
 
-        # A. Extract Info
-        main_object = helper.get_main_object(template_json)
-        
-        # CHANGED: Root check compares current name to the context name
-        is_root = (current_name == input_root_name)
-
-        row_data = {
-            "input_template": input_root_name,    # New Data Point
-            "object_api": main_object if main_object else "",
-            "template_name": current_name,
-            "template_id": current_id,
-            "is_root": is_root
-        }
-        csv_rows.append(row_data)
-
-        # Log output
-        obj_str = f"(Obj: {main_object})" if main_object else "(Obj: None)"
-        print(f"   -> [{input_root_name}] Processed: {current_name} {obj_str}")
-
-        # B. Enqueue Children
-        children = helper.get_child_relationships(template_json)
-        for child in children:
-            c_id = child.get('templateId')
-            # Check if this specific child has been visited *for this specific root*
-            if c_id and (c_id, input_root_name) not in visited_entries:
-                try:
-                    c_rec = sf.query(f"SELECT Name FROM copado__Data_Template__c WHERE Id='{c_id}' LIMIT 1")
-                    if c_rec['totalSize'] > 0:
-                        c_name = c_rec['records'][0]['Name']
-                        # Pass input_root_name forward
-                        processing_queue.append((c_id, c_name, input_root_name))
-                except Exception as e:
-                    print(f"      -> Error resolving child {c_id}: {e}")
-
-        # C. Enqueue Parents
-        parents = helper.get_parent_relationships(template_json)
-        for parent in parents:
-            p_id = parent.get('templateId')
-            p_name = parent.get('templateName')
-            if p_id and (p_id, input_root_name) not in visited_entries:
-                # Pass input_root_name forward
-                processing_queue.append((p_id, p_name, input_root_name))
+    if cache is not None:
+        print(f"\nTemplate cache: {cache.hits} hit(s), {cache.misses} miss(es).")
+        try:
+            cache.save()
+        except IOError as e:
+            print(f"Warning: Could not save template cache: {e}")
 
     # --- 5. Export to CSV ---
     print("\n" + "="*30)
     print("SAVING RESULTS")
     print("="*30)
     
-    try:
+    if stream is not None:
+        all_api_names = [obj for obj in template_objects.values() if obj]
+    else:
         all_api_names = [row['object_api'] for row in csv_rows if row['object_api']]
-        
-        print("Fetching Object Labels from Salesforce...")
-        labels_map = helper.get_object_labels(sf, all_api_names)
-        
-        for row in csv_rows:
-            api_name = row['object_api']
-            row['object_label'] = labels_map.get(api_name, api_name) if api_name else ""
 
-        # CHANGED: Added 'Input Template Name' to headers
-        headers = ['Input Template Name', 'Object Label', 'Object API Name', 'Template Name', 'Template Id', 'Root Template']
-        
-        # Sort by Input Template, then Object Label
-        csv_rows.sort(key=lambda x: (x['input_template'], x['object_label'] is None, x['object_label']))
+    metrics.start_phase("labels")
+    print("Resolving Object Labels...")
+    labels_map = label_resolver.labels(all_api_names)
+    try:
+        label_cache.save()
+    except IOError as e:
+        print(f"Warning: Could not save label cache: {e}")
 
-        if args.json:
-            with open(csv_path, mode='w', encoding='utf-8') as f:
-                json.dump(csv_rows, f, indent=4)
-            print(f"Successfully wrote {len(csv_rows)} records to JSON: {csv_path}")
-        else:
-            with open(csv_path, mode='w', newline='', encoding='utf-8') as csv_file:
-                writer = csv.DictWriter(csv_file, fieldnames=headers)
-                writer.writeheader()
-                
-                for row in csv_rows:
-                    writer.writerow({
-                        'Input Template Name': row['input_template'], # New Column
-                        'Object Label': row['object_label'],
-                        'Object API Name': row['object_api'],
-                        'Template Name': row['template_name'],
-                        'Template Id': row['template_id'],
-                        'Root Template': row['is_root']
-                    })
-                    
-            print(f"Successfully wrote {len(csv_rows)} rows to: {csv_path}")
-        
+    metrics.start_phase("write")
+    if stream is not None:
+        written = finalize_stream(args, csv_path, labels_map, discovery_order)
+    else:
+        written = write_results(csv_rows, labels_map, csv_path, args.json, ndjson=args.ndjson)
+    if written:
+        crawl_checkpoint.remove_checkpoint(checkpoint_path)
+
+def finalize_stream(args, csv_path, labels_map, discovery_order):
+    """
+    Fills in the final labels of a streamed file and, with --sort, restores
+    the usual order. Returns True once the file is written.
+    """
+    sort_key = None
+    if args.sort:
+        print("Sorting streamed rows...")
+        sort_key = lambda row: (row['input_template'], row['object_label'], discovery_order.get(row['template_id'], 0))
+    try:
+        count = row_stream.finalize(csv_path, labels_map, ndjson=args.ndjson, sort_key=sort_key,
+                                    buffer_rows=args.sort_buffer_rows)
+        print(f"Successfully wrote {count} rows to: {csv_path}")
+        return True
     except IOError as e:
-        print(f"Error writing CSV file: {e}")
+        print(f"Error writing output file: {e}")
+        return False
+
+def run_offline(args, root_template_names, root_template_ids, csv_path):
+    """Answers from the local template index instead of crawling Salesforce."""
+    metrics.start_phase("index")
+    index_path = os.path.expanduser(args.index or template_index.default_index_path(args.username))
+    index = template_index.open_index(index_path)
+    if index is None:
+        return
+
+    try:
+        print("Resolving Root Templates...")
+        roots = resolve_roots(root_template_names, root_template_ids,
+                              index.get_template_ids_by_names, index.get_template_names_by_ids)
+        template_names, template_objects, adjacency = index.load_graph()
+
+        root_contexts = {}
+        root_names = {}
+        for root_name, root_id in roots:
+            root_id = index.resolve_id(root_id) or root_id
+            root_contexts.setdefault(root_name, []).append(root_id)
+            root_names.setdefault(root_id, root_name)
+        # Roots are listed under their input name, as in a live crawl
+        template_names.update(root_names)
+
+        discovery_order = template_graph.breadth_first_order(list(root_names), adjacency)
+        csv_rows = collect_rows(root_contexts, adjacency, template_names, template_objects, discovery_order)
+        labels_map = index.get_labels([row['object_api'] for row in csv_rows])
+    finally:
+        index.close()
+
+    print("\n" + "="*30)
+    print("SAVING RESULTS")
+    print("="*30)
+    metrics.start_phase("write")
+    write_results(csv_rows, labels_map, csv_path, args.json, ndjson=args.ndjson)
 
 def main():
     parser = get_arg_parser()
+    metrics.add_args(parser)
     args = parser.parse_args()
-    run(args)
+    metrics.run_instrumented(run, args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os
+import csv
+import argparse
+import json
+try:
+    from . import copado_helper as helper
+    from . import template_graph
+    from . import template_index
+except ImportError:
+    import copado_helper as helper
+    import template_graph
+    import template_index
+
+def add_args(parser):
+    """Adds arguments to the provided parser."""
+    parser.epilog = """EXAMPLES:
+  # Which hierarchies include this template?
+  mxp template get template dependents -u cpdXpress -i a0UQH000005LJXs2AO
+
+  # Several templates, by name or Id, answered from a specific index file
+  mxp template get template dependents -u cpdXpress -t "Shared Contacts" -i a0UQH000005MrUD2A0 --index ./snapshots/cpdXpress.sqlite
+"""
+
+    auth_group = parser.add_argument_group('Org')
+    auth_group.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias whose template index is used (e.g., cpdXpress)")
+    auth_group.add_argument("--index", default=None, metavar="PATH", help="Path to the template index.\nDefault: ~/.mxp/index/<alias>.sqlite")
+
+    input_group = parser.add_argument_group('Input (At least one required)')
+    input_group.add_argument("-t", "--templates", required=False, nargs='+', metavar="NAME", help="List of Template Names.\nAccepts space-separated strings or a JSON array.")
+    input_group.add_argument("-i", "--recordId", required=False, nargs='+', metavar="ID", help="List of Template Record IDs.\nAccepts space-separated IDs or a JSON array.")
+
+    output_group = parser.add_argument_group('Output')
+    output_group.add_argument("-o", "--output", default=None, metavar="PATH", help="Path to output file.\nDefault: template_dependents.csv (or .json)")
+    output_group.add_argument("--json", action="store_true", help="Output results in JSON format instead of CSV.")
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="List the template hierarchies that include a Copado Data Template",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    add_args(parser)
+    return parser
+
+def reverse_adjacency(adjacency):
+    """Returns { node: [nodes with an edge to node] } for a graph { node: [successor, ...] }."""
+    reverse = {node: [] for node in adjacency}
+    for node, successors in adjacency.items():
+        for succ in successors:
+            reverse.setdefault(succ, []).append(node)
+    return reverse
+
+def find_dependents(index, template_ids):
+    """
+    Returns { template Id: [Ids of other templates whose hierarchy reaches it] }.
+    Closures are memoized per strongly connected component of the reverse graph
+    and cached in the index until its next build or refresh, so repeated
+    lookups only read their result.
+    """
+    results = {}
+    reachability = None
+    for t_id in template_ids:
+        cached = index.get_cached_dependents(t_id)
+        if cached is not None:
+            results[t_id] = cached
+            continue
+        if reachability is None:
+            _, _, adjacency = index.load_graph()
+            reachability = template_graph.ReachabilityIndex(reverse_adjacency(adjacency))
+        dependents = sorted(reachability.reachable(t_id) - {t_id})
+        index.put_cached_dependents(t_id, dependents)
+        results[t_id] = dependents
+    index.commit()
+    return results
+
+def run(args):
+    if not args.templates and not args.recordId:
+        print("Error: At least one of --templates or --recordId is required.")
+        return
+
+    template_names = helper.parse_arg_list(args.templates)
+    template_ids = helper.parse_arg_list(args.recordId)
+    if args.output:
+        output_path = args.output
+    else:
+        output_path = "template_dependents.json" if args.json else "template_dependents.csv"
+
+    index_path = os.path.expanduser(args.index or template_index.default_index_path(args.username))
+    index = template_index.open_index(index_path)
+    if index is None:
+        return
+
+    rows = []
+    try:
+        # Input template Id -> input label
+        targets = {}
+        if template_names:
+            found = index.get_template_ids_by_names(template_names)
+            for name in template_names:
+                if name in found:
+                    targets.setdefault(found[name], name)
+                else:
+                    print(f"Error: Template '{name}' not found in the index.")
+        for t_id in template_ids:
+            stored_id = index.resolve_id(t_id)
+            if stored_id:
+                targets.setdefault(stored_id, index.get_template_names_by_ids([stored_id])[stored_id])
+            else:
+                print(f"Error: Template ID '{t_id}' not found in the index.")
+
+        dependents = find_dependents(index, list(targets))
+        details = index.get_template_details({d_id for ids in dependents.values() for d_id in ids})
+        for t_id, input_name in targets.items():
+            # Top-level templates first, then by name
+            dep_rows = [(d_id,) + details.get(d_id, (d_id, None, None, False)) for d_id in dependents[t_id]]
+            dep_rows.sort(key=lambda r: (not r[4], r[1] or r[0]))
+            top_level_count = sum(1 for r in dep_rows if r[4])
+            print(f"'{input_name}' is reached from {len(dep_rows)} other template(s) ({top_level_count} top-level).")
+            for d_id, name, main_object, active, is_top_level in dep_rows:
+                rows.append({
+                    "template": input_name,
+                    "template_id": t_id,
+                    "dependent_name": name,
+                    "dependent_id": d_id,
+                    "dependent_object": main_object or "",
+                    "top_level": is_top_level,
+                    "active": active
+                })
+    finally:
+        index.close()
+
+    try:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if args.json:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, indent=4)
+        else:
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=["template", "template_id", "dependent_name", "dependent_id",
+                                                       "dependent_object", "top_level", "active"])
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"Results saved to {output_path}")
+    except IOError as e:
+        print(f"Error writing output file: {e}")
+
+def main():
+    parser = get_arg_parser()
+    args = parser.parse_args()
+    run(args)
+
+if __name__ == "__main__":
+    main()
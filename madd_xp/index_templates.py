@@ -0,0 +1,240 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+try:
+    from . import copado_helper as helper
+    from . import metrics
+    from .template_index import TemplateIndex, default_index_path, is_outdated, open_index
+    from .label_cache import LabelCache, LabelResolver, label_cache_path
+except ImportError:
+    import copado_helper as helper
+    import metrics
+    from template_index import TemplateIndex, default_index_path, is_outdated, open_index
+    from label_cache import LabelCache, LabelResolver, label_cache_path
+
+ATTACHMENT_NAME = "Template Detail"
+TEMPLATE_OBJECT = "copado__Data_Template__c"
+TEMPLATES_QUERY = "SELECT Id, Name, copado__Main_Object__c, copado__Active__c, SystemModstamp FROM copado__Data_Template__c"
+BATCH_SIZE = 200
+# Overlap of each refresh window with the previous one, against clock skew
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+def add_args(parser):
+    parser.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias")
+    parser.add_argument("--no-session-cache", action="store_true", help="Ignore the cached session and fetch fresh credentials from the SF CLI.")
+    parser.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N Salesforce API calls")
+    parser.add_argument("--index", default=None, metavar="PATH", help="Path to the index file. Default: ~/.mxp/index/<alias>.sqlite")
+    parser.add_argument("--concurrency", type=int, default=helper.DEFAULT_CONCURRENCY, metavar="N", help=f"Number of template downloads run in parallel. Default: {helper.DEFAULT_CONCURRENCY}")
+
+def index_templates(index, sf, instance_url, records, concurrency=helper.DEFAULT_CONCURRENCY):
+    """
+    Stores template records in the index in batches. A Template Detail is only
+    downloaded when the index has no parsed copy with the same Attachment
+    LastModifiedDate and BodyLength; otherwise just the record fields are updated.
+    Returns: number of Template Details downloaded and parsed.
+    """
+    parsed = 0
+    for done, batch in enumerate(helper.chunk_list(records, BATCH_SIZE), 1):
+        batch_ids = [r["Id"] for r in batch]
+        metadata = helper.get_attachment_metadata(sf, batch_ids, ATTACHMENT_NAME)
+        stored = index.get_attachment_stamps(batch_ids)
+
+        to_download = []
+        for record in batch:
+            attachment = metadata.get(record["Id"])
+            if attachment and stored.get(record["Id"]) == (attachment.get("LastModifiedDate"), attachment.get("BodyLength")):
+                index.update_record(record)
+            else:
+                to_download.append(record)
+
+        downloads = helper.download_attachments(
+            sf,
+            instance_url,
+            sf.session_id,
+            [(r["Id"], r.get("Name")) for r in to_download if r["Id"] in metadata],
+            ATTACHMENT_NAME,
+            None,
+            concurrency=concurrency,
+            metadata=metadata
+        )
+        for record in to_download:
+            detail = downloads.get(record["Id"])
+            index.put_template(record, metadata.get(record["Id"]), detail)
+            if detail:
+                parsed += 1
+        index.commit()
+        print(f" -> Indexed {min(done * BATCH_SIZE, len(records))}/{len(records)} templates")
+    return parsed
+
+def index_labels(index, sf, instance_url):
+    """Stores the labels of main objects in the index that have none yet."""
+    api_names = [row[0] for row in index.conn.execute(
+        "SELECT main_object FROM templates WHERE main_object IS NOT NULL "
+        "UNION SELECT detail_object FROM templates WHERE detail_object IS NOT NULL "
+        "EXCEPT SELECT api_name FROM labels"
+    )]
+    if not api_names:
+        return
+    label_cache = LabelCache(label_cache_path(instance_url))
+    index.put_labels(LabelResolver(sf, label_cache).labels(api_names))
+    try:
+        label_cache.save()
+    except IOError as e:
+        print(f"Warning: Could not save label cache: {e}")
+
+def query_changed_records(sf, index):
+    """
+    Returns the template records changed since the index was last synced:
+    records with a newer SystemModstamp, records whose Template Detail
+    Attachment has a newer LastModifiedDate, and records whose Template Detail
+    failed to download before.
+    """
+    changed = {}
+    templates_since = index.get_meta("templates_since")
+    query = TEMPLATES_QUERY
+    if templates_since:
+        query += f" WHERE SystemModstamp >= {helper.soql_datetime(templates_since)}"
+    for record in sf.query_all_iter(query):
+        changed[record["Id"]] = record
+
+    parent_ids = [t_id for t_id in index.get_missing_detail_ids() if t_id not in changed]
+    attachments_since = index.get_meta("attachments_since")
+    if attachments_since:
+        attachment_query = (
+            "SELECT ParentId FROM Attachment "
+            f"WHERE Name = '{ATTACHMENT_NAME}' AND Parent.Type = '{TEMPLATE_OBJECT}' "
+            f"AND LastModifiedDate >= {helper.soql_datetime(attachments_since)}"
+        )
+        parent_ids += [a["ParentId"] for a in sf.query_all_iter(attachment_query) if a["ParentId"] not in changed]
+    for chunk in helper.chunk_list(list(dict.fromkeys(parent_ids)), BATCH_SIZE):
+        for record in sf.query_all_iter(f"{TEMPLATES_QUERY} WHERE Id IN ({helper.format_in_clause(chunk)})"):
+            changed[record["Id"]] = record
+    return list(changed.values())
+
+def query_deleted_ids(sf, index, since):
+    """
+    Returns the Ids of indexed templates deleted since the last sync, from the
+    getDeleted resource. If Salesforce no longer has the window (the recycle bin
+    only covers the last few days), falls back to comparing all template Ids.
+    """
+    indexed = set(index.get_template_ids())
+    if since is not None:
+        try:
+            end = datetime.now(timezone.utc)
+            result = getattr(sf, TEMPLATE_OBJECT).deleted(since - REFRESH_OVERLAP, end)
+            return [r["id"] for r in result.get("deletedRecords", []) if r["id"] in indexed]
+        except Exception as e:
+            print(f"getDeleted not possible ({e}). Comparing all template Ids...")
+    live = {r["Id"] for r in sf.query_all_iter(f"SELECT Id FROM {TEMPLATE_OBJECT}")}
+    return [t_id for t_id in indexed if t_id not in live]
+
+def connect(args):
+    metrics.start_phase("auth")
+    print(f"Logging into {args.username}...")
+    try:
+        return helper.connect(args.username, use_cache=not args.no_session_cache, pool_size=max(1, args.concurrency),
+                              max_api_calls=args.max_api_calls)
+    except Exception as e:
+        print(f"Authentication failed: {e}")
+        return None, None
+
+def mark_synced(index, org_alias, instance_url, synced_at):
+    """
+    Records a completed build or refresh. The next refresh asks for changes
+    since the newest stamps stored now; they are only advanced here, once every
+    batch is in, so an interrupted run is picked up again in full.
+    """
+    for key, column in (("templates_since", "system_modstamp"), ("attachments_since", "attachment_modified")):
+        stamp = index.max_stamp(column)
+        if stamp:
+            index.set_meta(key, stamp)
+    index.set_meta("org_alias", org_alias)
+    index.set_meta("instance_url", instance_url)
+    index.set_meta("built_at", synced_at.timestamp())
+    index.set_meta("synced_at", synced_at.isoformat())
+
+def run(args):
+    org_alias = args.username
+    index_path = os.path.expanduser(args.index or default_index_path(org_alias))
+
+    sf, instance_url = connect(args)
+    if sf is None:
+        return
+
+    synced_at = datetime.now(timezone.utc)
+    metrics.start_phase("query")
+    print("Querying Data Templates...")
+    try:
+        records = list(sf.query_all_iter(TEMPLATES_QUERY))
+    except Exception as e:
+        print(f"Error querying templates: {e}")
+        return
+    print(f"Found {len(records)} templates.")
+
+    # Build next to the target and swap it in, so a failed build keeps the old index
+    tmp_path = f"{index_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    index = TemplateIndex(tmp_path)
+    try:
+        started = time.time()
+        metrics.start_phase("index")
+        parsed = index_templates(index, sf, instance_url, records, concurrency=max(1, args.concurrency))
+        metrics.start_phase("labels")
+        print("Indexing object labels...")
+        index_labels(index, sf, instance_url)
+        mark_synced(index, org_alias, instance_url, synced_at)
+        index.commit()
+    finally:
+        index.close()
+    os.replace(tmp_path, index_path)
+
+    print(f"Indexed {len(records)} templates ({parsed} with Template Detail) in {time.time() - started:.1f}s.")
+    print(f"Index saved to {index_path}")
+
+def run_refresh(args):
+    org_alias = args.username
+    index_path = os.path.expanduser(args.index or default_index_path(org_alias))
+    index = open_index(index_path, warn_outdated=False)
+    if index is None:
+        return
+    if is_outdated(index):
+        # Templates that did not change would keep the rows of the old schema
+        index.close()
+        print(f"{index_path} was built by an older mxp. Rebuilding it...")
+        run(args)
+        return
+
+    try:
+        sf, instance_url = connect(args)
+        if sf is None:
+            return
+
+        started = time.time()
+        synced_at = datetime.now(timezone.utc)
+        last_synced = index.get_meta("synced_at")
+        last_synced = datetime.fromisoformat(last_synced) if last_synced else None
+
+        metrics.start_phase("query")
+        print("Querying changed Data Templates and Template Details...")
+        try:
+            records = query_changed_records(sf, index)
+            deleted_ids = query_deleted_ids(sf, index, last_synced)
+        except Exception as e:
+            print(f"Error querying changes: {e}")
+            return
+        print(f"Found {len(records)} changed and {len(deleted_ids)} deleted template(s).")
+
+        metrics.start_phase("index")
+        parsed = index_templates(index, sf, instance_url, records, concurrency=max(1, args.concurrency)) if records else 0
+        removed = index.delete_templates(deleted_ids)
+        metrics.start_phase("labels")
+        index_labels(index, sf, instance_url)
+        mark_synced(index, org_alias, instance_url, synced_at)
+        index.commit()
+
+        print(f"Refreshed {len(records)} template(s) ({parsed} Template Detail download(s)), "
+              f"removed {removed}, in {time.time() - started:.1f}s.")
+        print(f"Index saved to {index_path}")
+    finally:
+        index.close()
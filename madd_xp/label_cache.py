@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+try:
+    from . import copado_helper as helper
+    from . import metrics
+except ImportError:
+    import copado_helper as helper
+    import metrics
+
+DEFAULT_TTL_HOURS = 24
+
+def label_cache_path(instance_url):
+    """Returns the label cache file of an org, keyed by its instance host."""
+    host = urlparse(instance_url).netloc or instance_url
+    safe_host = "".join([c for c in host if c.isalnum() or c in ('-', '_', '.')])
+    return os.path.join(helper.get_mxp_home(), "labels", f"{safe_host}.json")
+
+class LabelCache:
+    """
+    Per-org cache of sObject labels (API name -> Label).
+    The whole cache is refilled from a single describeGlobal call once it is
+    older than ttl seconds. With path=None the cache lives in memory only.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL_HOURS * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = 0
+        self.labels = {}
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.labels = dict(data["labels"])
+            self.fetched_at = float(data.get("fetched_at") or 0)
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            print(f"Warning: Ignoring unreadable label cache {self.path}: {e}")
+
+    def is_stale(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    def fill_from_describe(self, sf):
+        """Refreshes the cached labels from the describeGlobal list of every sObject."""
+        sobjects = sf.describe().get("sobjects", [])
+        self.labels.update({s["name"]: s["label"] for s in sobjects if s.get("name")})
+        self.fetched_at = time.time()
+
+    def missing(self, api_names):
+        return [n for n in dict.fromkeys(api_names) if n and n not in self.labels]
+
+    def save(self):
+        """Writes the cache to disk (no-op for in-memory caches)."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "fetched_at": self.fetched_at, "labels": self.labels}, f)
+        os.replace(tmp_path, self.path)
+
+class LabelResolver:
+    """
+    Resolves object labels on a background thread while templates are still
+    being crawled. A stale cache is refilled from describeGlobal first; names
+    it does not cover are looked up in EntityDefinition as they are requested.
+    All cache updates happen on the single worker thread.
+    """
+
+    def __init__(self, sf, cache):
+        self.sf = sf
+        self.cache = cache
+        self.requested = set()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+        if cache.is_stale():
+            self._futures.append(self._executor.submit(self._refill))
+
+    def _refill(self):
+        try:
+            self.cache.fill_from_describe(self.sf)
+        except helper.ApiBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f"Warning: Could not load object labels from describeGlobal: {e}")
+
+    def _resolve(self, api_names):
+        missing = self.cache.missing(api_names)
+        metrics.count_cache("labels", hits=len(set(api_names)) - len(missing), misses=len(missing))
+        if missing:
+            self.cache.labels.update(helper.get_object_labels(self.sf, missing))
+
+    def request(self, api_names):
+        """Queues label lookups for names that were not requested before."""
+        new_names = [n for n in api_names if n and n not in self.requested]
+        if new_names:
+            self.requested.update(new_names)
+            self._futures.append(self._executor.submit(self._resolve, new_names))
+
+    def labels(self, api_names):
+        """Waits for pending lookups and returns { 'API_Name': 'Label' } for api_names."""
+        self.request(api_names)
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._executor.shutdown()
+        return {n: self.cache.labels[n] for n in api_names if n in self.cache.labels}
@@ -0,0 +1,167 @@
+"""
+Run metrics for mxp commands. Commands mark the phase they are in with
+start_phase(); copado_helper records API calls, bytes, retries, cache
+lookups and timed steps against the current phase, from any thread.
+
+    mxp template get template objects -u cpdXpress -t "Main" --metrics run.json
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+_lock = threading.Lock()
+_phases = []
+_started = None
+_finished = None
+# Set by run_instrumented for --quiet; see copado_helper.log_detail
+quiet = False
+
+def add_args(parser):
+    """Adds the instrumentation options shared by every command."""
+    group = parser.add_argument_group('Instrumentation')
+    group.add_argument("--metrics", default=None, metavar="PATH", help="Write per-phase timings, API calls, bytes, retries and cache\nhits of the run to a JSON file.")
+    group.add_argument("--profile", default=None, metavar="PATH", help="Capture a cProfile of the run to PATH (open with pstats or snakeviz).")
+    group.add_argument("--quiet", action="store_true", help="Do not print a line per template.")
+
+def _new_phase(name):
+    return {
+        "name": name,
+        "seconds": 0.0,
+        "api_calls": Counter(),
+        "api_seconds": Counter(),
+        "bytes": 0,
+        "retries": 0,
+        "cache": {},
+        "timers": Counter(),
+        "_started": time.perf_counter()
+    }
+
+def reset():
+    global _started, _finished
+    with _lock:
+        _phases.clear()
+        _phases.append(_new_phase("setup"))
+        _started = time.perf_counter()
+        _finished = None
+
+def finish():
+    """Ends the current phase and the run's wall clock."""
+    global _finished
+    with _lock:
+        _finished = time.perf_counter()
+        if _phases:
+            _close(_phases[-1], _finished)
+
+def _close(phase, now):
+    if phase["_started"] is not None:
+        phase["seconds"] += now - phase["_started"]
+        phase["_started"] = None
+
+def start_phase(name):
+    """Ends the current phase and starts the named one."""
+    with _lock:
+        now = time.perf_counter()
+        if _phases:
+            _close(_phases[-1], now)
+        _phases.append(_new_phase(name))
+
+def _current():
+    if not _phases:
+        _phases.append(_new_phase("setup"))
+    return _phases[-1]
+
+def count_api_call(kind, seconds, nbytes):
+    with _lock:
+        phase = _current()
+        phase["api_calls"][kind] += 1
+        phase["api_seconds"][kind] += seconds
+        phase["bytes"] += nbytes
+
+def count_retry():
+    with _lock:
+        _current()["retries"] += 1
+
+def count_cache(name, hits=0, misses=0):
+    with _lock:
+        counts = _current()["cache"].setdefault(name, {"hits": 0, "misses": 0})
+        counts["hits"] += hits
+        counts["misses"] += misses
+
+def add_time(name, seconds):
+    """Adds seconds spent in a step (e.g. JSON parsing) that runs inside other phases."""
+    with _lock:
+        _current()["timers"][name] += seconds
+
+def report():
+    """Returns the metrics as a JSON-serializable dict, with totals over all phases."""
+    with _lock:
+        now = _finished or time.perf_counter()
+        phases = []
+        totals = _new_phase("total")
+        for phase in _phases:
+            seconds = phase["seconds"] + (now - phase["_started"] if phase["_started"] is not None else 0)
+            phases.append({
+                "name": phase["name"],
+                "seconds": round(seconds, 3),
+                "api_calls": dict(phase["api_calls"]),
+                "api_seconds": {k: round(v, 3) for k, v in phase["api_seconds"].items()},
+                "bytes": phase["bytes"],
+                "retries": phase["retries"],
+                "cache": {k: dict(v) for k, v in phase["cache"].items()},
+                "timers": {k: round(v, 3) for k, v in phase["timers"].items()}
+            })
+            totals["api_calls"].update(phase["api_calls"])
+            totals["bytes"] += phase["bytes"]
+            totals["retries"] += phase["retries"]
+            totals["timers"].update(phase["timers"])
+            for name, counts in phase["cache"].items():
+                total_counts = totals["cache"].setdefault(name, {"hits": 0, "misses": 0})
+                total_counts["hits"] += counts["hits"]
+                total_counts["misses"] += counts["misses"]
+        return {
+            "seconds": round(now - _started, 3) if _started is not None else None,
+            "phases": phases,
+            "totals": {
+                "api_calls": dict(totals["api_calls"]),
+                "bytes": totals["bytes"],
+                "retries": totals["retries"],
+                "cache": totals["cache"],
+                "timers": {k: round(v, 3) for k, v in totals["timers"].items()}
+            }
+        }
+
+def write(path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report(), f, indent=4)
+    os.replace(tmp_path, path)
+
+def run_instrumented(func, args):
+    """
+    Runs a command's func(args) with the --metrics, --profile and --quiet
+    options applied. Metrics and profile are written even if the run fails.
+    """
+    global quiet
+    quiet = args.quiet
+    reset()
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler:
+            profiler.runcall(func, args)
+        else:
+            func(args)
+    finally:
+        finish()
+        quiet = False
+        if profiler:
+            profiler.dump_stats(args.profile)
+            print(f"Profile saved to {args.profile}")
+        if args.metrics:
+            try:
+                write(args.metrics)
+                print(f"Metrics saved to {args.metrics}")
+            except IOError as e:
+                print(f"Warning: Could not write metrics: {e}")
@@ -0,0 +1,247 @@
+"""
+Runs one command against several orgs at once. Each org runs in its own
+worker process, with its own Salesforce session, connection pool and API
+limits; the per-org outputs are merged into one file with an 'org' column.
+
+    mxp template find -u "dev1,dev2,prod" -obj Account
+    mxp analytics files --alias-file orgs.txt --org-workers 4
+"""
+import copy
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+try:
+    from . import copado_helper as helper
+    from . import metrics
+except ImportError:
+    import copado_helper as helper
+    import metrics
+
+DEFAULT_ORG_WORKERS = 8
+ORG_COLUMN = "org"
+
+def add_args(parser):
+    """Adds --alias-file and --org-workers; -u itself is defined by each command."""
+    parser.add_argument("--alias-file", default=None, metavar="PATH", help="File with org aliases to run against, one per line or comma-separated\n('-' for stdin). Combined with -u.")
+    parser.add_argument("--org-workers", type=int, default=DEFAULT_ORG_WORKERS, metavar="N", help=f"Number of orgs processed at the same time, one process each.\nDefault: {DEFAULT_ORG_WORKERS}")
+
+def resolve_aliases(args):
+    """
+    Returns the org aliases of -u (one alias, a comma-separated list or a JSON
+    array) followed by those of --alias-file, without duplicates.
+    Returns None after printing why if there are none or the file is unreadable.
+    """
+    aliases = []
+    if args.username:
+        for item in helper.parse_arg_list([args.username]):
+            aliases.extend(v.strip() for v in str(item).split(",") if v.strip())
+    alias_file = getattr(args, "alias_file", None)
+    if alias_file:
+        try:
+            aliases.extend(helper.read_list_file(alias_file))
+        except IOError as e:
+            print(f"Error: Could not read alias file {alias_file}: {e}")
+            return None
+    if not aliases:
+        print("Error: Provide an org alias with -u or --alias-file.")
+        return None
+    return list(dict.fromkeys(aliases))
+
+def fan_out_if_needed(func, args, output_path, output_format, aliases=None):
+    """
+    Entry point for commands that support several orgs. With a single alias,
+    sets args.username to it and returns False so the command runs as usual.
+    With several, runs func for each of them (see fan_out) and returns True.
+    output_format: 'csv', 'json' or 'ndjson', the format func writes to args.output.
+    aliases: the result of resolve_aliases(args), if the command already has it.
+    """
+    aliases = aliases or resolve_aliases(args)
+    if aliases is None:
+        return True
+    if len(aliases) == 1:
+        args.username = aliases[0]
+        return False
+    fan_out(func, args, aliases, output_path, output_format)
+    return True
+
+def _org_path(path, alias):
+    """'run.json' -> 'run.<alias>.json', for per-org metrics and profiles."""
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}.{alias}{ext}"
+
+class _PrefixedOutput:
+    """
+    Prefixes every line a worker prints with its org alias. Only whole lines
+    are passed on, so the output of parallel workers does not mix within a line.
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.pending = ""
+
+    def write(self, text):
+        self.pending += text
+        if "\n" in self.pending:
+            *lines, self.pending = self.pending.split("\n")
+            self.stream.write("".join(f"{self.prefix}{line}\n" if line else "\n" for line in lines))
+            self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        if self.pending:
+            self.stream.write(f"{self.prefix}{self.pending}")
+            self.pending = ""
+        self.stream.flush()
+
+def _run_org(func, args):
+    """
+    Worker process: runs the command for one org.
+    Returns: (alias, error message or None, seconds)
+    """
+    # Worker processes are reused for further orgs; restore stdout afterwards
+    stdout = sys.stdout
+    sys.stdout = _PrefixedOutput(stdout, f"[{args.username}] ")
+    started = time.perf_counter()
+    error = None
+    try:
+        metrics.run_instrumented(func, args)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        sys.stdout.flush()
+        sys.stdout = stdout
+    return args.username, error, time.perf_counter() - started
+
+def fan_out(func, args, aliases, output_path, output_format):
+    """
+    Runs func for every alias in a pool of worker processes and merges the
+    outputs of the orgs that succeeded into output_path. A failing org is
+    reported and does not stop the others.
+    Returns: list of aliases that failed.
+    """
+    workers = max(1, min(getattr(args, "org_workers", DEFAULT_ORG_WORKERS), len(aliases)))
+    print(f"Running for {len(aliases)} orgs, {workers} at a time: {', '.join(aliases)}")
+    ext = os.path.splitext(output_path)[1]
+    failed = {}
+    metrics.start_phase("orgs")
+    with tempfile.TemporaryDirectory(prefix="mxp_orgs_") as work_dir:
+        org_outputs = {}
+        jobs = []
+        for n, alias in enumerate(aliases):
+            org_args = copy.copy(args)
+            org_args.username = alias
+            org_args.alias_file = None
+            org_args.output = org_outputs[alias] = os.path.join(work_dir, f"org_{n}{ext}")
+            org_args.metrics = _org_path(getattr(args, "metrics", None), alias)
+            org_args.profile = _org_path(getattr(args, "profile", None), alias)
+            if hasattr(args, "stats_json"):
+                org_args.stats_json = _org_path(args.stats_json, alias)
+            if hasattr(args, "cache_dir"):
+                # One template cache per org; parallel runs would overwrite each other's cache index
+                org_args.cache_dir = os.path.join(args.cache_dir or "Temp_Template_Files", alias)
+            if hasattr(args, "checkpoint"):
+                # Keep 'get objects' checkpoints next to the merged output so a failed org can be resumed
+                org_args.checkpoint = _org_path(args.checkpoint or f"{output_path}.checkpoint", alias)
+            jobs.append(org_args)
+
+        sys.stdout.flush()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_run_org, func, org_args): org_args.username for org_args in jobs}
+            for future in as_completed(futures):
+                alias = futures[future]
+                try:
+                    _, error, seconds = future.result()
+                except Exception as e:
+                    # e.g. the worker process died
+                    error, seconds = f"{type(e).__name__}: {e}", None
+                if error is None and not os.path.exists(org_outputs[alias]):
+                    error = "no output was written (see its messages above)"
+                if error:
+                    failed[alias] = error
+                    print(f"[{alias}] FAILED: {error}")
+                else:
+                    print(f"[{alias}] Finished in {seconds:.1f}s.")
+
+        metrics.start_phase("merge")
+        succeeded = [alias for alias in aliases if alias not in failed]
+        if succeeded:
+            try:
+                output_dir = os.path.dirname(output_path)
+                if output_dir:
+                    os.makedirs(output_dir, exist_ok=True)
+                rows = merge_outputs([(alias, org_outputs[alias]) for alias in succeeded], output_path, output_format)
+                print(f"\nMerged {rows} rows from {len(succeeded)} org(s) into: {output_path}")
+            except (IOError, ValueError) as e:
+                print(f"Error writing merged output file: {e}")
+                failed.update({alias: "merge failed" for alias in succeeded})
+
+    if failed:
+        print(f"\n{len(failed)} of {len(aliases)} org(s) failed:")
+        for alias, error in failed.items():
+            print(f"  {alias}: {error}")
+    return list(failed)
+
+def _csv_tables(path):
+    """Yields (table number, row) for a CSV file whose tables are separated by empty rows."""
+    with open(path, newline='', encoding='utf-8') as f:
+        table = 0
+        for row in csv.reader(f):
+            if not row:
+                table += 1
+                continue
+            yield table, row
+
+def merge_outputs(org_paths, output_path, output_format):
+    """
+    Merges per-org output files into output_path, adding the org alias to every
+    row: as a first 'org' column in CSV (each table of a multi-table report is
+    merged separately) or an 'org' key in JSON/NDJSON.
+    org_paths: list of (alias, path) in output order.
+    Returns: number of rows written.
+    """
+    tmp_path = f"{output_path}.tmp"
+    rows = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        if output_format == "json":
+            merged = []
+            for alias, path in org_paths:
+                with open(path, encoding='utf-8') as f:
+                    merged.extend({ORG_COLUMN: alias, **row} for row in json.load(f))
+            json.dump(merged, out, indent=4)
+            rows = len(merged)
+        elif output_format == "ndjson":
+            for alias, path in org_paths:
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            out.write(json.dumps({ORG_COLUMN: alias, **json.loads(line)}) + "\n")
+                            rows += 1
+        else:
+            writer = csv.writer(out)
+            tables = max((max((t for t, _ in _csv_tables(path)), default=-1) for _, path in org_paths), default=-1) + 1
+            for table in range(tables):
+                if table:
+                    writer.writerow([])
+                header_written = False
+                for alias, path in org_paths:
+                    first = True
+                    for t, row in _csv_tables(path):
+                        if t != table:
+                            continue
+                        if first:
+                            first = False
+                            if not header_written:
+                                writer.writerow([ORG_COLUMN] + row)
+                                header_written = True
+                            continue
+                        writer.writerow([alias] + row)
+                        rows += 1
+    os.replace(tmp_path, output_path)
+    return rows
@@ -0,0 +1,127 @@
+"""
+Streaming output for 'get objects'. Rows are appended to the output file
+(CSV or NDJSON) as soon as a template is processed; object labels are then
+filled in by a final pass that reads the file back row by row. The final pass
+can also restore the usual sort order with an external merge sort, holding
+at most a fixed number of rows in memory.
+"""
+import csv
+import heapq
+import json
+import os
+import tempfile
+
+CSV_HEADERS = ['Input Template Name', 'Object Label', 'Object API Name', 'Template Name', 'Template Id', 'Root Template']
+ROW_FIELDS = ['input_template', 'object_label', 'object_api', 'template_name', 'template_id', 'is_root']
+DEFAULT_SORT_BUFFER_ROWS = 100000
+
+class RowWriter:
+    """Appends rows to a CSV or NDJSON file."""
+
+    def __init__(self, path, ndjson=False):
+        self.path = path
+        self.ndjson = ndjson
+        self.count = 0
+        self._file = open(path, mode='w', newline='', encoding='utf-8')
+        self._csv = None
+        if not ndjson:
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_HEADERS)
+
+    def write(self, row):
+        if self.ndjson:
+            self._file.write(json.dumps({field: row[field] for field in ROW_FIELDS}) + "\n")
+        else:
+            self._csv.writerow([row[field] for field in ROW_FIELDS])
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def read_rows(path, ndjson=False):
+    """Yields the rows of a file written by RowWriter."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if ndjson:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            reader = csv.reader(f)
+            next(reader, None)
+            for values in reader:
+                yield dict(zip(ROW_FIELDS, values))
+
+def _write_run(rows, sort_key, tmp_dir):
+    rows.sort(key=sort_key)
+    fd, path = tempfile.mkstemp(prefix="mxp-sort-", suffix=".ndjson", dir=tmp_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps([sort_key(row), row]) + "\n")
+    return path
+
+def _read_run(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+def external_sort(rows, sort_key, buffer_rows=DEFAULT_SORT_BUFFER_ROWS, tmp_dir=None):
+    """
+    Yields rows ordered by sort_key (which must return JSON-serializable
+    values), keeping at most buffer_rows rows in memory. Input larger than that
+    is sorted in runs spilled to temporary files, which are then merged.
+    The sort is stable.
+    """
+    buffer_rows = max(1, buffer_rows)
+    buffer = []
+    runs = []
+    try:
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= buffer_rows:
+                runs.append(_write_run(buffer, sort_key, tmp_dir))
+                buffer = []
+        if not runs:
+            buffer.sort(key=sort_key)
+            yield from buffer
+            return
+        if buffer:
+            runs.append(_write_run(buffer, sort_key, tmp_dir))
+            buffer = []
+        # Keys went through JSON, so they are compared as lists
+        for _, row in heapq.merge(*(_read_run(path) for path in runs), key=lambda item: item[0]):
+            yield row
+    finally:
+        for path in runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def finalize(path, labels_map, ndjson=False, sort_key=None, buffer_rows=DEFAULT_SORT_BUFFER_ROWS):
+    """
+    Rewrites a streamed output file with final object labels, sorted by
+    sort_key if given. The file is replaced atomically.
+    Returns: number of rows written.
+    """
+    def labelled():
+        for row in read_rows(path, ndjson):
+            api_name = row['object_api']
+            row['object_label'] = labels_map.get(api_name, api_name) if api_name else ""
+            yield row
+
+    rows = labelled()
+    if sort_key is not None:
+        rows = external_sort(rows, sort_key, buffer_rows, tmp_dir=os.path.dirname(os.path.abspath(path)))
+
+    tmp_path = f"{path}.tmp"
+    writer = RowWriter(tmp_path, ndjson=ndjson)
+    try:
+        for row in rows:
+            writer.write(row)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return writer.count
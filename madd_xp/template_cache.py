@@ -0,0 +1,234 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+INDEX_FILE = "cache_index.json"
+OBJECTS_DIR = "objects"
+DEFAULT_MAX_MB = 512
+
+def write_body(path, chunks, compress=False):
+    """
+    Streams a downloaded body (iterable of bytes chunks) to path, gzip-compressed
+    if requested. The file is written under a temporary name and moved into place.
+    Returns: SHA-256 hex digest of the uncompressed bytes.
+    """
+    digest = hashlib.sha256()
+    # Parallel downloads may share a path; write atomically
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) if compress else raw
+            for chunk in chunks:
+                if chunk:
+                    digest.update(chunk)
+                    out.write(chunk)
+            if compress:
+                out.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest.hexdigest()
+
+def read_body(path):
+    """
+    Parses a JSON body written by write_body with one read of the file
+    (decompressed first if it ends in .gz). json.loads needs the whole body in
+    memory, so the file is read into a single bytes object and not mapped.
+    Raises ValueError for empty or invalid content.
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        if path.endswith(".gz"):
+            with gzip.GzipFile(fileobj=f) as unzipped:
+                data = unzipped.read()
+        else:
+            data = f.read()
+    try:
+        return json.loads(data)
+    finally:
+        metrics.add_time("json_parse", time.perf_counter() - started)
+
+class TemplateCache:
+    """
+    On-disk cache of downloaded "Template Detail" attachments.
+    Entries are keyed by template Id and are only reused while the Attachment's
+    LastModifiedDate and BodyLength still match. The least recently used entries
+    are evicted once the cache grows past max_bytes.
+    Bodies are stored as downloaded, by content hash
+    (objects/<sha256[:2]>/<sha256>.json), so templates with identical bodies
+    share one file. compress stores them gzip-compressed; pretty stores them
+    indented for reading by hand, which costs an extra parse and write.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, compress=False, pretty=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.pretty = pretty
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        self.hits = 0
+        self.misses = 0
+        # Downloads store bodies from worker threads; guards entries and the object files
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("entries", {})
+        except (IOError, ValueError, AttributeError) as e:
+            print(f"Warning: Ignoring unreadable template cache index {self.index_path}: {e}")
+            return {}
+
+    def _entry_path(self, entry):
+        return os.path.join(self.cache_dir, entry["file"])
+
+    def get(self, template_id, attachment):
+        """
+        Returns the cached JSON for template_id if it matches the Attachment
+        metadata record (LastModifiedDate, BodyLength), otherwise None.
+        """
+        with self._lock:
+            entry = self.entries.get(template_id)
+            if (not entry or not attachment
+                    or entry.get("last_modified") != attachment.get("LastModifiedDate")
+                    or entry.get("body_length") != attachment.get("BodyLength")):
+                self.misses += 1
+                return None
+            entry = dict(entry)
+        try:
+            content = read_body(self._entry_path(entry))
+        except (IOError, ValueError):
+            with self._lock:
+                if self.entries.get(template_id, {}).get("file") == entry["file"]:
+                    self._release(self.entries.pop(template_id))
+                self.misses += 1
+            return None
+        with self._lock:
+            if template_id in self.entries:
+                self.entries[template_id]["last_access"] = time.time()
+            self.hits += 1
+        return content
+
+    def _object_file(self, digest):
+        suffix = (".pretty" if self.pretty else "") + ".json" + (".gz" if self.compress else "")
+        return os.path.join(OBJECTS_DIR, digest[:2], digest + suffix)
+
+    def _staging_path(self, template_id, compress):
+        # Per thread, so parallel stores of the same template do not share a file
+        return os.path.join(self.cache_dir, f"{template_id}.{threading.get_ident()}.download" + (".gz" if compress else ""))
+
+    def store(self, template_id, attachment, chunks, name=None):
+        """
+        Streams a downloaded body (iterable of bytes chunks) into the cache for
+        template_id against its Attachment metadata record.
+        Returns: the parsed JSON content. Raises ValueError for invalid JSON.
+        """
+        # Pretty bodies are rewritten after parsing, so only compress them then
+        compress = self.compress and not self.pretty
+        download_path = self._staging_path(template_id, compress)
+        staging_path = self._staging_path(template_id, self.compress)
+        try:
+            digest = write_body(download_path, chunks, compress=compress)
+            content = read_body(download_path)
+            if self.pretty:
+                write_body(staging_path, [json.dumps(content, indent=4).encode('utf-8')], compress=self.compress)
+            self._add(template_id, attachment, digest, staging_path, name)
+        finally:
+            for path in {download_path, staging_path}:
+                if os.path.exists(path):
+                    os.remove(path)
+        return content
+
+    def put(self, template_id, attachment, json_content, name=None):
+        """Stores already parsed JSON for template_id against its Attachment metadata record."""
+        body = json.dumps(json_content, indent=4 if self.pretty else None).encode('utf-8')
+        staging_path = self._staging_path(template_id, self.compress)
+        try:
+            digest = write_body(staging_path, [body], compress=self.compress)
+            self._add(template_id, attachment, digest, staging_path, name)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+
+    def _release(self, entry):
+        """Deletes the body file of a dropped entry unless another entry still uses it. Call with the lock held."""
+        if any(e["file"] == entry["file"] for e in self.entries.values()):
+            return
+        try:
+            os.remove(self._entry_path(entry))
+        except OSError:
+            pass
+
+    def _add(self, template_id, attachment, digest, staging_path, name):
+        filename = self._object_file(digest)
+        output_path = os.path.join(self.cache_dir, filename)
+        # The file is placed and referenced in one step, so a concurrent release cannot delete it in between
+        with self._lock:
+            if not os.path.exists(output_path):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                os.replace(staging_path, output_path)
+            previous = self.entries.get(template_id)
+            self.entries[template_id] = {
+                "file": filename,
+                "sha256": digest,
+                "name": name,
+                "last_modified": attachment.get("LastModifiedDate"),
+                "body_length": attachment.get("BodyLength"),
+                "size": os.path.getsize(output_path),
+                "last_access": time.time()
+            }
+            # A changed body no longer needs the old file
+            if previous and previous["file"] != filename:
+                self._release(previous)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        A shared body file is deleted with the last entry that uses it.
+        """
+        with self._lock:
+            sizes = {e["file"]: e.get("size", 0) for e in self.entries.values()}
+            total = sum(sizes.values())
+            if total <= self.max_bytes:
+                return 0
+            users = Counter(e["file"] for e in self.entries.values())
+            evicted = 0
+            for template_id, entry in sorted(self.entries.items(), key=lambda item: item[1].get("last_access", 0)):
+                if total <= self.max_bytes:
+                    break
+                del self.entries[template_id]
+                evicted += 1
+                users[entry["file"]] -= 1
+                if users[entry["file"]] == 0:
+                    try:
+                        os.remove(self._entry_path(entry))
+                    except OSError:
+                        pass
+                    total -= sizes[entry["file"]]
+            return evicted
+
+    def save(self):
+        """Applies the size cap and writes the cache index to disk."""
+        evicted = self.evict()
+        if evicted:
+            print(f"Template cache: evicted {evicted} least recently used template(s).")
+        tmp_path = f"{self.index_path}.tmp"
+        with self._lock, open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "entries": self.entries}, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,371 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from . import copado_helper as helper
+    from . import metrics
+    from .template_hash_cache import TemplateHashCache, hash_cache_path
+except ImportError:
+    import copado_helper as helper
+    import metrics
+    from template_hash_cache import TemplateHashCache, hash_cache_path
+
+ATTACHMENT_NAME = "Template Detail"
+RECORDS_QUERY = "SELECT Id, Name, copado__Main_Object__c, copado__Active__c FROM copado__Data_Template__c WHERE Id IN ({})"
+OUTPUT_FIELDS = ["change", "type", "name", "source_id", "target_id", "detail"]
+
+def add_args(parser):
+    """Adds arguments to the provided parser."""
+    parser.epilog = """EXAMPLES:
+  # Compare a template hierarchy between a sandbox and production
+  mxp template diff -u devSandbox -u2 prod -t "MADD Stress Main"
+
+  # Several roots, JSON report
+  mxp template diff -u devSandbox -u2 prod -t "Template A" "Template B" --json -o ./exports/diff.json
+"""
+
+    auth_group = parser.add_argument_group('Orgs')
+    auth_group.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias of the source org (e.g., devSandbox)")
+    auth_group.add_argument("-u2", "--target-username", required=True, help="Salesforce CLI Org Alias of the target org (e.g., prod)")
+    auth_group.add_argument("--no-session-cache", action="store_true", help="Ignore the cached sessions and fetch fresh credentials from the SF CLI.")
+
+    input_group = parser.add_argument_group('Input')
+    input_group.add_argument("-t", "--templates", required=True, nargs='+', metavar="NAME", help="Root Template Names, matched by name in both orgs.\nAccepts space-separated strings or a JSON array.")
+
+    output_group = parser.add_argument_group('Output')
+    output_group.add_argument("-o", "--output", default=None, metavar="PATH", help="Path to output file.\nDefault: template_diff.csv (or .json)")
+    output_group.add_argument("--json", action="store_true", help="Output results in JSON format instead of CSV.")
+
+    perf_group = parser.add_argument_group('Performance')
+    perf_group.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N\nSalesforce API calls in either org (counted per org).")
+    perf_group.add_argument("--concurrency", type=int, default=helper.DEFAULT_CONCURRENCY, metavar="N", help=f"Number of template downloads run in parallel per org.\nDefault: {helper.DEFAULT_CONCURRENCY}")
+    perf_group.add_argument("--no-hash-cache", action="store_true", help="Download every template and do not read or write the\nper-org template hash cache.")
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare a Copado Data Template hierarchy between two orgs",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    add_args(parser)
+    return parser
+
+class HierarchySnapshot:
+    """
+    The template hierarchies of some root templates in one org: template
+    records, references and normalized content hashes (see template_hash_cache),
+    plus a Merkle hash per template over its content and the hashes of the
+    templates it references.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.records = {}  # Id -> template record
+        self.entries = {}  # Id -> hash cache entry
+        self.roots = {}  # root name -> Id
+        self.downloads = 0
+        self.node_hashes = {}
+        self.merkle = {}
+        # Template Details may hold 15-character Ids; records have 18-character ones
+        self._ids_15 = {}
+
+    def add_records(self, records):
+        self.records.update(records)
+        self._ids_15.update({t_id[:15]: t_id for t_id in records})
+
+    def full_id(self, t_id):
+        """Returns the record Id for a 15- or 18-character template Id, or None if it is not in the org."""
+        return self._ids_15.get(t_id[:15]) if t_id else None
+
+    def name(self, t_id):
+        return self.records[t_id]["Name"]
+
+    def edges(self, t_id):
+        """Ids of the templates t_id references that exist in the org."""
+        refs = [self.full_id(r) for r in self.entries.get(t_id, {}).get("edges", [])]
+        return list(dict.fromkeys(r for r in refs if r in self.records))
+
+    def reachable(self, start_ids):
+        """Returns the Ids of the templates reachable from start_ids, including them."""
+        seen = set()
+        stack = [t_id for t_id in start_ids if t_id in self.records]
+        while stack:
+            t_id = stack.pop()
+            if t_id in seen:
+                continue
+            seen.add(t_id)
+            stack.extend(self.edges(t_id))
+        return seen
+
+    def hierarchy(self):
+        """Returns { name: [Ids] } of every template reachable from the roots; a name can belong to several templates."""
+        names = {}
+        for t_id in sorted(self.reachable(self.roots.values())):
+            names.setdefault(self.name(t_id), []).append(t_id)
+        return names
+
+    def node_parts(self, t_id):
+        """What a template's own hash covers: content, main object, active flag and referenced template names."""
+        record = self.records[t_id]
+        entry = self.entries.get(t_id, {})
+        ref_names = [self.records[self.full_id(r)]["Name"] if self.full_id(r) in self.records else "?" for r in entry.get("refs", [])]
+        return {
+            "content": entry.get("content"),
+            "main object": record.get("copado__Main_Object__c"),
+            "active": record.get("copado__Active__c"),
+            "references": ref_names
+        }
+
+    def compute_hashes(self):
+        """
+        Computes node and Merkle hashes depth-first from the roots, with
+        references in name order. A reference back to a template on the current
+        path counts by name only, so cycles between templates terminate.
+        """
+        for t_id in self.records:
+            self.node_hashes[t_id] = _digest(json.dumps(self.node_parts(t_id), sort_keys=True))
+        on_path = set()
+        for root_id in self.roots.values():
+            if root_id not in self.records or root_id in self.merkle:
+                continue
+            # Iterative post-order walk: (Id, sorted references, next index)
+            stack = [(root_id, sorted(self.edges(root_id), key=self.name), 0)]
+            on_path.add(root_id)
+            while stack:
+                t_id, refs, i = stack[-1]
+                if i < len(refs):
+                    stack[-1] = (t_id, refs, i + 1)
+                    ref = refs[i]
+                    if ref not in self.merkle and ref not in on_path:
+                        on_path.add(ref)
+                        stack.append((ref, sorted(self.edges(ref), key=self.name), 0))
+                    continue
+                parts = [self.node_hashes[t_id]]
+                for ref in refs:
+                    parts.append(f"{self.name(ref)}:{self.merkle.get(ref, 'cycle')}")
+                self.merkle[t_id] = _digest("\n".join(parts))
+                on_path.discard(t_id)
+                stack.pop()
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def fetch_records(sf, template_ids):
+    """Returns { Id: template record } for many template Ids with chunked IN queries."""
+    records = {}
+    for chunk in helper.chunk_list(list(dict.fromkeys(template_ids)), 200):
+        for record in sf.query_all(RECORDS_QUERY.format(helper.format_in_clause(chunk)))["records"]:
+            records[record["Id"]] = record
+    return records
+
+def snapshot_org(alias, root_names, args):
+    """
+    Crawls the hierarchies of root_names in one org, level by level. Records
+    and Attachment metadata are fetched for a whole level at once; a Template
+    Detail is only downloaded when the org's hash cache has no entry with the
+    same LastModifiedDate and BodyLength. Templates known from the cache are
+    fetched together with the roots, so with a warm cache an unchanged
+    hierarchy costs a few batched queries and no downloads. The records and
+    metadata of every cached template are fetched before any hash is compared,
+    and the first run (or one with --no-hash-cache) downloads the whole hierarchy.
+    Returns: HierarchySnapshot, or None if the org cannot be reached.
+    """
+    try:
+        # Each org gets its own session: connection pool, --concurrency, --max-api-calls and throttling
+        session = helper.new_http_session(max(1, args.concurrency), org_alias=alias)
+        sf, instance_url = helper.connect(alias, use_cache=not args.no_session_cache, max_api_calls=args.max_api_calls,
+                                          session=session)
+    except Exception as e:
+        print(f"[{alias}] Authentication failed: {e}")
+        return None
+
+    snapshot = HierarchySnapshot(alias)
+    cache = TemplateHashCache(None if args.no_hash_cache else hash_cache_path(alias))
+    snapshot.roots = helper.get_template_ids_by_names(sf, root_names)
+    for name in root_names:
+        if name not in snapshot.roots:
+            print(f"[{alias}] Template '{name}' not found.")
+
+    # Start with the roots and every template the cache says they reach
+    pending = list(snapshot.roots.values())
+    stack = list(pending)
+    while stack:
+        for ref in cache.entries.get(stack.pop(), {}).get("edges", []):
+            if ref not in pending:
+                pending.append(ref)
+                stack.append(ref)
+
+    fetched = set()
+    while pending:
+        fetched.update(t_id[:15] for t_id in pending)
+        records = fetch_records(sf, pending)
+        snapshot.add_records(records)
+        metadata = helper.get_attachment_metadata(sf, list(records), ATTACHMENT_NAME)
+
+        to_download = []
+        for t_id in records:
+            entry = cache.get(t_id, metadata.get(t_id))
+            if entry is not None:
+                snapshot.entries[t_id] = entry
+            else:
+                to_download.append(t_id)
+        if to_download:
+            downloads = helper.download_attachments(
+                sf, instance_url, sf.session_id, [(t_id, records[t_id]["Name"]) for t_id in to_download],
+                ATTACHMENT_NAME, None, concurrency=max(1, args.concurrency), metadata=metadata
+            )
+            for t_id in to_download:
+                snapshot.entries[t_id] = cache.put(t_id, metadata.get(t_id), downloads.get(t_id))
+            snapshot.downloads += len(to_download)
+
+        # References not fetched yet form the next level
+        pending = []
+        for t_id in records:
+            for ref in snapshot.entries[t_id]["edges"]:
+                if ref[:15] not in fetched and ref not in pending:
+                    pending.append(ref)
+
+    try:
+        cache.save()
+    except IOError as e:
+        print(f"[{alias}] Warning: Could not save the template hash cache: {e}")
+
+    # Drop templates the cache listed that are no longer part of the hierarchy
+    reachable = snapshot.reachable(snapshot.roots.values())
+    snapshot.records = {t_id: r for t_id, r in snapshot.records.items() if t_id in reachable}
+    snapshot.compute_hashes()
+    print(f"[{alias}] {len(snapshot.records)} template(s) in hierarchy, {snapshot.downloads} downloaded.")
+    return snapshot
+
+def _describe_change(src_parts, dst_parts):
+    details = []
+    if src_parts["main object"] != dst_parts["main object"]:
+        details.append(f"main object {src_parts['main object']} -> {dst_parts['main object']}")
+    if src_parts["active"] != dst_parts["active"]:
+        details.append(f"active {src_parts['active']} -> {dst_parts['active']}")
+    added = sorted(set(dst_parts["references"]) - set(src_parts["references"]))
+    removed = sorted(set(src_parts["references"]) - set(dst_parts["references"]))
+    if added:
+        details.append(f"references added: {', '.join(added)}")
+    if removed:
+        details.append(f"references removed: {', '.join(removed)}")
+    if src_parts["content"] != dst_parts["content"] and not (added or removed):
+        details.append("Template Detail content")
+    return "; ".join(details) or "Template Detail content"
+
+def diff_snapshots(src, dst):
+    """
+    Compares two snapshots by template name. Starting at the roots, it only
+    descends into templates whose Merkle hashes differ. Templates found in
+    both orgs under different parents are compared by their own hash.
+    A name shared by several templates of a hierarchy cannot be paired, so it
+    is reported as a "duplicate" row and left out of the comparison.
+    Returns: (list of change rows, True if all root hierarchies match)
+    """
+    rows = []
+    src_all, dst_all = src.hierarchy(), dst.hierarchy()
+    duplicates = {name for names in (src_all, dst_all) for name, ids in names.items() if len(ids) > 1}
+    for name in sorted(duplicates):
+        s_ids, d_ids = src_all.get(name, []), dst_all.get(name, [])
+        counts = [f"{len(ids)} in {snapshot.alias}" for snapshot, ids in ((src, s_ids), (dst, d_ids)) if len(ids) > 1]
+        rows.append({"change": "duplicate", "type": "template", "name": name, "source_id": ";".join(s_ids),
+                     "target_id": ";".join(d_ids), "detail": f"templates share this name ({', '.join(counts)}); not compared"})
+    src_names = {name: ids[0] for name, ids in src_all.items() if name not in duplicates}
+    dst_names = {name: ids[0] for name, ids in dst_all.items() if name not in duplicates}
+    common_roots = [name for name in src.roots if name in src_names and name in dst_names and dst.roots.get(name) in dst.records]
+    identical = (not duplicates and set(src.roots) == set(dst.roots) and len(common_roots) == len(src.roots)
+                 and all(src.merkle[src.roots[n]] == dst.merkle[dst.roots[n]] for n in common_roots))
+
+    compared = set()
+    matched = set()
+
+    def compare(name):
+        compared.add(name)
+        s_id, d_id = src_names[name], dst_names[name]
+        if src.node_hashes[s_id] != dst.node_hashes[d_id]:
+            rows.append({"change": "changed", "type": "template", "name": name, "source_id": s_id, "target_id": d_id,
+                         "detail": _describe_change(src.node_parts(s_id), dst.node_parts(d_id))})
+
+    stack = list(reversed(common_roots))
+    while stack:
+        name = stack.pop()
+        if name in compared or name in matched:
+            continue
+        s_id, d_id = src_names[name], dst_names[name]
+        if src.merkle[s_id] == dst.merkle[d_id]:
+            # Same subtree in both orgs; nothing below it needs comparing
+            matched.update(src.name(t_id) for t_id in src.reachable([s_id]))
+            continue
+        compare(name)
+        dst_refs = {dst.name(r) for r in dst.edges(d_id)}
+        stack.extend(sorted((src.name(r) for r in src.edges(s_id) if src.name(r) in dst_refs and src.name(r) not in duplicates),
+                            reverse=True))
+
+    for name in sorted(set(src_names) & set(dst_names) - compared - matched):
+        compare(name)
+
+    for name in sorted(set(dst_names) - set(src_names)):
+        rows.append({"change": "added", "type": "template", "name": name, "source_id": "", "target_id": dst_names[name], "detail": ""})
+    for name in sorted(set(src_names) - set(dst_names)):
+        rows.append({"change": "removed", "type": "template", "name": name, "source_id": src_names[name], "target_id": "", "detail": ""})
+
+    src_objects = {src.records[t_id].get("copado__Main_Object__c") for ids in src_all.values() for t_id in ids} - {None}
+    dst_objects = {dst.records[t_id].get("copado__Main_Object__c") for ids in dst_all.values() for t_id in ids} - {None}
+    for api_name in sorted(dst_objects - src_objects):
+        rows.append({"change": "added", "type": "object", "name": api_name, "source_id": "", "target_id": "", "detail": ""})
+    for api_name in sorted(src_objects - dst_objects):
+        rows.append({"change": "removed", "type": "object", "name": api_name, "source_id": "", "target_id": "", "detail": ""})
+    return rows, identical
+
+def write_results(rows, output_path, json_output):
+    """Writes the change rows to CSV or JSON. Returns True once the file is written."""
+    try:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if json_output:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, indent=4)
+        else:
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"Results saved to {output_path}")
+        return True
+    except IOError as e:
+        print(f"Error writing output file: {e}")
+        return False
+
+def run(args):
+    root_names = helper.parse_arg_list(args.templates)
+    output_path = args.output or ("template_diff.json" if args.json else "template_diff.csv")
+    src_alias, dst_alias = args.username, args.target_username
+
+    print(f"Comparing {root_names} between {src_alias} (source) and {dst_alias} (target)...")
+    metrics.start_phase("snapshot")
+    # Both orgs are crawled at the same time
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        src_future = pool.submit(snapshot_org, src_alias, root_names, args)
+        dst_future = pool.submit(snapshot_org, dst_alias, root_names, args)
+        src, dst = src_future.result(), dst_future.result()
+    if src is None or dst is None:
+        return
+
+    metrics.start_phase("diff")
+    rows, identical = diff_snapshots(src, dst)
+    if identical:
+        print("\nThe hierarchies match.")
+    else:
+        counts = {change: sum(1 for r in rows if r["change"] == change) for change in ("added", "removed", "changed", "duplicate")}
+        print(f"\nDifferences: {counts['added']} added, {counts['removed']} removed, {counts['changed']} changed.")
+        if counts["duplicate"]:
+            print(f"Warning: {counts['duplicate']} template name(s) are used by several templates in one hierarchy and were not compared.")
+        for row in rows:
+            detail = f" ({row['detail']})" if row["detail"] else ""
+            helper.log_detail(f"   {row['change']:<8} {row['type']:<8} {row['name']}{detail}")
+
+    metrics.start_phase("write")
+    write_results(rows, output_path, args.json)
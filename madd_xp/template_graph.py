@@ -0,0 +1,156 @@
+def strongly_connected_components(adjacency):
+    """
+    Iterative Tarjan's algorithm over { node: [successor, ...] }.
+    Successors that are not keys of adjacency are treated as leaf nodes.
+    Returns: (components, component_of) where components is a list of node lists
+    in reverse topological order (every component comes after the ones it reaches)
+    and component_of maps each node to its component index.
+    """
+    index_of = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    component_of = {}
+    counter = 0
+
+    for start in adjacency:
+        if start in index_of:
+            continue
+        index_of[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(adjacency.get(start, ())))]
+
+        while work:
+            node, successors = work[-1]
+            advanced = False
+            for succ in successors:
+                if succ not in index_of:
+                    index_of[succ] = lowlink[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(adjacency.get(succ, ()))))
+                    advanced = True
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[succ])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component_of[member] = len(components)
+                    members.append(member)
+                    if member == node:
+                        break
+                components.append(members)
+
+    return components, component_of
+
+class ReachabilityIndex:
+    """
+    Memoized reachability over a directed graph { node: [successor, ...] }.
+    Cycles are collapsed into strongly connected components, so every node of a
+    cycle shares one closure and each component's closure is computed once.
+    """
+
+    def __init__(self, adjacency):
+        self.components, self.component_of = strongly_connected_components(adjacency)
+        self.component_edges = [set() for _ in self.components]
+        for node, successors in adjacency.items():
+            source = self.component_of[node]
+            for succ in successors:
+                target = self.component_of[succ]
+                if target != source:
+                    self.component_edges[source].add(target)
+        self._closures = {}
+
+    def reachable(self, node):
+        """Returns a frozenset of every node reachable from node, including itself."""
+        if node not in self.component_of:
+            return frozenset([node])
+        root = self.component_of[node]
+        if root in self._closures:
+            return self._closures[root]
+
+        # Post-order walk of the component DAG so children are memoized first
+        work = [(root, False)]
+        while work:
+            comp, expanded = work.pop()
+            if comp in self._closures:
+                continue
+            if not expanded:
+                work.append((comp, True))
+                work.extend((t, False) for t in self.component_edges[comp] if t not in self._closures)
+                continue
+            closure = set(self.components[comp])
+            for target in self.component_edges[comp]:
+                closure |= self._closures[target]
+            self._closures[comp] = frozenset(closure)
+        return self._closures[root]
+
+def breadth_first_order(roots, adjacency):
+    """
+    Returns { node: position } in the order a level-by-level crawl from roots
+    first discovers each node, following successors in adjacency order.
+    """
+    order = {}
+    frontier = []
+    for root in roots:
+        if root not in order:
+            order[root] = len(order)
+            frontier.append(root)
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for succ in adjacency.get(node, ()):
+                if succ not in order:
+                    order[succ] = len(order)
+                    next_frontier.append(succ)
+        frontier = next_frontier
+    return order
+
+class RootMembership:
+    """
+    Tracks which roots reach each node of a graph that is still growing.
+    Each call returns the (node, newly added roots) pairs it caused, so a
+    caller can report a node for a root as soon as the root reaches it
+    instead of waiting for the whole graph.
+    adjacency: the caller's live { node: [successor, ...] } dict.
+    """
+
+    def __init__(self, adjacency):
+        self.adjacency = adjacency
+        self.roots_of = {}
+
+    def add_roots(self, node, roots):
+        """Adds roots to node and to everything already reachable from it."""
+        changes = []
+        work = [(node, frozenset(roots))]
+        while work:
+            current, roots = work.pop()
+            known = self.roots_of.setdefault(current, set())
+            added = roots - known
+            if not added:
+                continue
+            known |= added
+            changes.append((current, added))
+            work.extend((succ, added) for succ in self.adjacency.get(current, ()))
+        return changes
+
+    def add_edge(self, source, target):
+        """Call after appending target to adjacency[source]."""
+        return self.add_roots(target, self.roots_of.get(source, ()))
+
+    def roots(self, node):
+        return self.roots_of.get(node, set())
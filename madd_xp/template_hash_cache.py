@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import re
+try:
+    from . import copado_helper as helper
+except ImportError:
+    import copado_helper as helper
+
+# Quoted 15- or 18-character Salesforce Ids in canonical JSON
+_QUOTED_ID = re.compile(r'"([a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?)"')
+
+def hash_cache_path(org_alias):
+    """Returns the template hash cache of an org alias (MXP_HOME/hashes/<alias>.json)."""
+    safe_alias = "".join([c for c in org_alias if c.isalnum() or c in ('-', '_', '.', '@')])
+    return os.path.join(helper.get_mxp_home(), "hashes", f"{safe_alias}.json")
+
+def template_refs(detail):
+    """Returns the Ids of the templates a Template Detail references (children, then parents)."""
+    _, children, parents = helper.extract_template_info(detail)
+    refs = [c.get('templateId') for c in children] + [p.get('templateId') for p in parents]
+    return list(dict.fromkeys(r for r in refs if r))
+
+def content_hash(detail, template_id):
+    """
+    Hashes a Template Detail with template Ids normalized away, so the same
+    template in two orgs hashes alike. The template's own Id and the Ids it
+    references become '@ref<n>' in order of first appearance.
+    Returns: (hex digest, [referenced Id per n])
+    """
+    if not detail:
+        return None, []
+    # Keep the full-length Id of each reference for name lookups
+    by_prefix = {r[:15]: r for r in template_refs(detail)}
+    by_prefix.setdefault(template_id[:15], template_id)
+    positions = {}
+
+    def normalize(match):
+        prefix = match.group(1)[:15]
+        if prefix not in by_prefix:
+            return match.group(0)
+        return f'"@ref{positions.setdefault(prefix, len(positions))}"'
+
+    canonical = json.dumps(detail, sort_keys=True, separators=(',', ':'))
+    normalized = _QUOTED_ID.sub(normalize, canonical)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest(), [by_prefix[prefix] for prefix in positions]
+
+class TemplateHashCache:
+    """
+    Per-org cache of normalized Template Detail hashes and references, keyed
+    by template Id. An entry is only reused while the Attachment's
+    LastModifiedDate and BodyLength still match, so unchanged templates do
+    not have to be downloaded again. With path=None the cache lives in memory only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = dict(json.load(f)["entries"])
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            print(f"Warning: Ignoring unreadable template hash cache {self.path}: {e}")
+
+    @staticmethod
+    def _stamp(attachment):
+        return [attachment.get("LastModifiedDate"), attachment.get("BodyLength")] if attachment else None
+
+    def get(self, template_id, attachment):
+        """Returns the cached entry {'content', 'refs', 'edges'} if it matches the Attachment metadata record, otherwise None."""
+        entry = self.entries.get(template_id)
+        if not entry or not attachment or entry.get("stamp") != self._stamp(attachment):
+            return None
+        return entry
+
+    def put(self, template_id, attachment, detail):
+        """Hashes a downloaded Template Detail and stores it against its Attachment metadata record. Returns the entry."""
+        content, refs = content_hash(detail, template_id)
+        entry = {"stamp": self._stamp(attachment), "content": content, "refs": refs, "edges": template_refs(detail)}
+        # Failed downloads are not cached, so they are retried next time
+        if attachment and detail is not None:
+            self.entries[template_id] = entry
+        return entry
+
+    def save(self):
+        """Writes the cache to disk (no-op for in-memory caches)."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,404 @@
+import os
+import sqlite3
+import time
+try:
+    from . import copado_helper as helper
+except ImportError:
+    import copado_helper as helper
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS templates (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    main_object TEXT,
+    detail_object TEXT,
+    active INTEGER,
+    system_modstamp TEXT,
+    attachment_id TEXT,
+    attachment_modified TEXT,
+    body_length INTEGER,
+    has_detail INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS templates_name ON templates (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS templates_main_object ON templates (main_object);
+CREATE TABLE IF NOT EXISTS edges (
+    source_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    target_id TEXT NOT NULL,
+    target_name TEXT,
+    kind TEXT NOT NULL,
+    PRIMARY KEY (source_id, position)
+);
+CREATE INDEX IF NOT EXISTS edges_target ON edges (target_id);
+CREATE TABLE IF NOT EXISTS object_refs (
+    api_name TEXT NOT NULL COLLATE NOCASE,
+    template_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    PRIMARY KEY (api_name, template_id, kind)
+);
+CREATE INDEX IF NOT EXISTS object_refs_template ON object_refs (template_id);
+CREATE TABLE IF NOT EXISTS dependents_cache (
+    template_id TEXT PRIMARY KEY,
+    graph_version TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dependents (
+    template_id TEXT NOT NULL,
+    dependent_id TEXT NOT NULL,
+    PRIMARY KEY (template_id, dependent_id)
+);
+CREATE TABLE IF NOT EXISTS labels (
+    api_name TEXT PRIMARY KEY,
+    label TEXT
+);
+"""
+
+def default_index_path(org_alias):
+    """Returns the default index file of an org alias (MXP_HOME/index/<alias>.sqlite)."""
+    safe_alias = "".join([c for c in org_alias if c.isalnum() or c in ('-', '_', '.', '@')])
+    return os.path.join(helper.get_mxp_home(), "index", f"{safe_alias}.sqlite")
+
+def _match_conditions(column, objects, chunk_size=200):
+    """
+    Yields (SQL condition on column, parameters) covering objects: exact API
+    names in chunked IN lists, '*' patterns as LIKE. Matching ignores case,
+    like Salesforce API names.
+    """
+    names = list(dict.fromkeys([o for o in objects if o and "*" not in o]))
+    patterns = list(dict.fromkeys([o for o in objects if o and "*" in o]))
+    for chunk in helper.chunk_list(names, chunk_size):
+        yield f"{column} COLLATE NOCASE IN ({','.join('?' * len(chunk))})", list(chunk)
+    for pattern in patterns:
+        like = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "%")
+        yield f"{column} LIKE ? ESCAPE '\\'", [like]
+
+def _active_value(record):
+    """copado__Active__c as 1/0/None; Bulk API rows carry it as 'true'/'false'."""
+    active = record.get("copado__Active__c")
+    if active is None:
+        return None
+    if isinstance(active, str):
+        active = active.lower() == "true"
+    return int(bool(active))
+
+class TemplateIndex:
+    """
+    Local SQLite snapshot of an org's Data Templates.
+    templates: one row per copado__Data_Template__c, with the main object of the
+               record and of its "Template Detail" JSON (detail_object).
+    edges:     references found in the Template Detail, in document order
+               (children first, then parents), kind 'child' or 'parent'.
+    object_refs: objects named by the Template Detail's fields, kind
+               'reference' (lookup targets) or 'child' (child relationships).
+    dependents: memoized reverse closures (templates whose hierarchy reaches
+               a template), valid for one graph_version (the last sync).
+    labels:    object API name -> label.
+    meta:      build information (org, instance URL, timestamps).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        if self.get_meta("schema_version") is None:
+            self.set_meta("schema_version", SCHEMA_VERSION)
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    # --- Meta ---
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- Writing ---
+
+    def clear(self):
+        """Removes all templates, edges and labels (meta is kept)."""
+        self.conn.execute("DELETE FROM templates")
+        self.conn.execute("DELETE FROM edges")
+        self.conn.execute("DELETE FROM object_refs")
+        self.conn.execute("DELETE FROM dependents_cache")
+        self.conn.execute("DELETE FROM dependents")
+        self.conn.execute("DELETE FROM labels")
+
+    def put_template(self, record, attachment=None, detail=None):
+        """
+        Stores a template record and, if its Template Detail was parsed, its
+        main object and references. Existing edges of the template are replaced.
+        record: copado__Data_Template__c row (Id, Name, copado__Main_Object__c, ...)
+        attachment: Attachment metadata row (Id, LastModifiedDate, BodyLength) or None
+        detail: parsed Template Detail JSON or None
+        If the template has an Attachment but its detail could not be parsed, only
+        the record fields are stored: the Attachment stamp is left empty (so the
+        next refresh downloads it again) and the last parsed references are kept.
+        """
+        t_id = record["Id"]
+        if attachment and not detail:
+            self.put_failed_detail(record, attachment)
+            return
+        attachment = attachment or {}
+        detail_object, children, parents = helper.extract_template_info(detail)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO templates (id, name, main_object, detail_object, active, system_modstamp, "
+            "attachment_id, attachment_modified, body_length, has_detail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (t_id, record.get("Name"), record.get("copado__Main_Object__c"), detail_object,
+             _active_value(record), record.get("SystemModstamp"),
+             attachment.get("Id"), attachment.get("LastModifiedDate"), attachment.get("BodyLength"),
+             int(bool(detail)))
+        )
+
+        edges = []
+        for child in children:
+            if child.get('templateId'):
+                edges.append((child['templateId'], None, "child"))
+        for parent in parents:
+            if parent.get('templateId'):
+                edges.append((parent['templateId'], parent.get('templateName'), "parent"))
+        self.conn.execute("DELETE FROM edges WHERE source_id = ?", (t_id,))
+        self.conn.executemany(
+            "INSERT INTO edges (source_id, position, target_id, target_name, kind) VALUES (?, ?, ?, ?, ?)",
+            [(t_id, pos, target, name, kind) for pos, (target, name, kind) in enumerate(edges)]
+        )
+        self.conn.execute("DELETE FROM object_refs WHERE template_id = ?", (t_id,))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO object_refs (api_name, template_id, kind) VALUES (?, ?, ?)",
+            [(api_name, t_id, kind) for api_name, kind in helper.get_object_references(detail)]
+        )
+
+    def put_failed_detail(self, record, attachment):
+        """Stores a template whose Template Detail download failed; see put_template."""
+        self.conn.execute(
+            "INSERT INTO templates (id, name, main_object, active, system_modstamp, attachment_id, has_detail) "
+            "VALUES (?, ?, ?, ?, ?, ?, 0) ON CONFLICT(id) DO UPDATE SET name = excluded.name, "
+            "main_object = excluded.main_object, active = excluded.active, system_modstamp = excluded.system_modstamp, "
+            "attachment_id = excluded.attachment_id, attachment_modified = NULL, body_length = NULL, has_detail = 0",
+            (record["Id"], record.get("Name"), record.get("copado__Main_Object__c"),
+             _active_value(record), record.get("SystemModstamp"), attachment.get("Id"))
+        )
+
+    def update_record(self, record):
+        """Updates the record fields of a stored template, keeping its Template Detail data and edges."""
+        self.conn.execute(
+            "UPDATE templates SET name = ?, main_object = ?, active = ?, system_modstamp = ? WHERE id = ?",
+            (record.get("Name"), record.get("copado__Main_Object__c"),
+             _active_value(record), record.get("SystemModstamp"), record["Id"])
+        )
+
+    def delete_templates(self, template_ids):
+        """Removes templates and the edges they own. Returns the number of templates removed."""
+        removed = 0
+        for chunk in helper.chunk_list(list(template_ids), 500):
+            placeholders = ",".join("?" * len(chunk))
+            removed += self.conn.execute(f"DELETE FROM templates WHERE id IN ({placeholders})", chunk).rowcount
+            self.conn.execute(f"DELETE FROM edges WHERE source_id IN ({placeholders})", chunk)
+            self.conn.execute(f"DELETE FROM object_refs WHERE template_id IN ({placeholders})", chunk)
+        return removed
+
+    def put_labels(self, label_map):
+        self.conn.executemany("INSERT OR REPLACE INTO labels (api_name, label) VALUES (?, ?)", label_map.items())
+
+    # --- Reading ---
+
+    def count_templates(self):
+        return self.conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+    def get_template_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT id FROM templates")]
+
+    def get_attachment_stamps(self, template_ids):
+        """Returns { Id: (attachment_modified, body_length) } for stored templates with a parsed Template Detail."""
+        stamps = {}
+        for chunk in helper.chunk_list(list(template_ids), 500):
+            placeholders = ",".join("?" * len(chunk))
+            for t_id, modified, length in self.conn.execute(
+                    f"SELECT id, attachment_modified, body_length FROM templates WHERE has_detail = 1 AND id IN ({placeholders})", chunk):
+                stamps[t_id] = (modified, length)
+        return stamps
+
+    def get_missing_detail_ids(self):
+        """Returns the Ids of templates with a Template Detail Attachment that could not be downloaded or parsed."""
+        return [row[0] for row in self.conn.execute("SELECT id FROM templates WHERE attachment_id IS NOT NULL AND has_detail = 0")]
+
+    def max_stamp(self, column):
+        """Returns the newest value of a timestamp column ('system_modstamp' or 'attachment_modified')."""
+        if column not in ("system_modstamp", "attachment_modified"):
+            raise ValueError(f"Not a timestamp column: {column}")
+        return self.conn.execute(f"SELECT MAX({column}) FROM templates").fetchone()[0]
+
+    def get_template_ids_by_names(self, template_names):
+        """
+        Same contract as copado_helper.get_template_ids_by_names: case-insensitive,
+        the first template (by Id) wins when several share a name.
+        """
+        found = {}
+        for name in dict.fromkeys([n for n in template_names if n]):
+            row = self.conn.execute(
+                "SELECT id FROM templates WHERE name = ? COLLATE NOCASE ORDER BY id LIMIT 1", (name,)
+            ).fetchone()
+            if row:
+                found[name] = row[0]
+        return found
+
+    def get_template_names_by_ids(self, template_ids):
+        """Same contract as copado_helper.get_template_names_by_ids (15- or 18-character IDs)."""
+        found = {}
+        for t_id in dict.fromkeys([t for t in template_ids if t]):
+            row = self.conn.execute(
+                "SELECT name FROM templates WHERE id = ? OR substr(id, 1, 15) = ? ORDER BY id LIMIT 1", (t_id, t_id[:15])
+            ).fetchone()
+            if row:
+                found[t_id] = row[0]
+        return found
+
+    def resolve_id(self, template_id):
+        """Returns the stored 18-character Id for a 15- or 18-character Id, or None."""
+        row = self.conn.execute(
+            "SELECT id FROM templates WHERE id = ? OR substr(id, 1, 15) = ? ORDER BY id LIMIT 1",
+            (template_id, template_id[:15])
+        ).fetchone()
+        return row[0] if row else None
+
+    def load_graph(self):
+        """
+        Returns (template_names, template_objects, adjacency) as built by a live crawl:
+        template_objects only holds templates with a parsed Template Detail, and
+        adjacency lists child edges to known templates and all parent edges.
+        """
+        template_names = {}
+        template_objects = {}
+        for t_id, name, detail_object, has_detail in self.conn.execute(
+                "SELECT id, name, detail_object, has_detail FROM templates"):
+            template_names[t_id] = name
+            if has_detail:
+                template_objects[t_id] = detail_object
+
+        # References may use 15-character IDs; the API always returns 18-character ones
+        ids_15 = {t_id[:15]: t_id for t_id in template_names}
+        adjacency = {}
+        for source_id, target_id, target_name, kind in self.conn.execute(
+                "SELECT source_id, target_id, target_name, kind FROM edges ORDER BY source_id, position"):
+            target_id = target_id if target_id in template_names else ids_15.get(target_id[:15], target_id)
+            if kind == "child" and target_id not in template_names:
+                continue
+            if target_id not in template_names and target_name:
+                template_names[target_id] = target_name
+            adjacency.setdefault(source_id, []).append(target_id)
+        return template_names, template_objects, adjacency
+
+    def get_labels(self, api_names):
+        labels = {}
+        for chunk in helper.chunk_list(list(dict.fromkeys([n for n in api_names if n])), 500):
+            placeholders = ",".join("?" * len(chunk))
+            labels.update(self.conn.execute(
+                f"SELECT api_name, label FROM labels WHERE api_name IN ({placeholders})", chunk
+            ).fetchall())
+        return labels
+
+    def find_by_main_objects(self, objects, active_only=False):
+        """
+        Returns template rows (id, name, main_object, active) whose main object
+        matches one of objects (API names, '*' wildcards allowed).
+        """
+        rows = {}
+        for condition, params in _match_conditions("main_object", objects):
+            query = f"SELECT id, name, main_object, active FROM templates WHERE {condition}"
+            if active_only:
+                query += " AND active = 1"
+            for row in self.conn.execute(query, params):
+                rows.setdefault(row[0], row)
+        return sorted(rows.values())
+
+    def find_deep(self, objects, active_only=False):
+        """
+        Returns (object API name, template id, name, active, kind) for every way a
+        template touches one of objects (API names, '*' wildcards allowed):
+        main       - main object of the template record or Template Detail
+        reference  - target of one of its lookup fields
+        child      - object of a child relationship or child template
+        parent     - object of a parent template it references
+        """
+        matches = {}
+        for condition, params in _match_conditions("{column}", objects):
+            query = (
+                "SELECT m.api_name, t.id, t.name, t.active, m.kind FROM ("
+                f" SELECT main_object AS api_name, id AS template_id, 'main' AS kind FROM templates WHERE {condition.format(column='main_object')}"
+                f" UNION SELECT detail_object, id, 'main' FROM templates WHERE {condition.format(column='detail_object')}"
+                f" UNION SELECT api_name, template_id, kind FROM object_refs WHERE {condition.format(column='api_name')}"
+                " UNION SELECT p.detail_object, e.source_id, e.kind FROM edges e JOIN templates p ON p.id = e.target_id"
+                f" WHERE {condition.format(column='p.detail_object')}"
+                ") m JOIN templates t ON t.id = m.template_id"
+            )
+            if active_only:
+                query += " WHERE t.active = 1"
+            for row in self.conn.execute(query, params * 4):
+                matches[(row[0].lower(), row[1], row[4])] = row
+        return sorted(matches.values(), key=lambda r: (r[0].lower(), r[2] or "", r[1], r[4]))
+
+    # --- Dependents cache ---
+
+    def graph_version(self):
+        """Identifies the state of the graph; changes with every build or refresh."""
+        return self.get_meta("synced_at", "")
+
+    def get_cached_dependents(self, template_id):
+        """Returns the cached dependents of template_id for the current graph, or None."""
+        row = self.conn.execute("SELECT graph_version FROM dependents_cache WHERE template_id = ?", (template_id,)).fetchone()
+        if not row or row[0] != self.graph_version():
+            return None
+        return [r[0] for r in self.conn.execute("SELECT dependent_id FROM dependents WHERE template_id = ?", (template_id,))]
+
+    def put_cached_dependents(self, template_id, dependent_ids):
+        self.conn.execute("DELETE FROM dependents WHERE template_id = ?", (template_id,))
+        self.conn.executemany("INSERT INTO dependents (template_id, dependent_id) VALUES (?, ?)",
+                              [(template_id, d_id) for d_id in dependent_ids])
+        self.conn.execute("INSERT OR REPLACE INTO dependents_cache (template_id, graph_version) VALUES (?, ?)",
+                          (template_id, self.graph_version()))
+
+    def get_template_details(self, template_ids):
+        """
+        Returns { Id: (name, detail_object, active, top_level) } for stored templates,
+        where top_level means no other template lists it as a child.
+        """
+        details = {}
+        for chunk in helper.chunk_list(list(template_ids), 500):
+            placeholders = ",".join("?" * len(chunk))
+            for t_id, name, detail_object, active, is_child in self.conn.execute(
+                    "SELECT t.id, t.name, t.detail_object, t.active, "
+                    "EXISTS (SELECT 1 FROM edges e WHERE e.target_id = t.id AND e.kind = 'child') "
+                    f"FROM templates t WHERE t.id IN ({placeholders})", chunk):
+                details[t_id] = (name, detail_object, None if active is None else bool(active), not is_child)
+        return details
+
+def is_outdated(index):
+    """True if the index was built with an older schema and lacks data newer commands read."""
+    return int(index.get_meta("schema_version", 0)) < SCHEMA_VERSION
+
+def open_index(path, warn_outdated=True):
+    """Opens an existing index, or returns None (with a message) if there is none."""
+    if not os.path.exists(path):
+        print(f"Error: No template index at {path}. Run 'mxp index build' first.")
+        return None
+    index = TemplateIndex(path)
+    if warn_outdated and is_outdated(index):
+        print(f"Warning: {path} was built by an older mxp. Run 'mxp index build' for complete results.")
+    built_at = index.get_meta("built_at")
+    if built_at:
+        age_hours = (time.time() - float(built_at)) / 3600
+        print(f"Using template index {path} ({index.count_templates()} templates, built {age_hours:.1f}h ago).")
+    return index
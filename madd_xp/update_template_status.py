@@ -1,45 +1,101 @@
 import argparse
-from simple_salesforce import Salesforce
+import json
+from concurrent.futures import ThreadPoolExecutor
 try:
     from . import copado_helper as helper
+    from . import metrics
 except ImportError:
     import copado_helper as helper
+    import metrics
+
+# sObject Collections accept at most 200 records per request
+COLLECTION_SIZE = 200
+DEFAULT_CONCURRENCY = 4
 
 def add_args(parser):
     parser.add_argument("-u", "--username", required=True, help="Salesforce CLI Org Alias")
-    parser.add_argument("-i", "--ids", required=True, nargs='+', metavar="ID", help="List of Template Record IDs (Space separated or JSON array)")
+    parser.add_argument("--no-session-cache", action="store_true", help="Ignore the cached session and fetch fresh credentials from the SF CLI.")
+    parser.add_argument("--max-api-calls", type=int, default=None, metavar="N", help="Stop the run with an error before it makes more than N Salesforce API calls")
+    parser.add_argument("-i", "--ids", required=False, nargs='+', metavar="ID", help="List of Template Record IDs (Space separated or JSON array)")
+    parser.add_argument("-f", "--file", default=None, metavar="PATH", help="Read Template Record IDs from a file (one per line or comma-separated). Use '-' for stdin.")
+    parser.add_argument("--all-or-none", action="store_true", help="Roll back every record of a 200-record request if any of them fails")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, metavar="N", help=f"Number of 200-record requests sent in parallel (default: {DEFAULT_CONCURRENCY})")
+
+def update_chunk(sf, chunk, active, all_or_none):
+    """
+    Updates copado__Active__c for up to 200 templates with one sObject Collections call.
+    Returns: List of (template_id, error message or None) in input order.
+    """
+    payload = {
+        "allOrNone": all_or_none,
+        "records": [
+            {"attributes": {"type": "copado__Data_Template__c"}, "id": t_id, "copado__Active__c": active}
+            for t_id in chunk
+        ]
+    }
+    try:
+        results = sf.restful("composite/sobjects", method="PATCH", data=json.dumps(payload))
+    except helper.ApiBudgetExceeded:
+        raise
+    except Exception as e:
+        return [(t_id, str(e)) for t_id in chunk]
+
+    outcomes = []
+    for t_id, result in zip(chunk, results):
+        if result.get("success"):
+            outcomes.append((t_id, None))
+        else:
+            errors = result.get("errors") or []
+            message = "; ".join(f"{err.get('statusCode')}: {err.get('message')}" for err in errors) or "Unknown error"
+            outcomes.append((t_id, message))
+    return outcomes
 
 def run(args, active):
     mode = "activate" if active else "deactivate"
     
     org_alias = args.username
     template_ids = helper.parse_arg_list(args.ids)
+    if args.file:
+        try:
+            template_ids = template_ids + helper.read_list_file(args.file)
+        except IOError as e:
+            print(f"Error reading IDs from {args.file}: {e}")
+            return
+
+    # Collections reject duplicate IDs within a request
+    template_ids = list(dict.fromkeys(template_ids))
     
     if not template_ids:
         print("No IDs provided.")
         return
 
+    metrics.start_phase("auth")
     print(f"Logging into {org_alias}...")
     try:
-        access_token, instance_url = helper.get_sf_cli_credentials(org_alias)
-        sf = Salesforce(instance_url=instance_url, session_id=access_token)
+        sf, instance_url = helper.connect(org_alias, use_cache=not args.no_session_cache, pool_size=max(1, args.concurrency),
+                                          max_api_calls=args.max_api_calls)
     except Exception as e:
         print(f"Authentication failed: {e}")
         return
 
-    print(f"Starting {mode} for {len(template_ids)} templates...")
+    chunks = list(helper.chunk_list(template_ids, COLLECTION_SIZE))
+    print(f"Starting {mode} for {len(template_ids)} templates in {len(chunks)} request(s)...")
     
+    metrics.start_phase("update")
     success_count = 0
-    for t_id in template_ids:
-        try:
-            # Update the copado__Active__c field
-            sf.Copado__Data_Template__c.update(t_id, {'copado__Active__c': active})
-            print(f"[{'OK' if active else 'OK'}] {t_id} -> {'Active' if active else 'Inactive'}")
-            success_count += 1
-        except Exception as e:
-            print(f"[ERR] {t_id}: {e}")
+    workers = max(1, min(args.concurrency, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(update_chunk, sf, chunk, active, args.all_or_none) for chunk in chunks]
+        # Report in input order
+        for future in futures:
+            for t_id, error in future.result():
+                if error is None:
+                    helper.log_detail(f"[OK] {t_id} -> {'Active' if active else 'Inactive'}")
+                    success_count += 1
+                else:
+                    print(f"[ERR] {t_id}: {error}")
     
     print(f"\nCompleted. Successfully {mode}d {success_count}/{len(template_ids)} templates.")
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
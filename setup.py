@@ -8,6 +8,9 @@ setup(
         "simple-salesforce",
         "requests"
     ],
+    extras_require={
+        "stats": ["numpy"]
+    },
     entry_points={
         "console_scripts": [
             "mxp=madd_xp.cli:main",
@@ -0,0 +1,139 @@
+"""
+In-memory org built from a recorded fixture (tests/fixtures/*.json).
+Answers the template, Attachment, EntityDefinition and describeGlobal calls
+that mxp makes, so commands can run end to end without network:
+
+    org = FakeOrg.from_fixture("index_org.json")
+    with org.patched():
+        get_objects_in_template.run(args)
+"""
+import copy
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import patch
+from madd_xp import copado_helper as helper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def _parse_stamp(value):
+    if value.endswith("Z") and "." not in value:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+def _since(q, field):
+    """Returns the datetime of a 'field >= literal' filter in q, or None."""
+    match = re.search(field + r" >= (\S+)", q)
+    return _parse_stamp(match.group(1)) if match else None
+
+class _SObject:
+    """Stands in for simple_salesforce's SFType for the getDeleted resource."""
+
+    def __init__(self, org):
+        self.org = org
+
+    def deleted(self, start, end):
+        self.org.deleted_calls.append((start, end))
+        return {"deletedRecords": [{"id": t_id, "deletedDate": "2024-04-01T00:00:00.000+0000"} for t_id in self.org.deleted]}
+
+class FakeOrg:
+
+    def __init__(self, data):
+        self.instance_url = data["instance_url"]
+        self.templates = {t["Id"]: dict(t) for t in data["templates"]}
+        self.details = copy.deepcopy(data["details"])
+        self.labels = dict(data["labels"])
+        self.attachment_stamps = {t_id: self.templates[t_id]["SystemModstamp"] for t_id in self.details}
+        self.deleted = []
+        self.deleted_calls = []
+        self.session_id = "TOKEN"
+        self.queries = []
+        self.downloads = []
+        # Template Ids whose Attachment body download fails
+        self.failing_downloads = set()
+
+    @classmethod
+    def from_fixture(cls, name):
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def attachment(self, t_id):
+        """Attachment metadata row of a template, or None if it has no Template Detail."""
+        if t_id not in self.details:
+            return None
+        body = json.dumps(self.details[t_id])
+        stamp = self.attachment_stamps[t_id]
+        return {"Id": "00P" + t_id[3:], "ParentId": t_id, "Body": f"/Attachment/00P{t_id[3:]}/Body",
+                "LastModifiedDate": stamp, "BodyLength": len(body)}
+
+    # --- Changes ---
+
+    def update_record(self, t_id, stamp, **fields):
+        self.templates.setdefault(t_id, {"Id": t_id}).update(fields, SystemModstamp=stamp)
+
+    def update_detail(self, t_id, detail, stamp):
+        self.details[t_id] = detail
+        self.attachment_stamps[t_id] = stamp
+
+    def delete(self, t_id):
+        del self.templates[t_id]
+        self.details.pop(t_id, None)
+        self.deleted.append(t_id)
+
+    # --- Salesforce API ---
+
+    def query_all(self, q):
+        self.queries.append(q)
+        values = re.findall(r"'((?:[^'\\]|\\.)*)'", q)
+        records = []
+        if "FROM copado__Data_Template__c" in q:
+            if "Name IN" in q:
+                lowered = {v.lower() for v in values}
+                records = [t for t in self.templates.values() if t["Name"].lower() in lowered]
+            elif "Id IN" in q:
+                records = [t for t in self.templates.values() if t["Id"] in values or t["Id"][:15] in values]
+            else:
+                since = _since(q, "SystemModstamp")
+                records = [t for t in self.templates.values() if not since or _parse_stamp(t["SystemModstamp"]) >= since]
+        elif "FROM Attachment" in q and "ParentId IN" in q:
+            records = [self.attachment(t_id) for t_id in self.templates if t_id in values and t_id in self.details]
+        elif "FROM Attachment" in q:
+            since = _since(q, "LastModifiedDate")
+            records = [{"ParentId": t_id} for t_id, stamp in self.attachment_stamps.items()
+                       if t_id in self.details and _parse_stamp(stamp) >= since]
+        elif "FROM EntityDefinition" in q:
+            records = [{"QualifiedApiName": n, "Label": self.labels[n]} for n in values if n in self.labels]
+        return {"records": copy.deepcopy(records), "totalSize": len(records), "done": True}
+
+    query = query_all
+
+    def query_all_iter(self, q):
+        return iter(self.query_all(q)["records"])
+
+    def __getattr__(self, name):
+        if name.endswith("__c"):
+            return _SObject(self)
+        raise AttributeError(name)
+
+    def describe(self):
+        return {"sobjects": [{"name": n, "label": l} for n, l in self.labels.items()]}
+
+    def download(self, sf, instance_url, access_token, record_id, attachment_name, download_dir, file_alias=None, body_url=None,
+                 cache=None, attachment=None):
+        """Stands in for copado_helper.get_attachment_by_record_id."""
+        self.downloads.append(record_id)
+        if record_id in self.failing_downloads:
+            return None
+        detail = copy.deepcopy(self.details.get(record_id))
+        if cache is not None and detail is not None:
+            cache.put(record_id, attachment, detail, name=file_alias)
+        return detail
+
+    @contextmanager
+    def patched(self):
+        """Routes helper.connect and attachment downloads to this org."""
+        with patch.object(helper, "connect", return_value=(self, self.instance_url)), \
+             patch.object(helper, "get_attachment_by_record_id", side_effect=self.download):
+            yield self
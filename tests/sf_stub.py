@@ -0,0 +1,212 @@
+"""
+Local stand-in for the subset of the Salesforce REST API that mxp uses:
+query/queryMore (including EntityDefinition), Bulk API 2.0 query jobs,
+Attachment bodies, describeGlobal and sObject Collections updates.
+Point an org alias at it by caching a session for its plain-HTTP URL:
+
+    stub = SalesforceStub(resolver).start()
+    helper.save_cached_session("stubOrg", "TOKEN", stub.url)
+
+simple_salesforce always builds https:// URLs, so starting a stub also wraps
+helper.connect to send those to plain-HTTP instance URLs (see serve_over_http).
+"""
+import csv
+import io
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from requests.adapters import HTTPAdapter
+from madd_xp import copado_helper as helper
+
+API_PREFIX = re.compile(r"^/services/data/v[\d.]+/")
+
+def _csv_value(value):
+    """Formats a value the way Bulk API 2.0 writes it to CSV."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+class _PlainHTTPAdapter(HTTPAdapter):
+    """Sends https:// requests over plain HTTP."""
+
+    def send(self, request, **kwargs):
+        request.url = "http://" + request.url[len("https://"):]
+        return super().send(request, **kwargs)
+
+def serve_over_http():
+    """
+    Wraps helper.connect (once per process) so connections to an http://
+    instance URL send simple_salesforce's https:// requests over plain HTTP.
+    Connections to https:// instance URLs are left alone. Worker processes
+    forked afterwards inherit the wrapper.
+    """
+    connect = helper.connect
+    if getattr(connect, "serves_http", False):
+        return
+
+    def connect_over_http(*args, **kwargs):
+        sf, instance_url = connect(*args, **kwargs)
+        if instance_url.startswith("http://"):
+            sf.session.mount(f"https://{urlparse(instance_url).netloc}", _PlainHTTPAdapter())
+        return sf, instance_url
+
+    connect_over_http.serves_http = True
+    helper.connect = connect_over_http
+
+class SalesforceStub:
+    """
+    Serves query/queryMore and Bulk API 2.0 query jobs.
+    resolver: callable(soql) -> list of row dicts answering the query.
+    bodies: { Attachment Id: bytes or JSON-serializable body } served at
+    sobjects/Attachment/<Id>/Body.
+    sobjects: describeGlobal list ([{"name", "label"}, ...]).
+    faults: (status, body) responses served, in order, before regular answers.
+    api_usage: (used, limit) reported in the Sforce-Limit-Info header; used
+    grows by one per request.
+    """
+
+    def __init__(self, resolver, page_size=2000, bulk_polls=1, bodies=None, sobjects=None):
+        self.resolver = resolver
+        self.page_size = page_size
+        self.bulk_polls = bulk_polls
+        self.bodies = bodies if bodies is not None else {}
+        self.sobjects = sobjects if sobjects is not None else []
+        self.updates = []
+        self.requests = []
+        self.faults = []
+        self.api_usage = None
+        self.cursors = {}
+        self.jobs = {}
+        self.server = None
+        self.url = None
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Headers and body are separate writes; avoid delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def do_PATCH(self):
+                stub._dispatch(self, "PATCH")
+
+        serve_over_http()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    # --- Plumbing ---
+
+    def _send(self, handler, status, body, content_type="application/json", headers=None):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        if self.api_usage:
+            handler.send_header("Sforce-Limit-Info", f"api-usage={self.api_usage[0]}/{self.api_usage[1]}")
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _dispatch(self, handler, method):
+        parsed = urlparse(handler.path)
+        path = API_PREFIX.sub("", parsed.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        self.requests.append((method, parsed.path))
+        if self.api_usage:
+            self.api_usage = (self.api_usage[0] + 1, self.api_usage[1])
+        if self.faults:
+            status, fault = self.faults.pop(0)
+            return self._send(handler, status, fault)
+
+        try:
+            if method == "GET" and path == "query/":
+                return self._send(handler, 200, self._query_page(self.resolver(params["q"]), 0))
+            if method == "GET" and path.startswith("query/"):
+                cursor_id, offset = path[len("query/"):].split("-")
+                return self._send(handler, 200, self._query_page(self.cursors[cursor_id], int(offset), cursor_id))
+            if method == "GET" and path.rstrip("/") == "sobjects":
+                return self._send(handler, 200, {"sobjects": self.sobjects})
+            match = re.match(r"^sobjects/Attachment/([^/]+)/Body$", path)
+            if method == "GET" and match:
+                if match.group(1) not in self.bodies:
+                    return self._send(handler, 404, [{"errorCode": "NOT_FOUND", "message": handler.path}])
+                return self._send(handler, 200, self.bodies[match.group(1)])
+            if method == "PATCH" and path == "composite/sobjects":
+                return self._send(handler, 200, self._update_records(json.loads(body)))
+            if method == "POST" and path == "jobs/query":
+                return self._send(handler, 200, self._create_job(json.loads(body)))
+            match = re.match(r"^jobs/query/([^/]+)(/results)?$", path)
+            if method == "GET" and match:
+                job = self.jobs[match.group(1)]
+                if match.group(2):
+                    return self._send_results(handler, job, params)
+                job["polls"] += 1
+                state = "JobComplete" if job["polls"] > self.bulk_polls else "InProgress"
+                return self._send(handler, 200, {"id": job["id"], "state": state})
+        except Exception as e:
+            return self._send(handler, 400, [{"errorCode": "MALFORMED_QUERY", "message": str(e)}])
+        return self._send(handler, 404, [{"errorCode": "NOT_FOUND", "message": handler.path}])
+
+    # --- sObject Collections ---
+
+    def _update_records(self, request):
+        self.updates.extend(request["records"])
+        return [{"id": record["id"], "success": True, "errors": []} for record in request["records"]]
+
+    # --- REST query ---
+
+    def _query_page(self, rows, offset, cursor_id=None):
+        end = offset + self.page_size
+        page = {"totalSize": len(rows), "done": end >= len(rows), "records": rows[offset:end]}
+        if not page["done"]:
+            cursor_id = cursor_id or uuid.uuid4().hex
+            self.cursors[cursor_id] = rows
+            page["nextRecordsUrl"] = f"/services/data/v59.0/query/{cursor_id}-{end}"
+        return page
+
+    # --- Bulk API 2.0 ---
+
+    def _create_job(self, request):
+        job_id = "750" + uuid.uuid4().hex[:15]
+        self.jobs[job_id] = {"id": job_id, "rows": self.resolver(request["query"]), "polls": 0}
+        return {"id": job_id, "operation": "query", "state": "UploadComplete"}
+
+    def _send_results(self, handler, job, params):
+        rows = job["rows"]
+        offset = int(params.get("locator") or 0)
+        limit = int(params.get("maxRecords") or len(rows) or 1)
+        page = rows[offset:offset + limit]
+        columns = list(rows[0].keys()) if rows else []
+
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        for row in page:
+            writer.writerow([_csv_value(row.get(c)) for c in columns])
+        next_offset = offset + limit
+        locator = str(next_offset) if next_offset < len(rows) else "null"
+        return self._send(handler, 200, out.getvalue().encode("utf-8"), "text/csv", {"Sforce-Locator": locator})
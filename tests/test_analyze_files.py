@@ -0,0 +1,127 @@
+import re
+import unittest
+from unittest.mock import patch
+from madd_xp import analyze_files, file_stats
+
+COMMITS = [("S1", "D1"), ("S1", "D2"), ("S2", "D1"), ("S3", "D3"), ("S3", "D3")]
+LINKS = [("D1", "C1"), ("D1", "C2"), ("D2", "C3"), ("D3", "C4"), ("D3", "C5")]
+VERSIONS = {
+    "C1": {"Title": "a.records", "FileExtension": "csv", "ContentSize": 1000, "PathOnClient": "a.records.csv", "CreatedDate": "2024-01-10T08:00:00.000+0000"},
+    "C2": {"Title": "a", "FileExtension": "template", "ContentSize": 200, "PathOnClient": "a.template", "CreatedDate": "2024-01-20T08:00:00.000+0000"},
+    "C3": {"Title": "b.records", "FileExtension": "csv", "ContentSize": 3000000, "PathOnClient": "b.records.csv", "CreatedDate": "2024-03-05T08:00:00.000+0000"},
+    "C4": {"Title": "x", "FileExtension": "txt", "ContentSize": 5, "PathOnClient": "x.txt", "CreatedDate": "2024-02-01T08:00:00.000+0000"},
+    "C5": {"Title": "c", "FileExtension": "template", "ContentSize": 700, "PathOnClient": "c.template", "CreatedDate": "2023-12-01T08:00:00.000+0000"},
+}
+
+class FakeSalesforce:
+    """Answers the row and aggregate queries of analyze_files from the tables above."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, q):
+        self.queries.append(q)
+        ids = re.findall(r"'([A-Z]\d)'", q)
+        if "GROUP BY copado__Data_Set__c" in q:
+            stories = {}
+            for s_id, d_id in COMMITS:
+                stories.setdefault(d_id, set()).add(s_id)
+            records = [{"ds": d_id, "stories": len(s)} for d_id, s in stories.items()]
+        elif "COUNT_DISTINCT" in q:
+            records = [{"stories": len({s for s, _ in COMMITS})}]
+        elif "FROM copado__User_Story_Data_Commit__c" in q:
+            rows = sorted(COMMITS, key=lambda c: (c[1], c[0])) if "ORDER BY" in q else COMMITS
+            records = [{"copado__User_Story__c": s, "copado__Data_Set__c": d} for s, d in rows]
+        elif "COUNT(Id)" in q:
+            if "SELECT copado__Data_Set__c FROM" in q:
+                raise Exception("MALFORMED_QUERY: nested semi-joins are not supported")
+            kind = "template" if "NOT" in q else "records"
+            docs = {c for d, c in LINKS if d in ids}
+            matched = [VERSIONS[c] for c in docs if analyze_files.classify_file(VERSIONS[c]) == kind]
+            records = [{"files": len(matched), "bytes": sum(v["ContentSize"] for v in matched) or None}]
+        elif "FROM ContentDocumentLink" in q:
+            records = [{"LinkedEntityId": d, "ContentDocumentId": c} for d, c in LINKS if d in ids]
+        elif "FROM ContentVersion" in q:
+            records = [dict(ContentDocumentId=c, **v) for c, v in VERSIONS.items() if c in ids]
+        return {"records": records, "totalSize": len(records), "done": True}
+
+    query_all = query
+
+    def query_all_iter(self, q):
+        return iter(self.query(q)["records"])
+
+class TestAnalyzeFiles(unittest.TestCase):
+
+    def test_classify_file(self):
+        """Files are classified by path, title and extension"""
+        self.assertEqual(analyze_files.classify_file({"PathOnClient": "X.RECORDS.CSV"}), "records")
+        self.assertEqual(analyze_files.classify_file({"Title": "x.records", "FileExtension": "csv"}), "records")
+        self.assertEqual(analyze_files.classify_file({"FileExtension": "template"}), "template")
+        self.assertIsNone(analyze_files.classify_file({"PathOnClient": "x.txt"}))
+
+    def test_streamed_pipeline(self):
+        """The streamed pipeline weights each file by the stories committing its Data Set"""
+        sf = FakeSalesforce()
+        self.assertEqual(list(analyze_files.iter_dataset_story_counts(sf)), [("D1", 2), ("D2", 1), ("D3", 1)])
+
+        summary = analyze_files.new_summary()
+        summary["stories"] = analyze_files.count_stories(sf)
+        analyze_files.stream_file_totals(sf, analyze_files.iter_dataset_story_counts(sf), summary, chunk_size=2)
+
+        self.assertEqual((summary["datasets"], summary["story_links"], summary["stories"]), (3, 4, 3))
+        self.assertEqual(summary["totals"], {"records": [3, 3002000], "template": [3, 1100]})
+
+    def test_distributions(self):
+        """Size percentiles, top Data Sets/User Stories and monthly growth, with and without NumPy"""
+        expected = {
+            "sizes": {"records": {"files": 2, "p50": 1000, "p95": 3000000, "max": 3000000},
+                      "template": {"files": 2, "p50": 200, "p95": 700, "max": 700},
+                      "combined": {"files": 4, "p50": 700, "p95": 3000000, "max": 3000000}},
+            "top_datasets": [{"id": "D2", "files": 1, "bytes": 3000000, "stories": 1},
+                             {"id": "D1", "files": 2, "bytes": 1200, "stories": 2}],
+            "top_stories": [{"id": "S1", "datasets": 2, "bytes": 3001200},
+                            {"id": "S2", "datasets": 1, "bytes": 1200}],
+            "monthly": [{"month": "2023-12", "files": 1, "bytes": 700, "cumulative_bytes": 700},
+                        {"month": "2024-01", "files": 2, "bytes": 1200, "cumulative_bytes": 1900},
+                        {"month": "2024-03", "files": 1, "bytes": 3000000, "cumulative_bytes": 3001900}]
+        }
+        sf = FakeSalesforce()
+        # Off by default: nothing per file is kept
+        self.assertIsNone(analyze_files.new_summary()["stats"])
+        summary = analyze_files.new_summary(distributions=True)
+        dataset_counts = analyze_files.iter_dataset_story_counts(sf, stats=summary["stats"])
+        analyze_files.stream_file_totals(sf, dataset_counts, summary, chunk_size=2)
+        self.assertEqual(len(summary["stats"]), 4)
+
+        with patch.object(file_stats, "numpy", None):
+            self.assertEqual(summary["stats"].compute(top=2), expected)
+        if file_stats.numpy is not None:
+            self.assertEqual(summary["stats"].compute(top=2), expected)
+
+    def test_distributions_count_each_file_once(self):
+        """A file linked to Data Sets in two chunks is one file with two links"""
+        with patch(f"{__name__}.LINKS", LINKS + [("D2", "C1")]):
+            sf = FakeSalesforce()
+            summary = analyze_files.new_summary(distributions=True)
+            dataset_counts = analyze_files.iter_dataset_story_counts(sf, stats=summary["stats"])
+            analyze_files.stream_file_totals(sf, dataset_counts, summary, chunk_size=1)
+        distributions = summary["stats"].compute(top=1)
+        self.assertEqual(distributions["sizes"]["combined"]["files"], 4)
+        self.assertEqual(sum(m["files"] for m in distributions["monthly"]), 4)
+        self.assertEqual(distributions["top_datasets"], [{"id": "D2", "files": 2, "bytes": 3001000, "stories": 1}])
+
+    def test_aggregate_matches_stream(self):
+        """Aggregate mode produces the same counts and totals as the streamed path"""
+        sf = FakeSalesforce()
+        summary = analyze_files.new_summary()
+        analyze_files.stream_file_totals(sf, analyze_files.iter_dataset_story_counts(sf), summary)
+
+        agg_stories, agg_story_count = analyze_files.load_dataset_story_counts_aggregate(sf)
+        agg_totals = analyze_files.sum_files_by_aggregate(sf, agg_stories)
+
+        self.assertEqual(agg_stories, dict(analyze_files.iter_dataset_story_counts(sf)))
+        self.assertEqual(agg_story_count, 3)
+        self.assertEqual(agg_totals, summary["totals"])
+
+if __name__ == '__main__':
+    unittest.main()
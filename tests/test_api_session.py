@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from simple_salesforce.exceptions import SalesforceError
+from madd_xp import copado_helper as helper
+from tests.sf_stub import SalesforceStub
+
+ROWS = [{"Id": f"a0U00000000000{i}AAA", "Name": f"Template {i}"} for i in range(5)]
+
+class TestApiSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.delay = patch.object(helper, "RETRY_BASE_DELAY", 0)
+        self.delay.start()
+        self.stub = SalesforceStub(lambda q: ROWS, page_size=2).start()
+        helper.save_cached_session("stubOrg", "TOKEN", self.stub.url)
+        # Start from a fresh shared session so counters and limits are this test's own
+        helper._http_session = None
+        helper._http_pool_size = 0
+
+    def tearDown(self):
+        self.stub.stop()
+        self.delay.stop()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_retries_throttled_calls_and_backs_off(self):
+        """503 and concurrent REQUEST_LIMIT_EXCEEDED are retried and halve the in-flight limit"""
+        sf, _ = helper.connect("stubOrg", pool_size=8)
+        self.stub.api_usage = (13999, 15000)
+        self.stub.faults = [(503, [{"errorCode": "SERVER_UNAVAILABLE", "message": "busy"}]),
+                            (403, [{"errorCode": "REQUEST_LIMIT_EXCEEDED", "message": "ConcurrentPerOrgLongTxn Limit exceeded"}])]
+        with patch("builtins.print") as printed:
+            records = sf.query_all("SELECT Id, Name FROM copado__Data_Template__c")["records"]
+        session = helper.get_http_session()
+        self.assertEqual(len(records), 5)
+        self.assertEqual(session.retries, 2)
+        # Halved twice (8 -> 2), then grown a little by the three successful pages
+        self.assertTrue(2 < session.in_flight_limit < 4)
+        self.assertEqual(session.api_usage, (14004, 15000))
+        self.assertTrue(any("daily API requests" in str(c) for c in printed.call_args_list))
+
+    def test_daily_limit_is_not_retried(self):
+        """Exceeding the org's daily TotalRequests limit fails at once"""
+        sf, _ = helper.connect("stubOrg")
+        self.stub.faults = [(403, [{"errorCode": "REQUEST_LIMIT_EXCEEDED", "message": "TotalRequests Limit exceeded."}])]
+        with self.assertRaises(SalesforceError):
+            sf.query_all("SELECT Id FROM copado__Data_Template__c")
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_max_api_calls_stops_the_run(self):
+        """The --max-api-calls budget raises instead of being skipped like a failed chunk"""
+        sf, _ = helper.connect("stubOrg", max_api_calls=2)
+        with self.assertRaises(helper.ApiBudgetExceeded), patch("builtins.print"):
+            helper.get_template_names_by_ids(sf, [r["Id"] for r in ROWS])
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_download_batch_looks_up_body_urls_once(self):
+        """A batch of downloads costs one Attachment query plus one GET per body"""
+        details = {r["Id"]: {"dataTemplate": {"templateMainObject": "Account"}} for r in ROWS[:3]}
+        attachments = [{"Id": "00P" + t_id[3:], "ParentId": t_id, "Body": f"/services/data/v59.0/sobjects/Attachment/00P{t_id[3:]}/Body",
+                        "LastModifiedDate": "2024-03-01T10:00:00.000+0000", "BodyLength": 10} for t_id in details]
+        self.stub.resolver = lambda q: attachments
+        self.stub.bodies = {a["Id"]: details[a["ParentId"]] for a in attachments}
+        sf, instance_url = helper.connect("stubOrg")
+        with patch("builtins.print") as printed:
+            results = helper.download_attachments(sf, instance_url, sf.session_id, [(r["Id"], r["Name"]) for r in ROWS], "Template Detail", None)
+        self.assertEqual(results, {**details, ROWS[3]["Id"]: None, ROWS[4]["Id"]: None})
+        paths = [path for method, path in self.stub.requests]
+        # One query (two pages of the stub's page size 2), no per-template lookups
+        self.assertEqual(sum(p.endswith("/query/") for p in paths), 1)
+        self.assertEqual(sum(p.endswith("/Body") for p in paths), 3)
+        self.assertEqual(len(paths), 5)
+        printed.assert_any_call(f"Warning: No attachment named 'Template Detail' found for ID {ROWS[3]['Id']} (Template 3).")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import argparse
+import csv
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import analyze_files, copado_helper as helper, find_templates
+from tests.sf_stub import SalesforceStub
+
+TEMPLATES = [
+    {"Id": "a0U000000000001AAA", "Name": "Accounts", "copado__Main_Object__c": "Account", "copado__Active__c": True},
+    {"Id": "a0U000000000002AAA", "Name": "Accounts, \"Legacy\"", "copado__Main_Object__c": "Account", "copado__Active__c": False},
+    {"Id": "a0U000000000003AAA", "Name": "Contacts", "copado__Main_Object__c": None, "copado__Active__c": True},
+]
+
+def resolve(query):
+    if "FROM copado__Data_Template__c" in query:
+        return [t for t in TEMPLATES if t["copado__Main_Object__c"] == "Account"]
+    if "FROM copado__User_Story_Data_Commit__c" in query:
+        return [{"copado__User_Story__c": "S1", "copado__Data_Set__c": "D1"},
+                {"copado__User_Story__c": "S2", "copado__Data_Set__c": "D1"}]
+    if "FROM ContentDocumentLink" in query:
+        return [{"ContentDocumentId": "C1", "LinkedEntityId": "D1"}]
+    if "FROM ContentVersion" in query:
+        return [{"Id": "V1", "ContentDocumentId": "C1", "Title": "x.records", "FileExtension": "csv",
+                 "ContentSize": 2048, "PathOnClient": "x.records.csv"}]
+    raise ValueError(f"Unexpected query: {query}")
+
+class TestBulkQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.stub = SalesforceStub(resolve).start()
+        helper.save_cached_session("stubOrg", "TOKEN", self.stub.url)
+        self.sf, _ = helper.connect("stubOrg")
+
+    def tearDown(self):
+        self.stub.stop()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_bulk_query_iter_pages_and_nulls(self):
+        """Result pages are followed via Sforce-Locator and empty values become None"""
+        rows = list(helper.bulk_query_iter(self.sf, "SELECT Id FROM copado__Data_Template__c", poll_interval=0.01, max_records=1))
+        self.assertEqual([r["Name"] for r in rows], ["Accounts", "Accounts, \"Legacy\""])
+        self.assertEqual(rows[1]["copado__Active__c"], "false")
+        result_calls = [path for method, path in self.stub.requests if path.endswith("/results")]
+        self.assertEqual(len(result_calls), 2)
+
+    def test_find_templates_bulk(self):
+        """'mxp template find --bulk' writes the same rows as the REST query"""
+        output = os.path.join(self.tmp.name, "found.csv")
+        args = argparse.Namespace(username="stubOrg", no_session_cache=False, max_api_calls=None, objects=["Account"],
+                                  active=False, output=output, json=False, bulk=True, offline=False, index=None, deep=False)
+        with patch("builtins.print"):
+            find_templates.run(args)
+
+        with open(output, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r["template_id"] for r in rows], ["a0U000000000001AAA", "a0U000000000002AAA"])
+        self.assertEqual([r["active"] for r in rows], ["True", "False"])
+        self.assertTrue(any(path.endswith("/jobs/query") for _, path in self.stub.requests))
+
+    def test_stream_file_totals_bulk(self):
+        """Bulk CSV rows feed the streamed analytics pipeline"""
+        query_iter = lambda q: helper.bulk_query_iter(self.sf, q, poll_interval=0.01)
+        summary = analyze_files.new_summary()
+        analyze_files.stream_file_totals(self.sf, analyze_files.iter_dataset_story_counts(self.sf, query_iter=query_iter),
+                                         summary, query_iter=query_iter)
+        self.assertEqual(summary["story_links"], 2)
+        self.assertEqual(summary["totals"]["records"], [2, 4096])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -42,6 +42,23 @@ class TestCliLogic(unittest.TestCase):
         self.assertEqual(args.templates, ['Template1'])
         self.assertFalse(args.json)
 
+    @patch('madd_xp.get_objects_in_template.run')
+    def test_cli_get_objects_concurrency(self, mock_run):
+        """Test '--concurrency' parsing and default on 'get template objects'"""
+        test_args = ['mxp', 'template', 'get', 'template', 'objects', '-u', 'myOrg', '-i', 'ID1', '--concurrency', '16']
+        with patch.object(sys, 'argv', test_args):
+            cli_main()
+
+        args = mock_run.call_args[0][0]
+        self.assertEqual(args.concurrency, 16)
+
+        test_args = ['mxp', 'template', 'get', 'template', 'objects', '-u', 'myOrg', '-i', 'ID1']
+        with patch.object(sys, 'argv', test_args):
+            cli_main()
+
+        args = mock_run.call_args[0][0]
+        self.assertEqual(args.concurrency, 8)
+
     @patch('madd_xp.update_template_status.run')
     def test_cli_activate(self, mock_run):
         """Test 'mxp template activate' command parsing"""
@@ -70,6 +87,20 @@ class TestCliLogic(unittest.TestCase):
         _, active = mock_run.call_args[0]
         self.assertFalse(active)
 
+    @patch('madd_xp.update_template_status.run')
+    def test_cli_deactivate_from_file(self, mock_run):
+        """Test 'mxp template deactivate' with IDs from a file and all-or-none"""
+        test_args = ['mxp', 'template', 'deactivate', '-u', 'myOrg', '--file', 'ids.txt', '--all-or-none', '--concurrency', '2']
+        with patch.object(sys, 'argv', test_args):
+            cli_main()
+
+        args, active = mock_run.call_args[0]
+        self.assertIsNone(args.ids)
+        self.assertEqual(args.file, 'ids.txt')
+        self.assertTrue(args.all_or_none)
+        self.assertEqual(args.concurrency, 2)
+        self.assertFalse(active)
+
     @patch('madd_xp.analyze_files.run')
     def test_cli_analytics_files(self, mock_run):
         """Test 'mxp analytics files' command parsing"""
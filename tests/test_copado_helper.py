@@ -0,0 +1,112 @@
+import json
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import copado_helper as helper
+from tests.fake_org import FakeOrg
+
+class TestSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_save_and_load_restrictive_mode(self):
+        """Cached sessions round-trip and are only readable by the owner"""
+        helper.save_cached_session("myOrg", "TOKEN", "https://example.my.salesforce.com")
+        self.assertEqual(helper.load_cached_session("myOrg"), ("TOKEN", "https://example.my.salesforce.com"))
+
+        path = os.path.join(self.tmp.name, "sessions", "myOrg.json")
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        with open(path) as f:
+            self.assertIn("fetched_at", json.load(f))
+
+    def test_load_missing_or_corrupt(self):
+        """Missing or unreadable cache files are ignored"""
+        self.assertIsNone(helper.load_cached_session("otherOrg"))
+        os.makedirs(os.path.join(self.tmp.name, "sessions"))
+        with open(os.path.join(self.tmp.name, "sessions", "badOrg.json"), "w") as f:
+            f.write("not json")
+        self.assertIsNone(helper.load_cached_session("badOrg"))
+
+    @patch('madd_xp.copado_helper.get_sf_cli_credentials')
+    def test_connect_uses_cache_without_cli(self, mock_cli):
+        """A cached session avoids spawning the SF CLI"""
+        helper.save_cached_session("myOrg", "TOKEN", "https://example.my.salesforce.com")
+        sf, instance_url = helper.connect("myOrg")
+        self.assertFalse(mock_cli.called)
+        self.assertEqual(sf.session_id, "TOKEN")
+        self.assertEqual(instance_url, "https://example.my.salesforce.com")
+
+    @patch('madd_xp.copado_helper.get_sf_cli_credentials')
+    def test_connect_refresh_through_cli(self, mock_cli):
+        """Bypassing the cache calls the CLI, and a rejected session is refreshed once"""
+        mock_cli.return_value = ("FRESH", "https://example.my.salesforce.com")
+        sf, _ = helper.connect("myOrg", use_cache=False)
+        self.assertEqual(mock_cli.call_count, 1)
+        self.assertIsNone(helper.load_cached_session("myOrg"))
+
+        mock_cli.return_value = ("NEWER", "https://example.my.salesforce.com")
+        sf._refresh_session()
+        self.assertEqual(sf.session_id, "NEWER")
+        self.assertEqual(sf.headers["Authorization"], "Bearer NEWER")
+        with self.assertRaises(Exception):
+            sf._refresh_session()
+
+class TestTemplateExtract(unittest.TestCase):
+
+    def test_extract_template_info(self):
+        """Main object, children and parents come from one pass in document order"""
+        template = {
+            "dataTemplate": {"templateMainObject": "Account"},
+            "childrenObjectsReferenceList": [{"templateId": "C1"}],
+            "selectableFieldsMap": {
+                "ParentId": {"fieldType": "reference", "deploymentTemplateNameMap": {"P1": "Parent"}},
+                "Nested": [{"x": {"fieldType": "reference", "deploymentTemplateNameMap": {"P2": "Grand"}}}],
+            },
+        }
+        main_object, children, parents = helper.extract_template_info(template)
+        self.assertEqual(main_object, "Account")
+        self.assertEqual(children, [{"templateId": "C1"}])
+        self.assertEqual([p["templateId"] for p in parents], ["P1", "P2"])
+        self.assertEqual(helper.get_parent_relationships(template), parents)
+        self.assertEqual(helper.extract_template_info({}), (None, [], []))
+
+    def test_deep_nesting(self):
+        """Deeply nested templates do not hit the recursion limit"""
+        node = {"fieldType": "reference", "deploymentTemplateNameMap": {"P1": "Deep"}}
+        for _ in range(5000):
+            node = {"next": [node]}
+        self.assertEqual(helper.get_parent_relationships(node), [{"templateId": "P1", "templateName": "Deep"}])
+
+class TestTemplateLookups(unittest.TestCase):
+
+    def setUp(self):
+        self.org = FakeOrg.from_fixture("index_org.json")
+
+    def test_names_by_ids(self):
+        """IDs are resolved in chunked IN queries; 15-character IDs map to their 18-character record"""
+        ids = ["a0U000000000001AAA", "a0U000000000002", "a0U000000000003AAA", "a0U000000000004AAA",
+               "a0U000000000005", "a0U00000000009X", "a0U000000000001AAA"]
+        names = helper.get_template_names_by_ids(self.org, ids, chunk_size=2)
+        self.assertEqual(names, {"a0U000000000001AAA": "Root A", "a0U000000000002": "Child B", "a0U000000000003AAA": "Child C",
+                                 "a0U000000000004AAA": "Grand D", "a0U000000000005": "Root E"})
+        # 6 unique IDs, 2 per query
+        self.assertEqual(len(self.org.queries), 3)
+        self.assertTrue(all("WHERE Id IN" in q for q in self.org.queries))
+
+    def test_ids_by_names(self):
+        """Names match case-insensitively and keep the caller's spelling; unknown names are left out"""
+        ids = helper.get_template_ids_by_names(self.org, ["root a", "CHILD B", "Missing", "Root A"], chunk_size=3)
+        self.assertEqual(ids, {"root a": "a0U000000000001AAA", "CHILD B": "a0U000000000002AAA", "Root A": "a0U000000000001AAA"})
+        self.assertEqual(len(self.org.queries), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import argparse
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import find_templates
+from tests.fake_org import FakeOrg
+
+class TestFindTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.org = FakeOrg.from_fixture("index_org.json")
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_online_find_chunks_and_patterns(self):
+        """Live 'find' splits long object lists and turns '*' into LIKE"""
+        objects = [f"Obj{i}__c" for i in range(450)] + ["copado__*"]
+        args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, objects=objects, active=True,
+                                  output=os.path.join(self.tmp.name, "live.csv"), json=False, bulk=False,
+                                  offline=False, index=None, deep=False)
+        with self.org.patched(), patch("builtins.print"):
+            find_templates.run(args)
+        queries = self.org.queries
+        self.assertEqual(len(queries), 4)
+        self.assertIn("copado__Main_Object__c LIKE 'copado\\_\\_%' AND copado__Active__c = true", queries[-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import get_objects_in_template
+from tests.fake_org import FakeOrg
+
+def objects_args(output, **overrides):
+    values = dict(username="fixtureOrg", no_session_cache=False, max_api_calls=None, templates=["Root A", "root e"], recordId=None,
+                  output=output, json=False, concurrency=2, cache_dir=None, cache_max_mb=1, cache_compress=False, cache_pretty=False, no_cache=True,
+                  no_label_cache=True, label_ttl_hours=24, offline=False, index=None, ndjson=False, stream=False,
+                  sort=False, sort_buffer_rows=100000, checkpoint=None, resume=None)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+class TestGetObjects(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.org = FakeOrg.from_fixture("index_org.json")
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_streamed_objects_match_batch(self):
+        """Streamed rows hold the same rows as a batch run; --sort restores the batch order"""
+        batch_path = os.path.join(self.tmp.name, "batch.csv")
+        stream_path = os.path.join(self.tmp.name, "stream.csv")
+        sorted_path = os.path.join(self.tmp.name, "sorted.csv")
+        ndjson_path = os.path.join(self.tmp.name, "rows.ndjson")
+        with self.org.patched(), patch("builtins.print"):
+            get_objects_in_template.run(objects_args(batch_path))
+            get_objects_in_template.run(objects_args(stream_path, stream=True))
+            get_objects_in_template.run(objects_args(sorted_path, stream=True, sort=True, sort_buffer_rows=2))
+            get_objects_in_template.run(objects_args(ndjson_path, ndjson=True))
+
+        batch = read_csv(batch_path)
+        key = lambda r: (r["Input Template Name"], r["Template Id"])
+        self.assertEqual(sorted(read_csv(stream_path), key=key), sorted(batch, key=key))
+        self.assertEqual(read_csv(sorted_path), batch)
+        self.assertEqual(os.listdir(self.tmp.name).count("sorted.csv.tmp"), 0)
+
+        with open(ndjson_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), len(batch))
+        self.assertIn({"input_template": "root e", "object_label": "Support Case", "object_api": "Case",
+                       "template_name": "Child C", "template_id": "a0U000000000003AAA", "is_root": False}, rows)
+
+    def test_resume_after_interruption(self):
+        """--resume continues from the last completed level and writes the same rows"""
+        for extra in ({}, {"stream": True, "sort": True}):
+            full_path = os.path.join(self.tmp.name, "full.csv")
+            resumed_path = os.path.join(self.tmp.name, "resumed.csv")
+            checkpoint = resumed_path + ".checkpoint"
+            with self.org.patched(), patch("builtins.print"):
+                get_objects_in_template.run(objects_args(full_path, **extra))
+
+            download_attachments = get_objects_in_template.helper.download_attachments
+            levels = []
+            def drop_connection_on_level_two(*args, **kwargs):
+                levels.append(args[3])
+                if len(levels) == 2:
+                    raise KeyboardInterrupt()
+                return download_attachments(*args, **kwargs)
+
+            with self.org.patched(), patch("builtins.print"), \
+                 patch.object(get_objects_in_template.helper, "download_attachments", side_effect=drop_connection_on_level_two):
+                with self.assertRaises(KeyboardInterrupt):
+                    get_objects_in_template.run(objects_args(resumed_path, **extra))
+            self.assertTrue(os.path.exists(checkpoint))
+
+            self.org.downloads.clear()
+            with self.org.patched(), patch("builtins.print"):
+                get_objects_in_template.run(objects_args(resumed_path, templates=None, resume=checkpoint, **extra))
+            first_level = {t_id for t_id, _ in levels[0]}
+            self.assertTrue(self.org.downloads)
+            self.assertFalse(first_level & set(self.org.downloads))
+            self.assertEqual(read_csv(resumed_path), read_csv(full_path))
+            self.assertFalse(os.path.exists(checkpoint))
+
+    def test_resume_needs_one_org(self):
+        """--resume is refused for several orgs, and a missing alias is reported once"""
+        checkpoint = os.path.join(self.tmp.name, "objects.csv.checkpoint")
+        for username, message in (("dev,prod", "Error: --resume continues the run of a single org."),
+                                  (None, "Error: Provide an org alias with -u or --alias-file.")):
+            with patch("builtins.print") as printed:
+                get_objects_in_template.run(objects_args(None, username=username, alias_file=None, templates=None, resume=checkpoint))
+            self.assertEqual([c.args[0] for c in printed.call_args_list], [message])
+
+    def test_unknown_children_resolved_per_level(self):
+        """The names of a level's unknown children are looked up in one batched query"""
+        with self.org.patched(), patch("builtins.print"):
+            get_objects_in_template.run(objects_args(os.path.join(self.tmp.name, "objects.csv")))
+        name_queries = [q for q in self.org.queries if q.startswith("SELECT Id, Name FROM copado__Data_Template__c")]
+        # Roots by name, then one query for level 1 (B, C) and one for level 2 (D and an unknown Id)
+        self.assertEqual(len(name_queries), 3)
+        self.assertIn("Name IN", name_queries[0])
+        self.assertIn("'a0U000000000002AAA','a0U000000000003AAA'", name_queries[1])
+        self.assertIn("'a0U000000000004AAA','a0U00000000009X'", name_queries[2])
+
+if __name__ == '__main__':
+    unittest.main()
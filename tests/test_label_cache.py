@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from madd_xp.label_cache import LabelCache, LabelResolver, label_cache_path
+
+class FakeSalesforce:
+    """Answers describeGlobal and EntityDefinition label queries."""
+
+    def __init__(self):
+        self.describe_calls = 0
+        self.queries = []
+
+    def describe(self):
+        self.describe_calls += 1
+        return {"sobjects": [{"name": "Account", "label": "Account"}, {"name": "Contact", "label": "Contact"}]}
+
+    def query(self, q):
+        self.queries.append(q)
+        return {"records": [{"QualifiedApiName": "Hidden__c", "Label": "Hidden"}] if "'Hidden__c'" in q else []}
+
+class TestLabelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.path = label_cache_path("https://example.my.salesforce.com")
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_path_keyed_by_host(self):
+        """Each org gets its own cache file under MXP_HOME/labels"""
+        self.assertEqual(self.path, os.path.join(self.tmp.name, "labels", "example.my.salesforce.com.json"))
+
+    def test_describe_fill_and_background_lookup(self):
+        """A stale cache is filled from describeGlobal; only uncovered names hit EntityDefinition"""
+        sf = FakeSalesforce()
+        cache = LabelCache(self.path)
+        resolver = LabelResolver(sf, cache)
+        resolver.request(["Account", "Hidden__c"])
+        labels = resolver.labels(["Account", "Hidden__c", "Unknown__c"])
+        cache.save()
+
+        self.assertEqual(labels, {"Account": "Account", "Hidden__c": "Hidden"})
+        self.assertEqual(sf.describe_calls, 1)
+        self.assertEqual(len(sf.queries), 2)
+        self.assertNotIn("'Account'", "".join(sf.queries))
+
+        # A fresh cache answers from disk without any API call
+        sf = FakeSalesforce()
+        labels = LabelResolver(sf, LabelCache(self.path)).labels(["Contact", "Hidden__c"])
+        self.assertEqual(labels, {"Contact": "Contact", "Hidden__c": "Hidden"})
+        self.assertEqual((sf.describe_calls, sf.queries), (0, []))
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL trigger a describeGlobal refill"""
+        cache = LabelCache(self.path, ttl=60)
+        cache.fetched_at = time.time() - 120
+        self.assertTrue(cache.is_stale())
+        cache.fetched_at = time.time()
+        self.assertFalse(cache.is_stale())
+
+if __name__ == '__main__':
+    unittest.main()
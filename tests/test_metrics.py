@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import copado_helper as helper, metrics
+from tests.sf_stub import SalesforceStub
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.stub = SalesforceStub(lambda q: [{"Id": str(i)} for i in range(3)], page_size=2).start()
+        helper.save_cached_session("stubOrg", "TOKEN", self.stub.url)
+
+    def tearDown(self):
+        self.stub.stop()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_phases_calls_and_quiet(self):
+        """API calls, retries and cache lookups land in the phase they happen in; --quiet hides detail lines"""
+        def command(args):
+            metrics.start_phase("auth")
+            sf, _ = helper.connect("stubOrg")
+            metrics.start_phase("query")
+            self.stub.faults = [(503, [{"errorCode": "SERVER_UNAVAILABLE", "message": "busy"}])]
+            sf.query_all("SELECT Id FROM copado__Data_Template__c")
+            metrics.count_cache("templates", hits=2, misses=1)
+            helper.log_detail("Downloading template: A...")
+
+        path = os.path.join(self.tmp.name, "metrics.json")
+        args = argparse.Namespace(metrics=path, profile=os.path.join(self.tmp.name, "run.prof"), quiet=True)
+        with patch.object(helper, "RETRY_BASE_DELAY", 0), patch("builtins.print") as printed:
+            metrics.run_instrumented(command, args)
+
+        self.assertNotIn("Downloading template: A...", [c.args[0] for c in printed.call_args_list])
+        self.assertTrue(os.path.getsize(args.profile) > 0)
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual([p["name"] for p in report["phases"]], ["setup", "auth", "query"])
+        query = report["phases"][2]
+        self.assertEqual(query["api_calls"], {"query": 3})
+        self.assertEqual(query["retries"], 1)
+        self.assertGreater(query["bytes"], 0)
+        self.assertEqual(report["totals"]["cache"], {"templates": {"hits": 2, "misses": 1}})
+        self.assertFalse(metrics.quiet)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import argparse
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from madd_xp import copado_helper as helper
+from madd_xp import find_templates, multi_org
+from tests.sf_stub import SalesforceStub
+
+TEMPLATES = [{"Id": "a0U000000000001AAA", "Name": "Account Template", "copado__Main_Object__c": "Account", "copado__Active__c": True}]
+
+class TestMultiOrg(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_resolve_aliases(self):
+        """-u takes one alias, a comma list or a JSON array; --alias-file adds more"""
+        alias_file = self._write("orgs.txt", "# sandboxes\ndev2\nuat, prod\n")
+        args = argparse.Namespace(username="dev1, dev2", alias_file=alias_file)
+        self.assertEqual(multi_org.resolve_aliases(args), ["dev1", "dev2", "uat", "prod"])
+        args = argparse.Namespace(username='["dev1", "dev2"]', alias_file=None)
+        self.assertEqual(multi_org.resolve_aliases(args), ["dev1", "dev2"])
+        with patch("builtins.print"):
+            self.assertIsNone(multi_org.resolve_aliases(argparse.Namespace(username=None, alias_file=None)))
+
+    def test_merge_outputs(self):
+        """Every row gets the org; each table of a multi-table CSV report is merged separately"""
+        report = "Metric,Value\nDatasets,{}\n\nFile Type,Count\n.template,{}\n"
+        paths = [("dev", self._write("dev.csv", report.format(1, 2))), ("prod", self._write("prod.csv", report.format(3, 4)))]
+        out = os.path.join(self.dir, "merged.csv")
+        self.assertEqual(multi_org.merge_outputs(paths, out, "csv"), 4)
+        with open(out, newline="", encoding="utf-8") as f:
+            self.assertEqual(list(csv.reader(f)), [
+                ["org", "Metric", "Value"], ["dev", "Datasets", "1"], ["prod", "Datasets", "3"], [],
+                ["org", "File Type", "Count"], ["dev", ".template", "2"], ["prod", ".template", "4"]])
+
+        paths = [("dev", self._write("dev.ndjson", '{"a": 1}\n')), ("prod", self._write("prod.ndjson", '{"a": 2}\n{"a": 3}\n'))]
+        self.assertEqual(multi_org.merge_outputs(paths, out, "ndjson"), 3)
+        with open(out, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], [{"org": "dev", "a": 1}, {"org": "prod", "a": 2}, {"org": "prod", "a": 3}])
+
+        paths = [("dev", self._write("dev.json", '[{"a": 1}]')), ("prod", self._write("prod.json", "[]"))]
+        self.assertEqual(multi_org.merge_outputs(paths, out, "json"), 1)
+        with open(out, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), [{"org": "dev", "a": 1}])
+
+    def test_fan_out_isolates_failing_org(self):
+        """Each org runs in its own process; an org that cannot log in does not stop the others"""
+        stubs = [SalesforceStub(lambda q: TEMPLATES).start() for _ in range(2)]
+        try:
+            with patch.dict(os.environ, {"MXP_HOME": self.dir}):
+                helper.save_cached_session("dev", "TOKEN", stubs[0].url)
+                helper.save_cached_session("prod", "TOKEN", stubs[1].url)
+                out = os.path.join(self.dir, "found.csv")
+                args = argparse.Namespace(username="dev,broken,prod", alias_file=None, org_workers=3, no_session_cache=False,
+                                          max_api_calls=None, objects=["Account"], active=False, output=out, json=False,
+                                          bulk=False, offline=False, index=None, deep=False, metrics=None, profile=None, quiet=True)
+                # 'broken' has no cached session and no SF CLI login
+                with redirect_stdout(io.StringIO()) as printed, \
+                     patch.object(helper, "get_sf_cli_credentials", side_effect=Exception("no CLI")):
+                    find_templates.run(args)
+        finally:
+            for stub in stubs:
+                stub.stop()
+        with open(out, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(r["org"], r["template_name"]) for r in rows], [("dev", "Account Template"), ("prod", "Account Template")])
+        self.assertIn("1 of 3 org(s) failed", printed.getvalue())
+        self.assertIn("broken: no output was written", printed.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from madd_xp.template_cache import TemplateCache
+
+ATTACHMENT_V1 = {"LastModifiedDate": "2024-01-01T00:00:00.000+0000", "BodyLength": 10}
+ATTACHMENT_V2 = {"LastModifiedDate": "2024-02-01T00:00:00.000+0000", "BodyLength": 12}
+
+class TestTemplateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hit_after_save_and_reload(self):
+        """Entries survive a reload when the attachment is unchanged"""
+        cache = TemplateCache(self.cache_dir)
+        cache.put("ID1", ATTACHMENT_V1, {"dataTemplate": {"templateMainObject": "Account"}})
+        cache.save()
+
+        reloaded = TemplateCache(self.cache_dir)
+        content = reloaded.get("ID1", ATTACHMENT_V1)
+        self.assertEqual(content["dataTemplate"]["templateMainObject"], "Account")
+        self.assertEqual((reloaded.hits, reloaded.misses), (1, 0))
+
+    def test_miss_when_attachment_changed(self):
+        """A new LastModifiedDate/BodyLength invalidates the entry"""
+        cache = TemplateCache(self.cache_dir)
+        cache.put("ID1", ATTACHMENT_V1, {"a": 1})
+        self.assertIsNone(cache.get("ID1", ATTACHMENT_V2))
+        self.assertIsNone(cache.get("ID1", None))
+        self.assertIsNone(cache.get("ID2", ATTACHMENT_V1))
+        self.assertEqual(cache.misses, 3)
+
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted past the size cap"""
+        cache = TemplateCache(self.cache_dir)
+        for t_id in ("ID1", "ID2", "ID3"):
+            cache.put(t_id, ATTACHMENT_V1, {"payload": t_id * 100})
+        cache.entries["ID1"]["last_access"] = 3
+        cache.entries["ID2"]["last_access"] = 1
+        cache.entries["ID3"]["last_access"] = 2
+        cache.max_bytes = cache.entries["ID1"]["size"] * 2
+        evicted_file = os.path.join(self.cache_dir, cache.entries["ID2"]["file"])
+
+        cache.save()
+        self.assertEqual(sorted(cache.entries), ["ID1", "ID3"])
+        self.assertFalse(os.path.exists(evicted_file))
+
+    def test_streamed_bodies_are_stored_once(self):
+        """Identical downloaded bodies share one content-addressed file, kept until its last user is evicted"""
+        body = json.dumps({"dataTemplate": {"templateMainObject": "Account"}}).encode("utf-8")
+        for compress in (False, True):
+            cache = TemplateCache(os.path.join(self.cache_dir, str(compress)), compress=compress)
+            first = cache.store("ID1", ATTACHMENT_V1, [body[:10], body[10:]])
+            cache.store("ID2", ATTACHMENT_V1, [body])
+            self.assertEqual(first["dataTemplate"]["templateMainObject"], "Account")
+            self.assertEqual(cache.entries["ID1"]["file"], cache.entries["ID2"]["file"])
+            self.assertEqual(cache.entries["ID1"]["file"].endswith(".gz"), compress)
+            shared_file = os.path.join(cache.cache_dir, cache.entries["ID1"]["file"])
+            if not compress:
+                # Stored byte for byte as downloaded
+                with open(shared_file, "rb") as f:
+                    self.assertEqual(f.read(), body)
+            self.assertEqual(cache.get("ID2", ATTACHMENT_V1), first)
+
+            cache.entries["ID1"]["last_access"] = 0
+            cache.max_bytes = 0
+            cache.evict()
+            self.assertFalse(os.path.exists(shared_file))
+
+    def test_changed_body_replaces_its_file(self):
+        """Storing a changed body removes the old file unless another template still uses it"""
+        cache = TemplateCache(self.cache_dir)
+        object_files = lambda: sorted(f for _, _, files in os.walk(os.path.join(self.cache_dir, "objects")) for f in files)
+        cache.store("ID1", ATTACHMENT_V1, [b'{"v": 1}'])
+        cache.store("ID2", ATTACHMENT_V1, [b'{"v": 1}'])
+        cache.store("ID1", ATTACHMENT_V2, [b'{"v": 2}'])
+        self.assertEqual(len(object_files()), 2)
+        cache.store("ID2", ATTACHMENT_V2, [b'{"v": 2}'])
+        self.assertEqual(object_files(), [os.path.basename(cache.entries["ID1"]["file"])])
+
+    def test_parallel_stores(self):
+        """Worker threads can store, replace and read bodies at once; shared files stay referenced"""
+        cache = TemplateCache(self.cache_dir)
+        body = lambda n: json.dumps({"payload": n % 7}).encode("utf-8")
+
+        def store(n):
+            t_id = f"ID{n % 50}"
+            cache.store(t_id, ATTACHMENT_V1 if n < 100 else ATTACHMENT_V2, [body(n)])
+            cache.get(t_id, ATTACHMENT_V2)
+
+        # Two rounds: every template is stored twice per round, then changes
+        for stores in (range(100), range(100, 200)):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(store, stores))
+        cache.save()
+
+        self.assertEqual(len(cache.entries), 50)
+        on_disk = {os.path.relpath(os.path.join(root, f), self.cache_dir)
+                   for root, _, files in os.walk(os.path.join(self.cache_dir, "objects")) for f in files}
+        self.assertEqual(on_disk, {e["file"] for e in cache.entries.values()})
+        for t_id in list(cache.entries):
+            # The last of the two V2 stores of each template wins
+            self.assertIn(cache.get(t_id, ATTACHMENT_V2), [{"payload": (n + int(t_id[2:])) % 7} for n in (100, 150)])
+
+    def test_pretty_and_invalid_bodies(self):
+        """pretty stores indented JSON; an invalid body raises ValueError and is not cached"""
+        cache = TemplateCache(self.cache_dir, pretty=True)
+        cache.store("ID1", ATTACHMENT_V1, [b'{"a": [1, 2]}'])
+        with open(os.path.join(self.cache_dir, cache.entries["ID1"]["file"]), encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps({"a": [1, 2]}, indent=4))
+        with self.assertRaises(ValueError):
+            cache.store("ID2", ATTACHMENT_V1, [b'{"a": '])
+        self.assertNotIn("ID2", cache.entries)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["objects"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from madd_xp import copado_helper as helper
+from madd_xp import template_diff
+from madd_xp.template_hash_cache import content_hash
+from tests.sf_stub import SalesforceStub
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from synthetic_org import SyntheticOrg
+
+class TestTemplateDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.dir})
+        self.env.start()
+        self.orgs = {"dev": SyntheticOrg(roots=2, depth=3, fanout=2, datasets=0),
+                     "prod": SyntheticOrg(roots=2, depth=3, fanout=2, datasets=0)}
+        self.stubs = []
+        for alias, org in self.orgs.items():
+            stub = SalesforceStub(org.resolver, bodies=org.bodies).start()
+            self.stubs.append(stub)
+            helper.save_cached_session(alias, "TOKEN", stub.url)
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.stop()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def _diff(self):
+        out = os.path.join(self.dir, "diff.csv")
+        args = argparse.Namespace(username="dev", target_username="prod", templates=self.orgs["dev"].root_names,
+                                  output=out, json=False, no_session_cache=False, max_api_calls=None,
+                                  concurrency=4, no_hash_cache=False)
+        with redirect_stdout(io.StringIO()) as printed:
+            template_diff.run(args)
+        with open(out, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f)), printed.getvalue()
+
+    def test_content_hash_ignores_template_ids(self):
+        """The same Template Detail hashes alike in orgs where the templates have other Ids"""
+        detail = {"dataTemplate": {"templateMainObject": "Account"},
+                  "childrenObjectsReferenceList": [{"templateId": "a0U000000000002AAA"}]}
+        other = {"dataTemplate": {"templateMainObject": "Account"},
+                 "childrenObjectsReferenceList": [{"templateId": "a0U000000000009"}]}
+        self.assertEqual(content_hash(detail, "a0U000000000001AAA")[0], content_hash(other, "a0U000000000005AAA")[0])
+        other["dataTemplate"]["templateMainObject"] = "Contact"
+        self.assertNotEqual(content_hash(detail, "a0U000000000001AAA")[0], content_hash(other, "a0U000000000005AAA")[0])
+
+    def test_diff_reports_changes_and_reuses_hashes(self):
+        """Identical orgs match; a changed template is reported, and unchanged templates are not downloaded again"""
+        rows, printed = self._diff()
+        self.assertEqual(rows, [])
+        self.assertIn("The hierarchies match.", printed)
+        self.assertIn(f"[dev] {len(self.orgs['dev'].templates)} template(s) in hierarchy, {len(self.orgs['dev'].templates)} downloaded.", printed)
+
+        prod = self.orgs["prod"]
+        t_id = sorted(prod.templates)[-1]
+        prod.details[t_id]["dataTemplate"]["templateBatchSize"] = 50
+        stamp = prod.attachment
+        prod.attachment = lambda a_id: dict(stamp(a_id), BodyLength=999) if a_id == t_id else stamp(a_id)
+        rows, printed = self._diff()
+        self.assertEqual([(r["change"], r["type"], r["name"]) for r in rows], [("changed", "template", prod.templates[t_id]["Name"])])
+        self.assertRegex(printed, r"\[dev\] \d+ template\(s\) in hierarchy, 0 downloaded\.")
+        self.assertRegex(printed, r"\[prod\] \d+ template\(s\) in hierarchy, 1 downloaded\.")
+
+    def test_each_org_has_its_own_session(self):
+        """Both orgs run on separate API sessions, so budgets, concurrency and throttling do not mix"""
+        sessions = []
+        new_http_session = helper.new_http_session
+        def record_session(*args, **kwargs):
+            sessions.append(new_http_session(*args, **kwargs))
+            return sessions[-1]
+        shared_calls = helper.get_http_session().api_calls
+        with patch.object(helper, "new_http_session", side_effect=record_session):
+            self._diff()
+        self.assertEqual(sorted(s.org_alias for s in sessions), ["dev", "prod"])
+        self.assertTrue(all(s.api_calls > 0 and s.max_in_flight == 4 for s in sessions))
+        self.assertEqual(helper.get_http_session().api_calls, shared_calls)
+
+    def test_diff_reports_added_and_removed_templates(self):
+        """A child that is only referenced in one org shows up as added or removed, its parent as changed"""
+        prod = self.orgs["prod"]
+        root_id = next(t_id for t_id, t in prod.templates.items() if t["Name"] == prod.root_names[0])
+        children = prod.details[root_id]["childrenObjectsReferenceList"]
+        dropped = prod.templates[children.pop()["templateId"]]["Name"]
+        stamp = prod.attachment
+        prod.attachment = lambda a_id: dict(stamp(a_id), BodyLength=999) if a_id == root_id else stamp(a_id)
+        rows, printed = self._diff()
+        changes = {(r["change"], r["name"]) for r in rows if r["type"] == "template"}
+        self.assertIn(("changed", prod.root_names[0]), changes)
+        self.assertIn(("removed", dropped), changes)
+        self.assertIn(f"references removed: {dropped}", next(r["detail"] for r in rows if r["change"] == "changed"))
+
+    def test_duplicate_names_are_reported(self):
+        """Two templates with one name in a hierarchy are reported with both Ids instead of being paired"""
+        prod = self.orgs["prod"]
+        root_id = next(t_id for t_id, t in prod.templates.items() if t["Name"] == prod.root_names[0])
+        first, second = [c["templateId"] for c in prod.details[root_id]["childrenObjectsReferenceList"][:2]]
+        renamed = prod.templates[second]["Name"]
+        prod.templates[second]["Name"] = prod.templates[first]["Name"]
+        rows, printed = self._diff()
+        duplicates = [r for r in rows if r["change"] == "duplicate"]
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0]["name"], prod.templates[first]["Name"])
+        self.assertEqual(sorted(duplicates[0]["target_id"].split(";")), sorted([first, second]))
+        self.assertEqual(duplicates[0]["source_id"].count(";"), 0)
+        self.assertIn(("removed", renamed), {(r["change"], r["name"]) for r in rows})
+        self.assertNotIn(duplicates[0]["name"], {r["name"] for r in rows if r["change"] != "duplicate"})
+        self.assertIn("1 template name(s) are used by several templates", printed)
+
+if __name__ == '__main__':
+    unittest.main()
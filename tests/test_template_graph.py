@@ -0,0 +1,56 @@
+import unittest
+from madd_xp.template_graph import ReachabilityIndex, RootMembership, strongly_connected_components
+
+class TestTemplateGraph(unittest.TestCase):
+
+    def test_components_reverse_topological(self):
+        """Cycles collapse into one component listed after what it reaches"""
+        adjacency = {"A": ["B"], "B": ["C", "A"], "C": ["D"], "D": []}
+        components, component_of = strongly_connected_components(adjacency)
+        self.assertEqual(component_of["A"], component_of["B"])
+        self.assertLess(component_of["D"], component_of["C"])
+        self.assertLess(component_of["C"], component_of["A"])
+        self.assertEqual(sorted(len(c) for c in components), [1, 1, 2])
+
+    def test_reachable_with_shared_subtree_and_cycle(self):
+        """Roots sharing a sub-hierarchy get the right closures, including back references"""
+        adjacency = {
+            "R1": ["S"],
+            "R2": ["S", "X"],
+            "S": ["T", "R1"],  # child refers back to its parent
+            "T": [],
+            "X": ["MISSING"]
+        }
+        index = ReachabilityIndex(adjacency)
+        self.assertEqual(index.reachable("R1"), {"R1", "S", "T"})
+        self.assertEqual(index.reachable("R2"), {"R2", "S", "T", "R1", "X", "MISSING"})
+        self.assertIs(index.reachable("S"), index.reachable("R1"))
+        self.assertEqual(index.reachable("UNKNOWN"), {"UNKNOWN"})
+
+    def test_deep_chain_does_not_recurse(self):
+        """Long chains are handled without hitting the recursion limit"""
+        depth = 5000
+        adjacency = {i: [i + 1] for i in range(depth)}
+        self.assertEqual(len(ReachabilityIndex(adjacency).reachable(0)), depth + 1)
+
+    def test_root_membership_grows_with_edges(self):
+        """Roots reach nodes as edges are added, including through already known sub-graphs"""
+        adjacency = {"R1": [], "R2": [], "S": []}
+        membership = RootMembership(adjacency)
+        membership.add_roots("R1", ["one"])
+        membership.add_roots("R2", ["two"])
+
+        adjacency["S"].append("T")
+        self.assertEqual(membership.add_edge("S", "T"), [])
+        adjacency["R1"].append("S")
+        self.assertEqual(membership.add_edge("R1", "S"), [("S", {"one"}), ("T", {"one"})])
+        adjacency["R2"].append("S")
+        self.assertEqual(dict(membership.add_edge("R2", "S")), {"S": {"two"}, "T": {"two"}})
+        # Nothing new to report for a cycle back to a root
+        adjacency["T"] = ["R1"]
+        self.assertEqual(membership.add_edge("T", "R1"), [("R1", {"two"})])
+        self.assertEqual(membership.add_edge("T", "R1"), [])
+        self.assertEqual(membership.roots("T"), {"one", "two"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import argparse
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from madd_xp import find_templates, get_objects_in_template, get_template_dependents, index_templates
+from madd_xp.template_index import SCHEMA_VERSION, TemplateIndex
+from tests.fake_org import FakeOrg
+from tests.test_get_objects import objects_args, read_csv
+
+class TestTemplateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"MXP_HOME": self.tmp.name})
+        self.env.start()
+        self.org = FakeOrg.from_fixture("index_org.json")
+        self.index_path = os.path.join(self.tmp.name, "index", "fixtureOrg.sqlite")
+        build_args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, index=None, concurrency=2)
+        with self.org.patched(), patch("builtins.print"):
+            index_templates.run(build_args)
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_build_contents(self):
+        """Every template, its edges and labels are stored"""
+        index = TemplateIndex(self.index_path)
+        try:
+            self.assertEqual(index.count_templates(), 6)
+            names, objects, adjacency = index.load_graph()
+            self.assertNotIn("a0U000000000006AAA", objects)
+            self.assertEqual(adjacency["a0U000000000001AAA"], ["a0U000000000002AAA", "a0U000000000003AAA"])
+            # Unknown children are dropped like in a live crawl
+            self.assertEqual(adjacency["a0U000000000003AAA"], ["a0U000000000004AAA"])
+            self.assertEqual(index.get_labels(["Case", "Lead"]), {"Case": "Support Case", "Lead": "Prospect"})
+            self.assertEqual(index.get_meta("instance_url"), self.org.instance_url)
+        finally:
+            index.close()
+
+    def test_offline_objects_match_live_crawl(self):
+        """'get objects --offline' writes the same rows as a live crawl, without API calls"""
+        live_path = os.path.join(self.tmp.name, "live.csv")
+        offline_path = os.path.join(self.tmp.name, "offline.csv")
+        by_id_path = os.path.join(self.tmp.name, "by_id.csv")
+        with self.org.patched(), patch("builtins.print"):
+            get_objects_in_template.run(objects_args(live_path))
+        self.org.queries.clear()
+        with patch("builtins.print"):
+            get_objects_in_template.run(objects_args(offline_path, offline=True))
+            get_objects_in_template.run(objects_args(by_id_path, index=self.index_path, templates=None,
+                                                     recordId=["a0U000000000002"]))
+
+        self.assertEqual(read_csv(offline_path), read_csv(live_path))
+        self.assertEqual(self.org.queries, [])
+        # 15-character IDs resolve; rows are sorted by label (Account, Contact, Contact, Support Case)
+        self.assertEqual([r["Template Name"] for r in read_csv(by_id_path)], ["Root A", "Child B", "Grand D", "Child C"])
+
+    def test_refresh_matches_rebuild(self):
+        """'index refresh' only downloads changed Template Details and ends up like a rebuild"""
+        org = self.org
+        org.update_record("a0U000000000002AAA", "2024-04-01T08:00:00.000+0000", Name="Child B v2")
+        org.update_detail("a0U000000000003AAA", {"dataTemplate": {"templateMainObject": "Case"}}, "2024-04-01T09:00:00.000+0000")
+        org.update_record("a0U000000000007AAA", "2024-04-01T10:00:00.000+0000", Name="New F",
+                          copado__Main_Object__c="Task", copado__Active__c=True)
+        org.update_detail("a0U000000000007AAA", {"dataTemplate": {"templateMainObject": "Task"}}, "2024-04-01T10:00:00.000+0000")
+        org.update_detail("a0U000000000005AAA", {"dataTemplate": {"templateMainObject": "Lead"},
+                                                 "childrenObjectsReferenceList": [{"templateId": "a0U000000000007AAA"}]},
+                          "2024-04-01T11:00:00.000+0000")
+        org.labels["Task"] = "Activity"
+        org.delete("a0U000000000004AAA")
+        org.downloads.clear()
+
+        refresh_args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, index=None, concurrency=2)
+        with org.patched(), patch("builtins.print"):
+            index_templates.run_refresh(refresh_args)
+        self.assertEqual(sorted(org.downloads), ["a0U000000000003AAA", "a0U000000000005AAA", "a0U000000000007AAA"])
+        self.assertEqual(len(org.deleted_calls), 1)
+
+        rebuilt_path = os.path.join(self.tmp.name, "rebuilt.sqlite")
+        with org.patched(), patch("builtins.print"):
+            index_templates.run(argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None,
+                                                   index=rebuilt_path, concurrency=2))
+        refreshed, rebuilt = TemplateIndex(self.index_path), TemplateIndex(rebuilt_path)
+        try:
+            self.assertEqual(refreshed.load_graph(), rebuilt.load_graph())
+            self.assertEqual(refreshed.get_labels(["Task"]), {"Task": "Activity"})
+            self.assertEqual(refreshed.get_template_names_by_ids(["a0U000000000002AAA"]), {"a0U000000000002AAA": "Child B v2"})
+        finally:
+            refreshed.close()
+            rebuilt.close()
+
+    def test_refresh_retries_failed_downloads(self):
+        """A Template Detail that failed to download is fetched again by the next refresh, even behind newer changes"""
+        org = self.org
+        org.update_detail("a0U000000000003AAA", {"dataTemplate": {"templateMainObject": "Case"}}, "2024-04-01T09:00:00.000+0000")
+        org.update_detail("a0U000000000005AAA", {"dataTemplate": {"templateMainObject": "Lead"}}, "2024-04-01T11:00:00.000+0000")
+        org.failing_downloads.add("a0U000000000003AAA")
+        refresh_args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, index=None, concurrency=2)
+        with org.patched(), patch("builtins.print"):
+            index_templates.run_refresh(refresh_args)
+
+        index = TemplateIndex(self.index_path)
+        try:
+            # The last parsed references are kept until the download succeeds
+            self.assertEqual(index.get_missing_detail_ids(), ["a0U000000000003AAA"])
+            self.assertEqual(index.load_graph()[2]["a0U000000000003AAA"], ["a0U000000000004AAA"])
+        finally:
+            index.close()
+
+        org.failing_downloads.clear()
+        org.downloads.clear()
+        with org.patched(), patch("builtins.print"):
+            index_templates.run_refresh(refresh_args)
+        self.assertEqual(org.downloads, ["a0U000000000003AAA"])
+        index = TemplateIndex(self.index_path)
+        try:
+            self.assertEqual(index.get_missing_detail_ids(), [])
+            self.assertEqual(index.load_graph()[1]["a0U000000000003AAA"], "Case")
+        finally:
+            index.close()
+
+    def test_offline_find(self):
+        """'find --offline' answers from the index"""
+        output = os.path.join(self.tmp.name, "found.csv")
+        args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, objects=["Contact,Case"], active=True,
+                                  output=output, json=False, bulk=False, offline=True, index=None, deep=False)
+        with patch("builtins.print"):
+            find_templates.run(args)
+        rows = read_csv(output)
+        self.assertEqual([r["template_name"] for r in rows], ["Child B", "Grand D"])
+        self.assertEqual(rows[0]["url"], f"{self.org.instance_url}/a0U000000000002AAA")
+
+    def test_deep_find(self):
+        """'find --deep' reports every relationship kind, with wildcards"""
+        output = os.path.join(self.tmp.name, "deep.csv")
+        args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, objects=["account", "copado__*"],
+                                  active=False, output=output, json=False, bulk=False, offline=False, index=None, deep=True)
+        with patch("builtins.print"):
+            find_templates.run(args)
+        rows = [(r["object_api_name"], r["template_name"], r["relationship"]) for r in read_csv(output)]
+        self.assertEqual(rows, [
+            ("Account", "Child B", "parent"),
+            ("Account", "Child B", "reference"),
+            ("Account", "Root A", "main"),
+            ("copado__User_Story__c", "Grand D", "reference"),
+        ])
+
+        index = TemplateIndex(self.index_path)
+        try:
+            case_refs = {(r[2], r[4]) for r in index.find_deep(["Case"])}
+        finally:
+            index.close()
+        self.assertEqual(case_refs, {("Child C", "main"), ("Root A", "child"), ("Root E", "child")})
+
+    def test_dependents(self):
+        """'get template dependents' lists every template whose hierarchy reaches the input"""
+        output = os.path.join(self.tmp.name, "dependents.csv")
+        args = argparse.Namespace(username="fixtureOrg", index=None, templates=["Grand D"], recordId=["a0U000000000001"],
+                                  output=output, json=False)
+        with patch("builtins.print"):
+            get_template_dependents.run(args)
+        rows = [(r["template"], r["dependent_name"], r["top_level"]) for r in read_csv(output)]
+        self.assertEqual(rows, [
+            ("Grand D", "Root A", "True"), ("Grand D", "Root E", "True"),
+            ("Grand D", "Child B", "False"), ("Grand D", "Child C", "False"),
+            ("Root A", "Child B", "False"),
+        ])
+
+        # Repeated lookups are answered from the cached closure without loading the graph
+        with patch("builtins.print"), patch.object(TemplateIndex, "load_graph", side_effect=AssertionError("graph loaded")):
+            get_template_dependents.run(args)
+        self.assertEqual(len(read_csv(output)), 5)
+
+    def test_refresh_rebuilds_an_older_index(self):
+        """Refreshing an index with an older schema rebuilds it in full"""
+        index = TemplateIndex(self.index_path)
+        try:
+            index.set_meta("schema_version", 1)
+            index.commit()
+        finally:
+            index.close()
+        self.org.downloads.clear()
+        refresh_args = argparse.Namespace(username="fixtureOrg", no_session_cache=False, max_api_calls=None, index=None, concurrency=2)
+        with self.org.patched(), patch("builtins.print"):
+            index_templates.run_refresh(refresh_args)
+        # Every Template Detail is downloaded again, not only changed ones
+        self.assertEqual(len(self.org.downloads), 5)
+        index = TemplateIndex(self.index_path)
+        try:
+            self.assertEqual(int(index.get_meta("schema_version")), SCHEMA_VERSION)
+            self.assertEqual(index.count_templates(), 6)
+        finally:
+            index.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+from madd_xp.update_template_status import update_chunk
+
+class TestUpdateTemplateStatus(unittest.TestCase):
+
+    def test_update_chunk_reports_per_record(self):
+        """One Collections request updates the chunk and reports each record"""
+        sf = MagicMock()
+        sf.restful.return_value = [
+            {"id": "ID1", "success": True, "errors": []},
+            {"success": False, "errors": [{"statusCode": "ENTITY_IS_DELETED", "message": "entity is deleted"}]}
+        ]
+
+        outcomes = update_chunk(sf, ["ID1", "ID2"], False, True)
+
+        self.assertEqual(outcomes, [("ID1", None), ("ID2", "ENTITY_IS_DELETED: entity is deleted")])
+        path = sf.restful.call_args[0][0]
+        kwargs = sf.restful.call_args[1]
+        payload = json.loads(kwargs["data"])
+        self.assertEqual(path, "composite/sobjects")
+        self.assertEqual(kwargs["method"], "PATCH")
+        self.assertTrue(payload["allOrNone"])
+        self.assertEqual([r["id"] for r in payload["records"]], ["ID1", "ID2"])
+        self.assertFalse(payload["records"][0]["copado__Active__c"])
+
+    def test_update_chunk_request_failure(self):
+        """A failed request marks every record of the chunk as failed"""
+        sf = MagicMock()
+        sf.restful.side_effect = Exception("REQUEST_LIMIT_EXCEEDED")
+        outcomes = update_chunk(sf, ["ID1", "ID2"], True, False)
+        self.assertEqual(outcomes, [("ID1", "REQUEST_LIMIT_EXCEEDED"), ("ID2", "REQUEST_LIMIT_EXCEEDED")])
+
+if __name__ == '__main__':
+    unittest.main()